@@ -29,17 +29,19 @@ load_dotenv('.env.development')
 # 这里导入所有的模型
 from app.system.models import User
 from app.llm.models import Conversation, Message, MessageItem, LLMModel
+from app.flow.models import Flow, FlowRun, FlowNodeCache
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
-# 设置 SQLAlchemy URL
-config.set_main_option("sqlalchemy.url", settings.SQLITE_URL)
+# 设置 SQLAlchemy URL（迁移使用同步驱动）
+config.set_main_option("sqlalchemy.url", settings.SQLITE_URL.replace('sqlite+aiosqlite://', 'sqlite://'))
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+# 由应用调用时（run_migrations）保留应用自身的日志配置
+if config.config_file_name is not None and config.attributes.get('configure_logger', True):
     fileConfig(config.config_file_name)
 
 # 获取数据库路径
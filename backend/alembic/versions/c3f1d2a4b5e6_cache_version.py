@@ -0,0 +1,30 @@
+"""cache version table for cross-process invalidation
+
+Revision ID: c3f1d2a4b5e6
+Revises: a9613c3377d5
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f1d2a4b5e6'
+down_revision: Union[str, None] = 'a9613c3377d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('cache_version',
+    sa.Column('topic', sa.String(length=100), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('topic')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('cache_version')
@@ -0,0 +1,76 @@
+"""flow, flow run and node output cache tables
+
+Revision ID: d4e2a7b9c1f3
+Revises: c3f1d2a4b5e6
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e2a7b9c1f3'
+down_revision: Union[str, None] = 'c3f1d2a4b5e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _base_columns() -> list:
+    return [
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('is_deleted', sa.Boolean(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    ]
+
+
+def _base_indexes(table: str) -> None:
+    op.create_index(op.f(f'ix_{table}_created_at'), table, ['created_at'], unique=False)
+    op.create_index(op.f(f'ix_{table}_is_deleted'), table, ['is_deleted'], unique=False)
+
+
+def upgrade() -> None:
+    op.create_table('flow',
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('definition', sa.JSON(), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    *_base_columns()
+    )
+    _base_indexes('flow')
+    op.create_index(op.f('ix_flow_user_id'), 'flow', ['user_id'], unique=False)
+
+    op.create_table('flow_run',
+    sa.Column('flow_id', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.String(length=36), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('inputs', sa.JSON(), nullable=False),
+    sa.Column('outputs', sa.JSON(), nullable=False),
+    sa.Column('nodes', sa.JSON(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    *_base_columns()
+    )
+    _base_indexes('flow_run')
+    op.create_index(op.f('ix_flow_run_flow_id'), 'flow_run', ['flow_id'], unique=False)
+    op.create_index(op.f('ix_flow_run_user_id'), 'flow_run', ['user_id'], unique=False)
+
+    op.create_table('flow_node_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('node_type', sa.String(length=20), nullable=False),
+    sa.Column('output', sa.Text(), nullable=False),
+    *_base_columns()
+    )
+    _base_indexes('flow_node_cache')
+    op.create_index(op.f('ix_flow_node_cache_key'), 'flow_node_cache', ['key'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_table('flow_node_cache')
+    op.drop_table('flow_run')
+    op.drop_table('flow')
@@ -0,0 +1,3 @@
+from .flow import Flow, FlowRun, FlowNodeCache
+
+__all__ = ['Flow', 'FlowRun', 'FlowNodeCache']
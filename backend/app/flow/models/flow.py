@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Text, JSON, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.base_model import Base
+
+class Flow(Base):
+    """流程定义：节点和边组成的有向无环图"""
+    __tablename__ = "flow"
+
+    name: Mapped[str] = mapped_column(String(200))
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # {"inputs": [...], "nodes": [...], "edges": [...], "outputs": [...]}，格式见 schemas/flow.py
+    definition: Mapped[dict] = mapped_column(JSON)
+    user_id: Mapped[str] = mapped_column(String(36), index=True)
+
+class FlowRun(Base):
+    """一次流程执行"""
+    __tablename__ = "flow_run"
+
+    flow_id: Mapped[str] = mapped_column(String(36), index=True)
+    user_id: Mapped[str] = mapped_column(String(36), index=True)
+    status: Mapped[str] = mapped_column(String(20), default="running")  # running, completed, failed, cancelled
+    inputs: Mapped[dict] = mapped_column(JSON, default=lambda: {})
+    outputs: Mapped[dict] = mapped_column(JSON, default=lambda: {})
+    # 各节点的状态、输出、是否命中缓存和耗时：{node_id: {"status", "output", "cached", "duration", "error"}}
+    nodes: Mapped[dict] = mapped_column(JSON, default=lambda: {})
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class FlowNodeCache(Base):
+    """节点输出缓存，key 由节点配置和输入计算"""
+    __tablename__ = "flow_node_cache"
+
+    key: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    node_type: Mapped[str] = mapped_column(String(20))
+    output: Mapped[str] = mapped_column(Text)
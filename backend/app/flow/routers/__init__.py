@@ -0,0 +1,5 @@
+from .flow import router as flow_router
+
+__all__ = [
+    'flow_router'
+]
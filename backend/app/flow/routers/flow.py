@@ -0,0 +1,126 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.database import get_db, get_session_factory
+from core.query_debug import query_budget
+from app.llm.services.sse import sse_headers
+from ..schemas import FlowCreate, FlowResponse, FlowRunCreate, FlowRunResponse, FlowUpdate
+from ..services import FlowService, flow_runner
+from ..services.engine import FlowRunJob, start_run, stream_run
+
+router = APIRouter(prefix="/flows", tags=["流程"])
+
+def _get_job(run_id: str) -> FlowRunJob:
+    job = flow_runner.get(run_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="执行不存在或已过期，请读取执行记录")
+    return job
+
+def _run_response(run, job: Optional[FlowRunJob]) -> FlowRunResponse:
+    """执行记录；进行中的执行用内存中的实时状态"""
+    response = FlowRunResponse.model_validate(run)
+    if job is not None and not job.finished:
+        response = response.model_copy(update={"nodes": job.nodes, "outputs": job.outputs()})
+    return response
+
+# 执行记录相关路由（放在 /{flow_id} 之前）
+@router.get("/runs/{run_id}", response_model=FlowRunResponse)
+@query_budget(1)
+async def get_run(run_id: str, db: AsyncSession = Depends(get_db)):
+    """获取执行记录"""
+    run = await FlowService(db).get_run(run_id)
+    return _run_response(run, flow_runner.get(run_id))
+
+@router.get("/runs/{run_id}/events")
+@query_budget(0)
+async def stream_run_events(run_id: str, last_event_id: Optional[str] = Header(None)):
+    """重新连接进行中（或刚结束）的执行，带 `Last-Event-ID` 时只发送之后的事件"""
+    job = _get_job(run_id)
+    try:
+        last_event_id = int(last_event_id or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Last-Event-ID 无效")
+    return StreamingResponse(
+        stream_run(job, last_event_id),
+        media_type="text/event-stream",
+        headers=sse_headers(False)
+    )
+
+@router.post("/runs/{run_id}/cancel", response_model=FlowRunResponse)
+@query_budget(1)
+async def cancel_run(run_id: str, db: AsyncSession = Depends(get_db)):
+    """取消执行：运行中的节点停止，已完成的节点结果照常保存"""
+    job = await flow_runner.cancel(run_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="执行不存在或已过期")
+    return await FlowService(db).get_run(run_id)
+
+# 流程相关路由
+@router.post("", response_model=FlowResponse)
+@query_budget(2)
+async def create_flow(data: FlowCreate, db: AsyncSession = Depends(get_db)):
+    """创建流程（节点、边和模板格式见 schemas/flow.py）"""
+    return await FlowService(db).create_flow(data)
+
+@router.get("/user/{user_id}", response_model=List[FlowResponse])
+@query_budget(1)
+async def list_user_flows(
+    user_id: str,
+    skip: int = 0,
+    limit: int = 10,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取用户的流程列表"""
+    return await FlowService(db).list_user_flows(user_id, skip, limit)
+
+@router.get("/{flow_id}", response_model=FlowResponse)
+@query_budget(1)
+async def get_flow(flow_id: str, db: AsyncSession = Depends(get_db)):
+    """获取流程"""
+    return await FlowService(db).get_flow(flow_id)
+
+@router.patch("/{flow_id}", response_model=FlowResponse)
+@query_budget(3)
+async def update_flow(flow_id: str, data: FlowUpdate, db: AsyncSession = Depends(get_db)):
+    """更新流程"""
+    return await FlowService(db).update_flow(flow_id, data)
+
+@router.delete("/{flow_id}")
+@query_budget(2)
+async def delete_flow(flow_id: str, db: AsyncSession = Depends(get_db)):
+    """删除流程"""
+    await FlowService(db).delete_flow(flow_id)
+    return {"message": "流程已删除"}
+
+@router.post("/{flow_id}/runs")
+@query_budget(3)  # 读取流程、模型配置（缓存未命中时）和写入执行记录，后台执行中的语句不计入
+async def run_flow(
+    flow_id: str,
+    data: FlowRunCreate,
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
+):
+    """执行流程，以 SSE 返回节点进度（事件格式见 services/engine.py）
+
+    执行在后台进行，客户端断开不影响执行，可通过 `GET /flows/runs/{run_id}/events` 重新连接。
+    """
+    job = await start_run(db, session_factory, flow_id, data)
+    return StreamingResponse(
+        stream_run(job),
+        media_type="text/event-stream",
+        headers={**sse_headers(False), "X-Flow-Run-ID": job.id}
+    )
+
+@router.get("/{flow_id}/runs", response_model=List[FlowRunResponse])
+@query_budget(1)
+async def list_runs(
+    flow_id: str,
+    skip: int = 0,
+    limit: int = 10,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取流程的执行记录，最近的在前"""
+    runs = await FlowService(db).list_runs(flow_id, skip, limit)
+    return [_run_response(run, flow_runner.get(run.id)) for run in runs]
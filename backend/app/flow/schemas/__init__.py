@@ -0,0 +1,21 @@
+from .flow import (
+    FlowNode,
+    FlowEdge,
+    FlowDefinition,
+    FlowCreate,
+    FlowUpdate,
+    FlowResponse,
+    FlowRunCreate,
+    FlowRunResponse,
+)
+
+__all__ = [
+    'FlowNode',
+    'FlowEdge',
+    'FlowDefinition',
+    'FlowCreate',
+    'FlowUpdate',
+    'FlowResponse',
+    'FlowRunCreate',
+    'FlowRunResponse',
+]
@@ -0,0 +1,77 @@
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field
+
+class FlowNode(BaseModel):
+    """流程节点
+
+    - llm：用 model_id 指定的模型回答 prompt（可选 system_prompt）
+    - template：渲染 template
+    - tool：调用工具 tool（工具名见 app/llm/services/tools.py），arguments 中的字符串值按模板渲染
+    模板中用 `{{name}}` 引用流程输入或上游节点（须有边相连）的输出。
+    """
+    id: str = Field(min_length=1, max_length=64)
+    type: Literal["llm", "template", "tool"]
+    model_id: Optional[str] = None
+    prompt: Optional[str] = None
+    system_prompt: Optional[str] = None
+    template: Optional[str] = None
+    tool: Optional[str] = None
+    arguments: Dict[str, Any] = {}
+    cache: bool = True  # 是否复用相同输入的历史输出（llm 和 tool 节点）
+
+class FlowEdge(BaseModel):
+    """数据依赖：target 在 source 完成后执行，并可引用 source 的输出"""
+    source: str
+    target: str
+
+class FlowDefinition(BaseModel):
+    inputs: List[str] = []  # 执行时需要提供的输入名
+    nodes: List[FlowNode] = Field(min_length=1)
+    edges: List[FlowEdge] = []
+    outputs: List[str] = []  # 作为执行结果的节点，默认为没有下游的节点
+
+class FlowCreate(BaseModel):
+    """创建流程的请求模型"""
+    name: str
+    description: Optional[str] = None
+    user_id: str
+    definition: FlowDefinition
+
+class FlowUpdate(BaseModel):
+    """更新流程的请求模型"""
+    name: Optional[str] = None
+    description: Optional[str] = None
+    definition: Optional[FlowDefinition] = None
+
+class FlowResponse(BaseModel):
+    """流程的响应模型"""
+    id: str
+    name: str
+    description: Optional[str]
+    user_id: str
+    definition: FlowDefinition
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class FlowRunCreate(BaseModel):
+    """执行流程的请求模型"""
+    inputs: Dict[str, str] = {}
+    use_cache: bool = True  # False 时所有节点重新计算（结果仍写入缓存）
+
+class FlowRunResponse(BaseModel):
+    """流程执行记录的响应模型"""
+    id: str
+    flow_id: str
+    user_id: str
+    status: str
+    inputs: Dict[str, Any]
+    outputs: Dict[str, Any]
+    nodes: Dict[str, Any]
+    error: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,7 @@
+from .engine import FlowRunner, flow_runner
+from .flow_service import FlowService
+__all__ = [
+    'FlowRunner',
+    'FlowService',
+    'flow_runner'
+]
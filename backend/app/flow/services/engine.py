@@ -0,0 +1,431 @@
+"""流程执行
+
+FlowRunner 在事件循环上按依赖关系调度节点：所有前驱完成的节点立即启动，互不依赖的分支
+并发执行（同一次执行最多 FLOW_MAX_CONCURRENCY 个节点），某个节点失败时其下游节点跳过，
+其余分支照常执行完。
+
+llm 和 tool 节点的输出按 cache_key（节点配置 + 实际引用到的输入值）缓存在 flow_node_cache
+表中，输入不变的节点再次执行时直接复用，只有受改动影响的节点重新计算；template 节点渲染
+比读缓存还快，不缓存。llm 节点的 key 还包含所用模型影响输出的配置（模型名、地址、温度等），
+修改模型后不会命中旧结果。节点设置 `cache: false` 时
+不读也不写缓存（适用于 current_time 这类结果随时间变化的工具）；执行时 `use_cache: false`
+强制重新计算，结果仍写入缓存。缓存超过 FLOW_NODE_CACHE_TTL_SECONDS 不再使用，写入时定期删除
+过期条目及超出 FLOW_NODE_CACHE_MAX_ENTRIES 的最早条目。
+
+执行进度以事件序列发送（SSE，事件 ID 从 1 递增，可凭 Last-Event-ID 续传）：
+- `{"type": "run_started", "run_id", "flow_id"}`
+- `{"type": "node_started", "node_id"}`
+- `{"type": "node_completed", "node_id", "output", "cached", "duration"}`
+- `{"type": "node_failed", "node_id", "error", "duration"}`
+- `{"type": "node_skipped", "node_id"}` 上游失败或执行被取消
+- `{"type": "run_finished", "status", "outputs", "error"}` 最后一个事件，此时结果已保存
+执行结束后结果保存到 flow_run 表，事件在本进程内保留 FLOW_RUN_RETENTION_SECONDS 秒。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import settings
+from core.query_debug import detached_context
+from core.serialization import dumps
+from core.timing import timed_stream
+from app.llm.services.llm_service import create_chat_completion
+from app.llm.services.model_registry import ModelConfig, model_registry
+from app.llm.services.sse import sse_event
+from app.llm.services.tools import ToolCall, tool_registry
+from ..models import FlowNodeCache, FlowRun
+from ..schemas.flow import FlowDefinition, FlowNode, FlowRunCreate
+from .flow_service import FlowService
+from .graph import FlowGraph, references, render, render_value
+
+logger = logging.getLogger(__name__)
+
+class RunStatus(str, Enum):
+    """执行状态"""
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class NodeStatus(str, Enum):
+    """节点状态"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+# 输出写入缓存的节点类型
+CACHED_TYPES = ("llm", "tool")
+# 计入 llm 节点缓存 key 的模型配置字段（影响输出的部分，不含 API 密钥等）
+MODEL_CACHE_FIELDS = ("type", "model_name", "base_url", "default_temperature", "default_max_tokens")
+# 两次清理缓存的最短间隔（秒）
+CACHE_PURGE_INTERVAL = 60
+
+class NodeError(Exception):
+    """节点执行失败，消息直接作为节点的 error"""
+
+def cache_key(node: FlowNode, values: Dict[str, str], model_config: Optional[ModelConfig] = None) -> str:
+    """节点配置（不含 id 和 cache）、所用模型的配置与引用的输入值的哈希，相同配置的节点在不同流程间共用缓存"""
+    payload = {
+        "node": node.model_dump(exclude={"id", "cache"}),
+        "inputs": {name: values[name] for name in sorted(references(node))},
+    }
+    if model_config is not None:
+        payload["model"] = {name: getattr(model_config, name) for name in MODEL_CACHE_FIELDS}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def purge_cache_statement(now: datetime):
+    """删除过期的缓存条目，以及超出条数上限的最早条目"""
+    expired = now - timedelta(seconds=settings.FLOW_NODE_CACHE_TTL_SECONDS)
+    newest = (
+        select(FlowNodeCache.id)
+        .order_by(FlowNodeCache.updated_at.desc())
+        .limit(settings.FLOW_NODE_CACHE_MAX_ENTRIES)
+    )
+    return delete(FlowNodeCache).where(or_(FlowNodeCache.updated_at < expired, FlowNodeCache.id.not_in(newest)))
+
+def _error_text(e: Exception) -> str:
+    if isinstance(e, NodeError):
+        return str(e)
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    return f"{type(e).__name__}: {e}"
+
+class FlowRunJob:
+    """一次执行：各节点状态和事件序列"""
+
+    def __init__(
+        self,
+        id: str,
+        flow_id: str,
+        graph: FlowGraph,
+        inputs: Dict[str, str],
+        models: Optional[Dict[str, ModelConfig]] = None,
+        use_cache: bool = True
+    ):
+        self.id = id
+        self.flow_id = flow_id
+        self.graph = graph
+        self.inputs = inputs
+        self.models = models or {}
+        self.use_cache = use_cache
+        self.status = RunStatus.RUNNING
+        self.error: Optional[str] = None
+        self.nodes: Dict[str, dict] = {
+            node_id: {"status": NodeStatus.PENDING.value, "output": None, "cached": False, "duration": None, "error": None}
+            for node_id in graph.order
+        }
+        self.events: List[dict] = []
+        self.task: Optional[asyncio.Task] = None
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+        self._emit({"type": "run_started", "run_id": id, "flow_id": flow_id})
+
+    @property
+    def finished(self) -> bool:
+        return self.status != RunStatus.RUNNING
+
+    def outputs(self) -> Dict[str, str]:
+        """输出节点中已完成的结果"""
+        return {
+            node_id: self.nodes[node_id]["output"]
+            for node_id in self.graph.outputs
+            if self.nodes[node_id]["status"] == NodeStatus.COMPLETED.value
+        }
+
+    async def wait(self) -> None:
+        """等待执行结束（包括保存结果）"""
+        if self.task is not None:
+            await asyncio.wait({self.task})
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncIterator[Tuple[int, dict]]:
+        """读取事件 ID 大于 last_event_id 的事件，执行结束且读完后停止"""
+        position = last_event_id
+        while True:
+            changed = self._changed
+            while position < len(self.events):
+                position += 1
+                yield position, self.events[position - 1]
+            if self.finished:
+                return
+            await changed.wait()
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        # 执行在开始前就被取消时 _run 不会运行，这里补上结束状态
+        if not self.finished:
+            self._finish(RunStatus.CANCELLED)
+
+    def _emit(self, event: dict) -> None:
+        self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _update(self, node_id: str, status: NodeStatus, **fields) -> None:
+        self.nodes[node_id].update(status=status.value, **fields)
+
+    def _node_started(self, node_id: str) -> None:
+        self._update(node_id, NodeStatus.RUNNING)
+        self._emit({"type": "node_started", "node_id": node_id})
+
+    def _node_completed(self, node_id: str, output: str, cached: bool, duration: float) -> None:
+        duration = round(duration, 4)
+        self._update(node_id, NodeStatus.COMPLETED, output=output, cached=cached, duration=duration)
+        self._emit({"type": "node_completed", "node_id": node_id, "output": output, "cached": cached, "duration": duration})
+
+    def _node_failed(self, node_id: str, error: str, duration: float) -> None:
+        duration = round(duration, 4)
+        self._update(node_id, NodeStatus.FAILED, error=error, duration=duration)
+        self._emit({"type": "node_failed", "node_id": node_id, "error": error, "duration": duration})
+
+    def _node_skipped(self, node_id: str) -> None:
+        self._update(node_id, NodeStatus.SKIPPED)
+        self._emit({"type": "node_skipped", "node_id": node_id})
+
+    def _finish(self, status: RunStatus) -> None:
+        self.status = status
+        self.finished_at = time.monotonic()
+        self._emit({"type": "run_finished", "status": status.value, "outputs": self.outputs(), "error": self.error})
+
+class FlowRunner:
+    """在后台执行流程"""
+
+    def __init__(self, concurrency: Optional[int] = None, retention: Optional[float] = None):
+        self.concurrency = concurrency or settings.FLOW_MAX_CONCURRENCY
+        self.retention = settings.FLOW_RUN_RETENTION_SECONDS if retention is None else retention
+        self._jobs: Dict[str, FlowRunJob] = {}
+        # 上次清理节点缓存的时间，首次写入时清理
+        self._last_purge = float("-inf")
+
+    def get(self, run_id: str) -> Optional[FlowRunJob]:
+        self._evict()
+        return self._jobs.get(run_id)
+
+    def start(self, job: FlowRunJob, session_factory: async_sessionmaker) -> FlowRunJob:
+        self._evict()
+        self._jobs[job.id] = job
+        # 执行可能持续很久，其中的缓存读写和结果保存不计入发起请求的 SQL 预算
+        job.task = asyncio.create_task(
+            self._run(job, session_factory), name=f"flow-run-{job.id}", context=detached_context()
+        )
+        job.task.add_done_callback(job._on_task_done)
+        return job
+
+    async def cancel(self, run_id: str) -> Optional[FlowRunJob]:
+        """取消执行并等待结果保存完成，执行不存在时返回 None"""
+        job = self.get(run_id)
+        if job is None:
+            return None
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+            await job.wait()
+        return job
+
+    async def shutdown(self) -> None:
+        """取消运行中的执行，已完成的节点结果照常保存"""
+        tasks = [job.task for job in self._jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _evict(self) -> None:
+        deadline = time.monotonic() - self.retention
+        for job in list(self._jobs.values()):
+            if job.finished_at is not None and job.finished_at < deadline:
+                del self._jobs[job.id]
+
+    async def _run(self, job: FlowRunJob, session_factory: async_sessionmaker) -> None:
+        graph = job.graph
+        values: Dict[str, str] = dict(job.inputs)
+        remaining = {node_id: len(graph.predecessors[node_id]) for node_id in graph.order}
+        ready: Deque[str] = deque(node_id for node_id in graph.order if remaining[node_id] == 0)
+        running: Dict[asyncio.Task, str] = {}
+        status = RunStatus.COMPLETED
+        try:
+            while ready or running:
+                while ready and len(running) < self.concurrency:
+                    node = graph.nodes[ready.popleft()]
+                    task = asyncio.create_task(self._run_node(job, node, values, session_factory))
+                    running[task] = node.id
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node_id = running.pop(task)
+                    if task.result():
+                        for successor in sorted(graph.successors[node_id]):
+                            remaining[successor] -= 1
+                            if remaining[successor] == 0:
+                                ready.append(successor)
+                        continue
+                    # 失败节点的下游不再执行，其他分支继续
+                    status = RunStatus.FAILED
+                    job.error = job.error or f"节点 {node_id} 执行失败"
+                    descendants = graph.descendants(node_id)
+                    for descendant in graph.order:
+                        if descendant in descendants and job.nodes[descendant]["status"] == NodeStatus.PENDING.value:
+                            job._node_skipped(descendant)
+        except asyncio.CancelledError:
+            status = RunStatus.CANCELLED
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            for node_id in graph.order:
+                if job.nodes[node_id]["status"] in (NodeStatus.PENDING.value, NodeStatus.RUNNING.value):
+                    job._node_skipped(node_id)
+
+        try:
+            await self._persist(job, status, session_factory)
+        except Exception:
+            logger.exception("保存流程执行结果失败: %s", job.id)
+        job._finish(status)
+
+    async def _run_node(
+        self,
+        job: FlowRunJob,
+        node: FlowNode,
+        values: Dict[str, str],
+        session_factory: async_sessionmaker
+    ) -> bool:
+        """执行一个节点，成功时把输出写入 values 并返回 True"""
+        scope = {name: values[name] for name in references(node)}
+        key = None
+        if node.cache and node.type in CACHED_TYPES:
+            key = cache_key(node, scope, job.models.get(node.model_id) if node.type == "llm" else None)
+        job._node_started(node.id)
+        start = time.perf_counter()
+        try:
+            output = None
+            if key and job.use_cache:
+                output = await self._load_cached(key, session_factory)
+            cached = output is not None
+            if not cached:
+                output = await self._execute(job, node, scope)
+                if key:
+                    await self._store_cached(key, node.type, output, session_factory)
+        except Exception as e:
+            logger.info("流程 %s 节点 %s 执行失败: %r", job.flow_id, node.id, e)
+            job._node_failed(node.id, _error_text(e), time.perf_counter() - start)
+            return False
+        values[node.id] = output
+        job._node_completed(node.id, output, cached, time.perf_counter() - start)
+        return True
+
+    async def _execute(self, job: FlowRunJob, node: FlowNode, scope: Dict[str, str]) -> str:
+        if node.type == "template":
+            return render(node.template, scope)
+
+        if node.type == "tool":
+            arguments = render_value(node.arguments, scope)
+            result = await tool_registry.execute(ToolCall(node.id, node.tool, json.dumps(arguments, ensure_ascii=False)))
+            if result.error is not None:
+                raise NodeError(result.error)
+            return result.content
+
+        model_config = job.models.get(node.model_id)
+        if model_config is None:
+            raise NodeError(f"模型不存在: {node.model_id}")
+        messages = []
+        if node.system_prompt:
+            messages.append({"role": "system", "content": render(node.system_prompt, scope)})
+        messages.append({"role": "user", "content": render(node.prompt, scope)})
+        parts: List[str] = []
+        async for chunk in timed_stream(create_chat_completion(
+            messages=messages,
+            model_config=model_config,
+            stream=True
+        ), model=model_config.model_name):
+            if chunk.get("type") == "message":
+                parts.append(chunk.get("content", ""))
+        return "".join(parts)
+
+    async def _load_cached(self, key: str, session_factory: async_sessionmaker) -> Optional[str]:
+        expired = datetime.utcnow() - timedelta(seconds=settings.FLOW_NODE_CACHE_TTL_SECONDS)
+        async with session_factory() as session:
+            result = await session.execute(
+                select(FlowNodeCache.output)
+                .filter(FlowNodeCache.key == key, FlowNodeCache.updated_at >= expired)
+            )
+            return result.scalar_one_or_none()
+
+    async def _store_cached(self, key: str, node_type: str, output: str, session_factory: async_sessionmaker) -> None:
+        now = datetime.utcnow()
+        stmt = insert(FlowNodeCache).values(
+            id=str(uuid.uuid4()), key=key, node_type=node_type, output=output,
+            created_at=now, updated_at=now, is_deleted=False
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FlowNodeCache.key],
+            set_={"output": output, "updated_at": now}
+        )
+        async with session_factory() as session:
+            await session.execute(stmt)
+            if time.monotonic() - self._last_purge >= CACHE_PURGE_INTERVAL:
+                self._last_purge = time.monotonic()
+                await session.execute(purge_cache_statement(now))
+            await session.commit()
+
+    async def _persist(self, job: FlowRunJob, status: RunStatus, session_factory: async_sessionmaker) -> None:
+        async with session_factory() as session:
+            await session.execute(
+                update(FlowRun)
+                .where(FlowRun.id == job.id)
+                .values(
+                    status=status.value,
+                    outputs=job.outputs(),
+                    nodes=job.nodes,
+                    error=job.error,
+                    finished_at=datetime.utcnow()
+                )
+            )
+            await session.commit()
+
+flow_runner = FlowRunner()
+
+async def start_run(
+    db: AsyncSession,
+    session_factory: async_sessionmaker,
+    flow_id: str,
+    data: FlowRunCreate,
+    runner: Optional[FlowRunner] = None
+) -> FlowRunJob:
+    """创建执行记录并在后台启动执行
+
+    流程不存在时抛出 404，缺少输入或模型不存在时抛出 400；返回前关闭 db。
+    """
+    flow = await FlowService(db).get_flow(flow_id)
+    graph = FlowGraph(FlowDefinition.model_validate(flow.definition))
+    missing = [name for name in graph.inputs if name not in data.inputs]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"缺少输入: {', '.join(missing)}")
+    models: Dict[str, ModelConfig] = {}
+    for model_id in graph.model_ids():
+        model_config = await model_registry.get(db, model_id)
+        if model_config is None:
+            raise HTTPException(status_code=400, detail=f"模型不存在: {model_id}")
+        models[model_id] = model_config
+
+    inputs = {name: data.inputs[name] for name in graph.inputs}
+    job_nodes = {node_id: {"status": NodeStatus.PENDING.value} for node_id in graph.order}
+    run = FlowRun(flow_id=flow.id, user_id=flow.user_id, status=RunStatus.RUNNING.value, inputs=inputs, nodes=job_nodes)
+    db.add(run)
+    await db.commit()
+    await db.close()
+
+    job = FlowRunJob(run.id, flow.id, graph, inputs, models, use_cache=data.use_cache)
+    return (runner or flow_runner).start(job, session_factory)
+
+async def stream_run(job: FlowRunJob, last_event_id: int = 0) -> AsyncIterator[bytes]:
+    """把执行事件编码为 SSE 帧；客户端断开只结束订阅，不影响执行"""
+    async for event_id, event in job.subscribe(last_event_id):
+        yield sse_event(dumps(event), id=event_id)
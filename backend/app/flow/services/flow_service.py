@@ -0,0 +1,99 @@
+from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException
+
+from app.llm.services.model_registry import model_registry
+from app.llm.services.tools import tool_registry
+from ..models import Flow, FlowRun
+from ..schemas.flow import FlowCreate, FlowDefinition, FlowUpdate
+from .graph import FlowDefinitionError, FlowGraph
+
+class FlowService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def validate_definition(self, definition: FlowDefinition) -> FlowGraph:
+        """校验流程图及其引用的模型和工具，无效时抛出 400"""
+        try:
+            graph = FlowGraph(definition)
+        except FlowDefinitionError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        unknown_tools = graph.tool_names() - set(tool_registry.names)
+        if unknown_tools:
+            raise HTTPException(status_code=400, detail=f"工具不存在: {', '.join(sorted(unknown_tools))}")
+        for model_id in graph.model_ids():
+            if await model_registry.get(self.db, model_id) is None:
+                raise HTTPException(status_code=400, detail=f"模型不存在: {model_id}")
+        return graph
+
+    async def create_flow(self, data: FlowCreate) -> Flow:
+        """创建流程"""
+        await self.validate_definition(data.definition)
+        flow = Flow(
+            name=data.name,
+            description=data.description,
+            user_id=data.user_id,
+            definition=data.definition.model_dump()
+        )
+        self.db.add(flow)
+        await self.db.commit()
+        return flow
+
+    async def get_flow(self, flow_id: str) -> Flow:
+        """获取流程"""
+        result = await self.db.execute(
+            select(Flow).filter(Flow.id == flow_id, Flow.is_deleted == False)
+        )
+        flow = result.scalar_one_or_none()
+        if not flow:
+            raise HTTPException(status_code=404, detail="流程不存在")
+        return flow
+
+    async def list_user_flows(self, user_id: str, skip: int = 0, limit: int = 10) -> List[Flow]:
+        """获取用户的流程列表"""
+        result = await self.db.execute(
+            select(Flow)
+            .filter(Flow.user_id == user_id, Flow.is_deleted == False)
+            .order_by(Flow.updated_at.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    async def update_flow(self, flow_id: str, data: FlowUpdate) -> Flow:
+        """更新流程"""
+        flow = await self.get_flow(flow_id)
+        if data.definition is not None:
+            await self.validate_definition(data.definition)
+            flow.definition = data.definition.model_dump()
+        for key in ("name", "description"):
+            value = getattr(data, key)
+            if value is not None:
+                setattr(flow, key, value)
+        await self.db.commit()
+        return flow
+
+    async def delete_flow(self, flow_id: str) -> None:
+        """删除流程（软删除），执行记录保留"""
+        flow = await self.get_flow(flow_id)
+        flow.soft_delete()
+        await self.db.commit()
+
+    async def get_run(self, run_id: str) -> FlowRun:
+        """获取执行记录"""
+        run = await self.db.get(FlowRun, run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="执行记录不存在")
+        return run
+
+    async def list_runs(self, flow_id: str, skip: int = 0, limit: int = 10) -> List[FlowRun]:
+        """获取流程的执行记录，最近的在前"""
+        result = await self.db.execute(
+            select(FlowRun)
+            .filter(FlowRun.flow_id == flow_id)
+            .order_by(FlowRun.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
@@ -0,0 +1,113 @@
+"""流程图的校验和模板渲染"""
+import re
+from collections import deque
+from typing import Any, Dict, List, Set
+
+from ..schemas.flow import FlowDefinition, FlowNode
+
+PLACEHOLDER = re.compile(r"\{\{\s*([\w\-]+)\s*\}\}")
+
+class FlowDefinitionError(ValueError):
+    """流程定义无效"""
+
+def render(template: str, values: Dict[str, str]) -> str:
+    """把 `{{name}}` 替换为 values 中的值"""
+    return PLACEHOLDER.sub(lambda m: values[m.group(1)], template)
+
+def render_value(value: Any, values: Dict[str, str]) -> Any:
+    """渲染参数中所有字符串（包括嵌套的列表和字典）"""
+    if isinstance(value, str):
+        return render(value, values)
+    if isinstance(value, list):
+        return [render_value(v, values) for v in value]
+    if isinstance(value, dict):
+        return {k: render_value(v, values) for k, v in value.items()}
+    return value
+
+def _strings(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [s for v in value for s in _strings(v)]
+    if isinstance(value, dict):
+        return [s for v in value.values() for s in _strings(v)]
+    return []
+
+def references(node: FlowNode) -> Set[str]:
+    """节点模板中引用的名字"""
+    texts = [node.prompt, node.system_prompt, node.template, *_strings(node.arguments)]
+    return {name for text in texts if text for name in PLACEHOLDER.findall(text)}
+
+class FlowGraph:
+    """校验后的流程图，校验失败抛出 FlowDefinitionError"""
+
+    def __init__(self, definition: FlowDefinition):
+        self.definition = definition
+        self.inputs = list(definition.inputs)
+        self.nodes: Dict[str, FlowNode] = {}
+        for node in definition.nodes:
+            if node.id in self.nodes:
+                raise FlowDefinitionError(f"节点 ID 重复: {node.id}")
+            if node.id in self.inputs:
+                raise FlowDefinitionError(f"节点 ID 与输入名重复: {node.id}")
+            self._check_fields(node)
+            self.nodes[node.id] = node
+
+        self.predecessors: Dict[str, Set[str]] = {node_id: set() for node_id in self.nodes}
+        self.successors: Dict[str, Set[str]] = {node_id: set() for node_id in self.nodes}
+        for edge in definition.edges:
+            for end in (edge.source, edge.target):
+                if end not in self.nodes:
+                    raise FlowDefinitionError(f"边引用了不存在的节点: {end}")
+            self.predecessors[edge.target].add(edge.source)
+            self.successors[edge.source].add(edge.target)
+        self.order = self._topological_order()
+
+        for node in self.nodes.values():
+            unknown = references(node) - set(self.inputs) - self.predecessors[node.id]
+            if unknown:
+                raise FlowDefinitionError(
+                    f"节点 {node.id} 引用了未连接的节点或未声明的输入: {', '.join(sorted(unknown))}"
+                )
+        for node_id in definition.outputs:
+            if node_id not in self.nodes:
+                raise FlowDefinitionError(f"输出节点不存在: {node_id}")
+        self.outputs = list(definition.outputs) or [n for n in self.order if not self.successors[n]]
+
+    @staticmethod
+    def _check_fields(node: FlowNode) -> None:
+        required = {"llm": ("model_id", "prompt"), "template": ("template",), "tool": ("tool",)}[node.type]
+        missing = [name for name in required if not getattr(node, name)]
+        if missing:
+            raise FlowDefinitionError(f"{node.type} 节点 {node.id} 缺少 {', '.join(missing)}")
+
+    def _topological_order(self) -> List[str]:
+        remaining = {node_id: len(preds) for node_id, preds in self.predecessors.items()}
+        ready = deque(node_id for node_id in self.nodes if remaining[node_id] == 0)
+        order = []
+        while ready:
+            node_id = ready.popleft()
+            order.append(node_id)
+            for successor in sorted(self.successors[node_id]):
+                remaining[successor] -= 1
+                if remaining[successor] == 0:
+                    ready.append(successor)
+        if len(order) != len(self.nodes):
+            raise FlowDefinitionError("流程图中存在环")
+        return order
+
+    def descendants(self, node_id: str) -> Set[str]:
+        found: Set[str] = set()
+        stack = list(self.successors[node_id])
+        while stack:
+            current = stack.pop()
+            if current not in found:
+                found.add(current)
+                stack.extend(self.successors[current])
+        return found
+
+    def model_ids(self) -> Set[str]:
+        return {node.model_id for node in self.nodes.values() if node.type == "llm"}
+
+    def tool_names(self) -> Set[str]:
+        return {node.tool for node in self.nodes.values() if node.type == "tool"}
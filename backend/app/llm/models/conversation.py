@@ -21,7 +21,7 @@ class Conversation(Base):
         "LLMModel",
         foreign_keys=[model_id],
         primaryjoin="Conversation.model_id == LLMModel.id",
-        lazy="joined"
+        lazy="raise"  # 模型配置从 model_registry 读取，不再随会话联表加载
     )
     system_prompt: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     status: Mapped[str] = mapped_column(
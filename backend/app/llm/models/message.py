@@ -58,6 +58,7 @@ class Message(Base):
         "MessageItem",
         primaryjoin="Message.id == MessageItem.message_id",
         foreign_keys="MessageItem.message_id",
+        order_by="MessageItem.order",
         backref="message",
         lazy="joined"
     )
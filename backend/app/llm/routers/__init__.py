@@ -1,9 +1,13 @@
+from .batch import router as batch_router
 from .conversation import router as conversation_router
 from .message import router as message_router
 from .model import router as model_router
+from .stream import router as stream_router
 
 __all__ = [
+    'batch_router',
     'conversation_router',
     'message_router',
-    'model_router'
+    'model_router',
+    'stream_router'
 ]
\ No newline at end of file
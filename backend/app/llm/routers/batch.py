@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.database import get_db, get_session_factory
+from core.query_debug import query_budget
+from core.serialization import dumps
+from ..schemas.batch import BatchCreate, BatchResponse
+from ..services.batch import BatchJob, batch_runner
+
+router = APIRouter(prefix="/batches", tags=["批量任务"])
+
+def _get_batch(batch_id: str) -> BatchJob:
+    batch = batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批次不存在或已过期")
+    return batch
+
+@router.post("", response_model=BatchResponse, status_code=202)
+@query_budget(4)
+async def create_batch(
+    data: BatchCreate,
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
+):
+    """提交一批提示在后台执行，返回批次进度（说明见 services/batch.py）"""
+    batch = await batch_runner.create(db, data)
+    return batch_runner.start(batch, session_factory).progress()
+
+@router.get("/{batch_id}", response_model=BatchResponse)
+@query_budget(0)
+async def get_batch(batch_id: str):
+    """获取批次进度"""
+    return _get_batch(batch_id).progress()
+
+@router.get("/{batch_id}/results")
+@query_budget(0)
+async def download_batch_results(batch_id: str):
+    """按完成顺序以 NDJSON 返回各提示的结果，批次未结束时持续输出直到结束"""
+    batch = _get_batch(batch_id)
+
+    async def lines():
+        async for result in batch.results():
+            yield dumps(result) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.post("/{batch_id}/cancel", response_model=BatchResponse)
+@query_budget(0)
+async def cancel_batch(batch_id: str):
+    """取消批次：执行中的提示保存已生成部分，未执行的不再执行"""
+    _get_batch(batch_id)
+    return (await batch_runner.cancel(batch_id)).progress()
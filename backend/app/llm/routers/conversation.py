@@ -1,11 +1,14 @@
-from typing import List, Optional, AsyncGenerator
-from fastapi import APIRouter, Depends, Query, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
-from sqlalchemy.ext.asyncio import AsyncSession
-import json
-import uuid
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from core.database import get_db
+from core.change_feed import watch_changes
+from core.database import get_db, get_session_factory
+from core.serialization import dumps
+from core.query_debug import query_budget
+from core.timing import current_timings
+from core.http_cache import make_etag, latest, is_not_modified, not_modified, cache_headers
 from ..services import ConversationService, MessageService
 from ..schemas import (
     ConversationCreate,
@@ -14,25 +17,18 @@ from ..schemas import (
     MessageCreate,
     MessageResponse
 )
+from ..schemas.conversation import ConversationCompare
 from ..schemas.message_item import MessageItemCreate, MessageItemResponse
-from ..services.llm_service import create_chat_completion
-from ..models.message import MessageRole, MessageType
+from ..services.compare import start_compare, stream_compare
+from ..services.generation import start_query, stream_job, stream_conversation
+from ..services.sse import FrameEncoder, wants_compact, sse_headers, sse_event
+from ..services.tools import tool_registry
 
 router = APIRouter(prefix="/conversations", tags=["对话管理"])
 
-def json_dumps_unicode(obj):
-    return json.dumps(obj, ensure_ascii=False)
-
-def clean_text(text: str) -> str:
-    """清理文本，去除多余的换行符和空白字符"""
-    # 去除首尾的空白字符
-    text = text.strip()
-    # 将多个连续的换行符替换为单个换行符
-    text = '\n'.join(line.strip() for line in text.split('\n') if line.strip())
-    return text
-
 # 会话相关路由
 @router.post("", response_model=ConversationResponse)
+@query_budget(2)
 async def create_conversation(
     data: ConversationCreate,
     db: AsyncSession = Depends(get_db)
@@ -42,144 +38,115 @@ async def create_conversation(
     return await conversation_service.create_conversation(data)
 
 @router.post("/{conversation_id}/query")
+@query_budget(14)
 async def query_conversation(
     conversation_id: str,
     query: str,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    tools: Optional[List[str]] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
 ):
-    """发送查询到会话"""
-    message_service = MessageService(db)
-    conversation_service = ConversationService(db)
-    
-    # 获取会话信息
-    conversation = await conversation_service.get_conversation(conversation_id)
-    if not conversation:
-        raise HTTPException(status_code=404, detail="会话不存在")
-    
-    # 生成消息ID
-    message_id = str(uuid.uuid4())
-    
-    # 创建用户消息
-    user_message = MessageCreate(
-        conversation_id=conversation_id,
-        user_id=conversation.user_id,
-        content=query,
-        role=MessageRole.USER
-    )
-    user_message_obj = await message_service.create_message(user_message)
+    """发送查询到会话
+
+    请求头 `X-SSE-Frames: compact` 时使用紧凑帧协议（见 services/sse.py）。
+    生成在后台任务中执行，流式输出期间不占用数据库连接，结束后用短会话保存结果。
+    指定 tools（可重复，工具名见 services/tools.py）时模型可以调用这些工具，
+    输出中包含 action / observation 帧。
+    """
+    enabled_tools = None
+    if tools:
+        try:
+            enabled_tools = tool_registry.select(tools)
+        except KeyError as e:
+            raise HTTPException(status_code=400, detail=f"工具不存在: {e.args[0]}")
+    # 生成在后台任务中执行，客户端断开后仍会完成并保存，可通过助手消息ID重新连接
+    job = await start_query(db, session_factory, conversation_id, query, tools=enabled_tools)
     
-    # 为用户消息创建message_item
-    user_item_data = MessageItemCreate(
-        message_id=user_message_obj.id,
-        conversation_id=conversation_id,
-        content=clean_text(query),
-        type="message"
+    compact = wants_compact(request.headers)
+    encoder = FrameEncoder(conversation_id, job.id, compact=compact)
+    return StreamingResponse(
+        stream_job(job, encoder, current_timings()),
+        media_type="text/event-stream",
+        headers=sse_headers(compact)
     )
-    await message_service.create_message_item(user_item_data)
-    
-    # 创建助手消息
-    assistant_message = MessageCreate(
-        conversation_id=conversation_id,
-        user_id=conversation.user_id,
-        role=MessageRole.ASSISTANT
+
+@router.post("/{conversation_id}/compare")
+@query_budget(13)
+async def compare_models(
+    conversation_id: str,
+    data: ConversationCompare,
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
+):
+    """把同一条提示同时发给多个模型，在一个 SSE 连接上交错返回各模型的输出
+
+    每个模型的回答保存为同级的助手消息，帧格式见 services/compare.py。
+    """
+    jobs = await start_compare(db, session_factory, conversation_id, data.query, data.model_ids)
+    return StreamingResponse(
+        stream_compare(conversation_id, jobs),
+        media_type="text/event-stream",
+        headers=sse_headers(False)
     )
-    assistant_message_obj = await message_service.create_message(assistant_message)
-    
-    async def generate_response() -> AsyncGenerator[str, None]:
-        try:
-            # 构建消息列表
-            messages = [{
-                "role": MessageRole.USER.value,
-                "content": query,
-                "conversation_id": conversation_id,
-                "message_id": message_id,
-                "type": MessageType.TEXT.value
-            }]
-            
-            # 用于收集不同类型的消息内容
-            collected_contents = {
-                "think": [],
-                "message": [],
-                "action": [],
-                "observation": []
-            }
-            
-            # 调用LLM服务并流式返回结果
-            async for chunk in create_chat_completion(
-                messages=messages,
-                model_config=conversation.model,  # 使用会话绑定的模型
-                stream=True
-            ):
-                if chunk:
-                    # 收集对应类型的内容
-                    chunk_type = chunk.get("type", "message")
-                    chunk_content = chunk.get("content", "")
-                    if chunk_type in collected_contents:
-                        collected_contents[chunk_type].append(chunk_content)
-                    
-                    # 构建完整的消息块
-                    message_block = {
-                        "type": chunk_type,
-                        "content": chunk_content,
-                        "conversation_id": conversation_id,
-                        "message_id": message_id
-                    }
-                    
-                    # 流式返回给客户端
-                    yield f"data: {json_dumps_unicode(message_block)}\n\n"
-            
-            # 存储各类型的消息内容
-            for item_type, contents in collected_contents.items():
-                if contents:
-                    # 对于 message 类型，更新助手消息的内容
-                    if item_type == "message":
-                        # 重新获取消息对象以确保它在当前会话中
-                        current_message = await message_service.get_message(assistant_message_obj.id)
-                        if current_message:
-                            current_message.content = clean_text("".join(contents))
-                            await message_service.update_message(current_message)
-                    
-                    # 存储消息项，使用assistant_message_obj.id作为message_id
-                    item_data = MessageItemCreate(
-                        message_id=assistant_message_obj.id,  # 使用助手消息的ID
-                        conversation_id=conversation_id,
-                        content=clean_text("".join(contents)),
-                        type=item_type
-                    )
-                    await message_service.create_message_item(item_data)
-            
-            # 更新会话的最后消息时间
-            await conversation_service.update_conversation_last_message(conversation_id)
-            
-            # 发送完成消息
-            yield f"data: {json_dumps_unicode({'type': 'done', 'conversation_id': conversation_id, 'message_id': message_id})}\n\n"
-                    
-        except Exception as e:
-            error_message = f"发生错误: {str(e)}"
-            yield f"data: {json_dumps_unicode({'type': 'error', 'content': error_message, 'conversation_id': conversation_id, 'message_id': message_id})}\n\n"
-            yield f"data: {json_dumps_unicode({'type': 'done', 'conversation_id': conversation_id, 'message_id': message_id})}\n\n"
 
+@router.get("/{conversation_id}/live")
+@query_budget(0)
+async def live_conversation(conversation_id: str):
+    """实时接收会话中的生成（其他窗口或设备发起的也会收到）
+
+    每次生成以 `start` 帧开始、`done` 帧结束，帧中的 message_id 区分不同生成；只支持标准帧协议。
+    """
     return StreamingResponse(
-        generate_response(),
+        stream_conversation(conversation_id),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream; charset=utf-8",
-            "X-Accel-Buffering": "no"
-        }
+        headers=sse_headers(False)
     )
 
 @router.get("/{conversation_id}", response_model=ConversationResponse)
+@query_budget(1)
 async def get_conversation(
     conversation_id: str,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
-    """获取会话详情"""
+    """获取会话详情，支持 If-None-Match / If-Modified-Since 条件请求"""
     conversation_service = ConversationService(db)
-    return await conversation_service.get_conversation(conversation_id)
+    conversation = await conversation_service.get_conversation(conversation_id)
+
+    etag = make_etag(
+        "conversation", conversation.id, conversation.updated_at,
+        conversation.last_message_at, conversation.message_count
+    )
+    last_modified = latest(conversation.updated_at, conversation.last_message_at)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+    response.headers.update(cache_headers(etag, last_modified))
+    return conversation
+
+async def _change_frames(user_id: str):
+    async for change in watch_changes(user_id):
+        if change is None:
+            yield b": ping\n\n"
+        else:
+            yield sse_event(dumps(change), id=change["seq"])
+
+@router.get("/user/{user_id}/changes")
+@query_budget(0)
+async def watch_user_changes(user_id: str):
+    """订阅用户的会话和消息变更（创建、修改、删除、统计更新），替代轮询会话列表
+
+    只推送订阅之后提交的变更，断线重连后应先重新获取一次会话列表。
+    """
+    return StreamingResponse(
+        _change_frames(user_id),
+        media_type="text/event-stream",
+        headers=sse_headers(False)
+    )
 
 @router.get("/user/{user_id}", response_model=List[ConversationResponse])
+@query_budget(1)
 async def list_user_conversations(
     user_id: str,
     skip: int = Query(0, ge=0),
@@ -197,6 +164,7 @@ async def list_user_conversations(
     )
 
 @router.patch("/{conversation_id}", response_model=ConversationResponse)
+@query_budget(4)
 async def update_conversation(
     conversation_id: str,
     data: ConversationUpdate,
@@ -207,6 +175,7 @@ async def update_conversation(
     return await conversation_service.update_conversation(conversation_id, data)
 
 @router.delete("/{conversation_id}")
+@query_budget(3)
 async def delete_conversation(
     conversation_id: str,
     db: AsyncSession = Depends(get_db)
@@ -217,10 +186,27 @@ async def delete_conversation(
     return {"message": "会话已删除"}
 
 @router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
+@query_budget(2)
 async def get_conversation_messages(
     conversation_id: str,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
-    """获取会话的历史消息列表"""
+    """获取会话的历史消息列表
+
+    先只查询会话的版本信息，客户端缓存有效时返回 304，不再加载消息。
+    """
+    version = await ConversationService(db).get_conversation_version(conversation_id)
+    etag = make_etag(
+        "messages", version.id, version.updated_at,
+        version.last_message_at, version.message_count
+    )
+    last_modified = latest(version.updated_at, version.last_message_at)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+
     message_service = MessageService(db)
-    return await message_service.get_conversation_messages_with_items(conversation_id)
+    messages = await message_service.get_conversation_messages_with_items(conversation_id)
+    response.headers.update(cache_headers(etag, last_modified))
+    return messages
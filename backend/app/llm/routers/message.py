@@ -1,32 +1,36 @@
-from typing import List, Optional, AsyncGenerator
-from fastapi import APIRouter, Depends, Query, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, Query, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from sqlalchemy.ext.asyncio import AsyncSession
-import json
-import uuid
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from core.database import get_db
+from core.database import get_db, get_session_factory
+from core.query_debug import query_budget
+from core.timing import current_timings
 from ..services import MessageService, ConversationService
 from ..schemas.message import (
     MessageCreate,
     MessageResponse
 )
-from ..schemas.message_item import MessageItemCreate
-from ..services.llm_service import create_chat_completion
+from ..services.generation import GenerationJob, generation_runner, missing_job_detail, stream_job
+from ..services.model_registry import model_registry
+from ..services.sse import FrameEncoder, wants_compact, sse_headers
 from ..models.message import MessageRole, MessageType
 
 router = APIRouter(prefix="/messages", tags=["消息管理"])
 
-def json_dumps_unicode(obj):
-    return json.dumps(obj, ensure_ascii=False)
-
 # 消息相关路由
 @router.post("", response_model=MessageResponse)
+@query_budget(9)
 async def create_message(
     data: MessageCreate,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory)
 ):
-    """创建新消息并支持流式输出"""
+    """创建新消息并支持流式输出
+
+    生成在后台任务中执行，流式输出期间不占用数据库连接，结束后用短会话保存结果。
+    """
     message_service = MessageService(db)
     conversation_service = ConversationService(db)
     
@@ -34,9 +38,8 @@ async def create_message(
     conversation = await conversation_service.get_conversation(data.conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="会话不存在")
-    
-    # 生成消息ID
-    message_id = str(uuid.uuid4())
+    # 模型配置从进程内缓存读取
+    model_config = await model_registry.get(db, conversation.model_id)
     
     # 创建助手消息
     assistant_message = MessageCreate(
@@ -45,75 +48,70 @@ async def create_message(
         role=MessageRole.ASSISTANT
     )
     message = await message_service.create_message(assistant_message)
+    # 归还连接，流式输出可能持续数分钟
+    await db.close()
+    
+    job = generation_runner.start(GenerationJob(
+        id=message.id,
+        conversation_id=data.conversation_id,
+        messages=[{
+            "role": MessageRole.USER.value,
+            "content": "",
+            "conversation_id": data.conversation_id,
+            "message_id": message.id,
+            "type": MessageType.TEXT.value
+        }],
+        model_config=model_config  # 使用会话绑定的模型
+    ), session_factory)
     
-    async def generate_response() -> AsyncGenerator[str, None]:
-        try:
-            # 构建消息列表
-            messages = [{
-                "role": MessageRole.USER.value,
-                "content": "",
-                "conversation_id": data.conversation_id,
-                "message_id": message_id,
-                "type": MessageType.TEXT.value
-            }]
-            
-            # 用于收集不同类型的消息内容
-            collected_contents = {
-                "think": [],
-                "message": [],
-                "action": [],
-                "observation": []
-            }
-            
-            # 调用LLM服务并流式返回结果
-            async for chunk in create_chat_completion(
-                messages=messages,
-                model_config=conversation.model,  # 使用会话绑定的模型
-                stream=True
-            ):
-                if chunk:
-                    # 收集对应类型的内容
-                    chunk_type = chunk.get("type", "message")
-                    chunk_content = chunk.get("content", "")
-                    if chunk_type in collected_contents:
-                        collected_contents[chunk_type].append(chunk_content)
-                    
-                    # 流式返回给客户端
-                    yield f"data: {json_dumps_unicode(chunk)}\n\n"
-            
-            # 存储各类型的消息内容
-            for item_type, contents in collected_contents.items():
-                if contents:
-                    item_data = MessageItemCreate(
-                        message_id=message_id,
-                        conversation_id=data.conversation_id,
-                        content="".join(contents),
-                        type=item_type
-                    )
-                    await message_service.create_message_item(item_data)
-            
-            # 更新会话的最后消息时间
-            await conversation_service.update_conversation_last_message(data.conversation_id)
-            
-            yield "data: [DONE]\n\n"
-                    
-        except Exception as e:
-            error_message = f"发生错误: {str(e)}"
-            yield f"data: {json_dumps_unicode({'type': 'error', 'content': error_message})}\n\n"
-            yield "data: [DONE]\n\n"
+    compact = wants_compact(request.headers)
+    encoder = FrameEncoder(data.conversation_id, job.id, compact=compact, include_ids=False)
+    return StreamingResponse(
+        stream_job(job, encoder, current_timings()),
+        media_type="text/event-stream",
+        headers=sse_headers(compact)
+    )
 
+@router.get("/{message_id}/stream")
+@query_budget(0)
+async def stream_message(
+    message_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None)
+):
+    """重新连接进行中（或刚结束）的生成任务
+
+    带 `Last-Event-ID` 时只发送该事件之后的输出块，否则从头重放，之后继续接收实时输出。
+    任务已淘汰时返回 404，所需输出块已不在缓冲中时返回 410，客户端应改为读取历史消息。
+    """
+    job = generation_runner.get(message_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=missing_job_detail())
+    try:
+        last_event_id = int(last_event_id or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Last-Event-ID 无效")
+    if not job.can_resume(last_event_id):
+        raise HTTPException(status_code=410, detail="输出缓冲已过期，请重新加载历史消息")
+    compact = wants_compact(request.headers)
+    encoder = FrameEncoder(job.conversation_id, job.id, compact=compact)
     return StreamingResponse(
-        generate_response(),
+        stream_job(job, encoder, last_event_id=last_event_id),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/event-stream; charset=utf-8",
-            "X-Accel-Buffering": "no"
-        }
+        headers=sse_headers(compact)
     )
 
+@router.post("/{message_id}/cancel")
+@query_budget(0)  # 部分结果由生成任务保存
+async def cancel_message(message_id: str):
+    """停止生成：立即关闭上游流，已生成的部分保存为取消状态的消息"""
+    job = await generation_runner.cancel(message_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=missing_job_detail())
+    return {"id": job.id, "status": job.status.value}
+
 @router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
+@query_budget(1)
 async def list_conversation_messages(
     conversation_id: str,
     db: AsyncSession = Depends(get_db)
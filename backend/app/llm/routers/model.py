@@ -1,10 +1,13 @@
 from typing import Optional
-from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.database import get_session
+from core.query_debug import query_budget
+from core.http_cache import make_etag, latest, is_not_modified, not_modified, cache_headers
 from core.exceptions import ValidationError, NotFoundException
 from ..services.model import LLMModelService
+from ..services.model_registry import model_registry
 from ..schemas.model import (
     LLMModelCreate,
     LLMModelUpdate,
@@ -15,6 +18,7 @@ from ..schemas.model import (
 router = APIRouter(prefix="/models", tags=["模型管理"])
 
 @router.post("", response_model=LLMModelInDB)
+@query_budget(2)
 async def create_model(
     data: LLMModelCreate,
     session: AsyncSession = Depends(get_session),
@@ -30,17 +34,25 @@ async def create_model(
         )
 
 @router.get("", response_model=LLMModelList)
+@query_budget(1)
 async def list_models(
+    request: Request,
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     type: Optional[str] = None,
     is_active: Optional[bool] = None,
     session: AsyncSession = Depends(get_session),
 ):
-    """获取LLM模型列表"""
+    """获取LLM模型列表（读取模型配置缓存），支持条件请求"""
     try:
-        service = LLMModelService(session)
-        models, total = await service.list(skip, limit, type, is_active)
+        models, total = await model_registry.list(session, skip, limit, type, is_active)
+        etag = make_etag("models", total, *((m.id, m.updated_at) for m in models))
+        last_modified = latest(*(m.updated_at for m in models))
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified)
+
+        response.headers.update(cache_headers(etag, last_modified))
         return LLMModelList(total=total, items=models)
     except Exception as e:
         raise HTTPException(
@@ -49,6 +61,7 @@ async def list_models(
         )
 
 @router.put("/{model_id}", response_model=LLMModelInDB)
+@query_budget(3)
 async def update_model(
     model_id: str,
     data: LLMModelUpdate,
@@ -70,6 +83,7 @@ async def update_model(
         )
 
 @router.delete("/{model_id}")
+@query_budget(4)
 async def delete_model(
     model_id: str,
     session: AsyncSession = Depends(get_session),
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends, WebSocket
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from core.database import get_session_factory
+from ..services.multiplex import StreamMultiplexer
+
+router = APIRouter(tags=["流式会话"])
+
+@router.websocket("/ws")
+async def stream_socket(
+    websocket: WebSocket,
+    session_factory: async_sessionmaker = Depends(get_session_factory)
+):
+    """在一个 WebSocket 连接上同时进行多路生成，协议见 services/multiplex.py"""
+    await StreamMultiplexer(websocket, session_factory).run()
@@ -0,0 +1,43 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+
+class BatchItemCreate(BaseModel):
+    """批量任务中的一条提示，conversation_id 和 model_id 二选一"""
+    prompt: str
+    conversation_id: Optional[str] = None  # 追加到已有会话
+    model_id: Optional[str] = None  # 单独调用模型，结果保存在该批次的会话中
+
+    @model_validator(mode="after")
+    def check_target(self) -> "BatchItemCreate":
+        if (self.conversation_id is None) == (self.model_id is None):
+            raise ValueError("conversation_id 和 model_id 必须且只能指定一个")
+        return self
+
+class BatchCreate(BaseModel):
+    """创建批量任务的请求模型"""
+    user_id: str
+    items: List[BatchItemCreate] = Field(min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)  # 默认为 BATCH_WORKERS
+
+class BatchItemResult(BaseModel):
+    """单条提示的执行结果"""
+    index: int
+    status: str  # pending, running, completed, failed, cancelled
+    conversation_id: str
+    message_id: Optional[str] = None  # 助手消息 ID
+    content: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    """批量任务进度"""
+    id: str
+    status: str  # running, completed, cancelled
+    total: int
+    pending: int
+    running: int
+    completed: int
+    failed: int
+    cancelled: int
+    created_at: datetime
+    finished_at: Optional[datetime] = None
@@ -28,6 +28,11 @@ class ConversationUpdate(BaseModel):
     
     model_config = ConfigDict(from_attributes=True)
 
+class ConversationCompare(BaseModel):
+    """多模型对比的请求模型"""
+    query: str
+    model_ids: List[str]
+
 class ConversationResponse(ConversationBase):
     """会话的响应模型"""
     id: str
@@ -4,6 +4,7 @@ from pydantic import BaseModel
 class MessageItemBase(BaseModel):
     content: str
     type: str
+    order: int = 0  # 在消息中的顺序
 
 class MessageItemCreate(MessageItemBase):
     message_id: str
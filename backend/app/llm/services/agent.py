@@ -0,0 +1,110 @@
+"""智能体工具调用循环
+
+在 create_chat_completion 之上反复执行：把可用工具交给模型，从输出流中拼出工具调用；
+有工具调用时并发执行（async 工具在事件循环上，process 工具在进程池中，见 services/tools.py），
+把结果作为 tool 消息追加到上下文后再次调用模型，直到模型不再调用工具或达到 AGENT_MAX_STEPS 轮。
+
+输出块与普通生成相同（think / message），另外：
+- `action`：每个工具调用一块，内容为 `{"id", "name", "arguments"}` JSON，模型输出结束后按调用顺序发送；
+- `observation`：每个工具结果一块，内容为 `{"id", "name", "content"}` 或 `{"id", "name", "error"}` JSON，
+  按完成先后发送，不等同一轮的其他工具。
+各块保存为消息项时按发送顺序记录 order。
+"""
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+
+from core.config import settings
+from core.serialization import dumps_str
+from core.timing import timed_stream
+from .llm_service import create_chat_completion
+from .model_registry import ModelConfig
+from .tools import ToolCall, ToolRegistry, ToolResult
+
+logger = logging.getLogger(__name__)
+
+def _collect_calls(parts: Dict[int, dict]) -> List[ToolCall]:
+    return [
+        ToolCall(id=part["id"] or f"call_{index}", name=part["name"] or "", arguments=part["arguments"])
+        for index, part in sorted(parts.items())
+    ]
+
+def _observation(call: ToolCall, result: ToolResult) -> dict:
+    body = {"id": call.id, "name": call.name}
+    if result.error is None:
+        body["content"] = result.content
+    else:
+        body["error"] = result.error
+    return {"type": "observation", "content": dumps_str(body)}
+
+async def run_agent(
+    messages: List[dict],
+    tools: ToolRegistry,
+    model_config: Optional[ModelConfig] = None,
+    max_steps: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """执行工具调用循环，产生 think / message / action / observation 输出块"""
+    max_steps = settings.AGENT_MAX_STEPS if max_steps is None else max_steps
+    model_name = model_config.model_name if model_config else "default"
+    history = list(messages)
+    schemas = tools.schemas()
+
+    for _ in range(max_steps):
+        text: List[str] = []
+        parts: Dict[int, dict] = {}
+        async for chunk in timed_stream(create_chat_completion(
+            messages=history,
+            model_config=model_config,
+            stream=True,
+            tools=schemas
+        ), model=model_name):
+            if chunk.get("type") == "tool_call":
+                part = parts.setdefault(chunk["index"], {"id": None, "name": None, "arguments": ""})
+                part["id"] = part["id"] or chunk.get("id")
+                part["name"] = part["name"] or chunk.get("name")
+                part["arguments"] += chunk.get("arguments") or ""
+                continue
+            if chunk.get("type") == "message":
+                text.append(chunk.get("content", ""))
+            yield chunk
+
+        calls = _collect_calls(parts)
+        if not calls:
+            return
+
+        history.append({
+            "role": "assistant",
+            "content": "".join(text),
+            "tool_calls": [
+                {"id": call.id, "type": "function", "function": {"name": call.name, "arguments": call.arguments}}
+                for call in calls
+            ],
+        })
+        for call in calls:
+            yield {"type": "action", "content": dumps_str(
+                {"id": call.id, "name": call.name, "arguments": call.arguments}
+            )}
+
+        # 同一轮的工具调用互不依赖，并发执行，先完成的先输出
+        results: Dict[str, ToolResult] = {}
+        tasks = {asyncio.ensure_future(tools.execute(call)): call for call in calls}
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    call = tasks[task]
+                    results[call.id] = task.result()
+                    yield _observation(call, results[call.id])
+        finally:
+            # 取消生成时一并取消未完成的工具调用
+            for task in tasks:
+                task.cancel()
+
+        history.extend(
+            {"role": "tool", "tool_call_id": call.id, "content": results[call.id].text}
+            for call in calls
+        )
+
+    logger.info("工具调用超过 %d 轮，停止", max_steps)
+    yield {"type": "error", "content": f"工具调用超过 {max_steps} 轮，已停止"}
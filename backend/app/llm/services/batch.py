@@ -0,0 +1,398 @@
+"""批量执行提示
+
+`POST /batches` 提交一批提示（每条追加到指定会话，或单独调用指定模型），由 BatchRunner
+在后台按有界并发执行，结果与 /query 一样保存为用户消息、助手消息及其消息项。单独调用
+模型的提示按模型各建一个会话（meta_info.batch_id 记录批次 ID）保存。
+
+并发受两层限制：批次的工作协程数（BATCH_WORKERS 或请求中的 concurrency），以及按模型
+共享的并发上限（模型 meta_info.custom_settings.max_concurrency，默认 BATCH_MODEL_CONCURRENCY），
+同时运行的多个批次共用模型的上限，修改模型配置后（TOPIC_MODELS 失效通知）重新读取。提示只在批次和模型都有空闲额度时开始执行，等待时不占用
+任何一方的额度，某个模型排满时其他模型的提示照常执行。
+
+每条提示作为一个 GenerationJob 执行，执行期间可以按助手消息 ID 接入输出。
+批次的进度和结果只保存在本进程内，结束后保留 BATCH_RETENTION_SECONDS 秒；
+`GET /batches/{id}/results` 按完成顺序以 NDJSON 流式返回结果，批次未结束时持续输出直到结束。
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import settings
+from core.metrics import batch_items
+from core.invalidation import invalidation, TOPIC_MODELS
+from .generation import GenerationRunner, JobStatus, clean_text, generation_runner, start_query
+from .model_registry import ModelConfig, model_registry
+from ..models.conversation import Conversation
+from ..schemas.batch import BatchCreate
+
+logger = logging.getLogger(__name__)
+
+class BatchStatus(str, Enum):
+    """批次状态"""
+    RUNNING = "running"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+
+class ItemStatus(str, Enum):
+    """单条提示的状态"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+# 计入 maoflow_batch_items 的状态
+_ACTIVE_STATUSES = (ItemStatus.PENDING, ItemStatus.RUNNING)
+
+class BatchItem:
+    """批次中的一条提示"""
+
+    def __init__(self, index: int, prompt: str, conversation_id: str, model_id: str):
+        self.index = index
+        self.prompt = prompt
+        self.conversation_id = conversation_id
+        self.model_id = model_id
+        self._status = ItemStatus.PENDING
+        batch_items.inc(status=ItemStatus.PENDING.value)
+        self.message_id: Optional[str] = None
+        self.content: Optional[str] = None
+        self.error: Optional[str] = None
+
+    @property
+    def status(self) -> ItemStatus:
+        return self._status
+
+    @status.setter
+    def status(self, status: ItemStatus) -> None:
+        if self._status in _ACTIVE_STATUSES:
+            batch_items.dec(status=self._status.value)
+        if status in _ACTIVE_STATUSES:
+            batch_items.inc(status=status.value)
+        self._status = status
+
+    def result(self) -> dict:
+        return {
+            "index": self.index,
+            "status": self.status.value,
+            "conversation_id": self.conversation_id,
+            "message_id": self.message_id,
+            "content": self.content,
+            "error": self.error,
+        }
+
+class BatchJob:
+    """一个批次：各提示的状态及完成顺序"""
+
+    def __init__(self, id: str, user_id: str, items: List[BatchItem], concurrency: int):
+        self.id = id
+        self.user_id = user_id
+        self.items = items
+        self.concurrency = concurrency
+        self.status = BatchStatus.RUNNING
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        # 正在执行的提示数（占用的批次额度）
+        self._active = 0
+        self._finished_monotonic: Optional[float] = None
+        # 已结束提示的下标，按结束先后排列
+        self._done: List[int] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status != BatchStatus.RUNNING
+
+    def progress(self) -> dict:
+        counts = {status: 0 for status in ItemStatus}
+        for item in self.items:
+            counts[item.status] += 1
+        return {
+            "id": self.id,
+            "status": self.status.value,
+            "total": len(self.items),
+            **{status.value: n for status, n in counts.items()},
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    async def results(self) -> AsyncIterator[dict]:
+        """按完成顺序返回各提示的结果，批次结束且全部返回后停止"""
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self._done):
+                yield self.items[self._done[position]].result()
+                position += 1
+            if self.finished:
+                return
+            await changed.wait()
+
+    def _record(self, item: BatchItem) -> None:
+        self._done.append(item.index)
+        self._notify()
+
+    def _finish(self, status: BatchStatus) -> None:
+        # 未执行的提示记为取消
+        for item in self.items:
+            if item.status in (ItemStatus.PENDING, ItemStatus.RUNNING):
+                item.status = ItemStatus.CANCELLED
+                self._done.append(item.index)
+        self.status = status
+        self.finished_at = datetime.utcnow()
+        self._finished_monotonic = time.monotonic()
+        self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+def _model_limit(model_config: ModelConfig) -> int:
+    custom = (model_config.meta_info or {}).get("custom_settings") or {}
+    value = custom.get("max_concurrency")
+    if value is None:
+        return settings.BATCH_MODEL_CONCURRENCY
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+    # 上限小于 1 时该模型的提示永远拿不到额度
+    if limit < 1:
+        logger.warning(
+            "模型 %s 的 max_concurrency 无效: %r，使用默认值 %s",
+            model_config.id, value, settings.BATCH_MODEL_CONCURRENCY
+        )
+        return settings.BATCH_MODEL_CONCURRENCY
+    return limit
+
+class BatchRunner:
+    """在后台执行批次，按模型限制并发"""
+
+    def __init__(
+        self,
+        runner: Optional[GenerationRunner] = None,
+        retention: Optional[float] = None
+    ):
+        self.runner = runner or generation_runner
+        self.retention = settings.BATCH_RETENTION_SECONDS if retention is None else retention
+        self._batches: Dict[str, BatchJob] = {}
+        # 按模型 ID 共享的并发上限及正在执行的提示数，所有批次共用
+        self._model_limits: Dict[str, int] = {}
+        self._model_active: Dict[str, int] = defaultdict(int)
+        # 模型配置变更后，下次分配额度前重新读取上限
+        self._limits_stale = False
+        # 有提示结束（释放额度）或上限变化时替换并触发
+        self._released = asyncio.Event()
+
+    def get(self, batch_id: str) -> Optional[BatchJob]:
+        self._evict()
+        return self._batches.get(batch_id)
+
+    async def create(self, db: AsyncSession, data: BatchCreate) -> BatchJob:
+        """校验目标会话和模型，为单独调用的模型建会话，返回未启动的批次
+
+        会话或模型不存在时抛出 404；返回前关闭 db。
+        """
+        if len(data.items) > settings.BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"单个批次不能超过 {settings.BATCH_MAX_ITEMS} 条")
+        batch_id = str(uuid.uuid4())
+
+        # 一次查询取出所有目标会话的模型
+        conversation_ids = {item.conversation_id for item in data.items if item.conversation_id}
+        conversation_models: Dict[str, str] = {}
+        if conversation_ids:
+            result = await db.execute(
+                select(Conversation.id, Conversation.model_id)
+                .filter(Conversation.id.in_(conversation_ids), Conversation.is_deleted == False)
+            )
+            conversation_models = dict(result.all())
+            missing = conversation_ids - conversation_models.keys()
+            if missing:
+                raise HTTPException(status_code=404, detail=f"会话不存在: {', '.join(sorted(missing))}")
+
+        models: Dict[str, ModelConfig] = {}
+        for model_id in set(conversation_models.values()) | {i.model_id for i in data.items if i.model_id}:
+            model_config = await model_registry.get(db, model_id)
+            if model_config is None:
+                raise HTTPException(status_code=404, detail=f"模型不存在: {model_id}")
+            models[model_id] = model_config
+
+        # 单独调用的提示按模型各建一个会话
+        standalone: Dict[str, Conversation] = {}
+        for model_id in {item.model_id for item in data.items if item.model_id}:
+            standalone[model_id] = Conversation(
+                title=f"批量任务 {batch_id[:8]} · {models[model_id].name}",
+                model_id=model_id,
+                user_id=data.user_id,
+                meta_info={"tags": ["batch"], "custom_settings": {}, "batch_id": batch_id}
+            )
+        if standalone:
+            db.add_all(standalone.values())
+            await db.commit()
+        await db.close()
+
+        items = []
+        for index, item in enumerate(data.items):
+            if item.conversation_id:
+                items.append(BatchItem(index, item.prompt, item.conversation_id, conversation_models[item.conversation_id]))
+            else:
+                items.append(BatchItem(index, item.prompt, standalone[item.model_id].id, item.model_id))
+        for model_id, model_config in models.items():
+            self._model_limits[model_id] = _model_limit(model_config)
+        self._wake()
+        return BatchJob(batch_id, data.user_id, items, data.concurrency or settings.BATCH_WORKERS)
+
+    def invalidate_limits(self, topic: str = TOPIC_MODELS) -> None:
+        """模型配置变更（invalidation 回调）：等待额度的提示重新读取模型上限"""
+        self._limits_stale = True
+        self._wake()
+
+    def start(self, batch: BatchJob, session_factory: async_sessionmaker) -> BatchJob:
+        self._evict()
+        self._batches[batch.id] = batch
+        batch.task = asyncio.create_task(self._run(batch, session_factory), name=f"batch-{batch.id}")
+        return batch
+
+    async def cancel(self, batch_id: str) -> Optional[BatchJob]:
+        """取消批次：执行中的提示保存已生成部分，未执行的不再执行"""
+        batch = self.get(batch_id)
+        if batch is None:
+            return None
+        if batch.task is not None and not batch.task.done():
+            batch.task.cancel()
+            await asyncio.wait({batch.task})
+        return batch
+
+    async def shutdown(self) -> None:
+        """取消运行中的批次（批次可能持续数小时，不等待），执行中的提示保存已生成部分"""
+        tasks = [batch.task for batch in self._batches.values() if batch.task and not batch.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _evict(self) -> None:
+        deadline = time.monotonic() - self.retention
+        for batch in list(self._batches.values()):
+            if batch._finished_monotonic is not None and batch._finished_monotonic < deadline:
+                del self._batches[batch.id]
+
+    async def _run(self, batch: BatchJob, session_factory: async_sessionmaker) -> None:
+        status = BatchStatus.COMPLETED
+        queues: Dict[str, Deque[BatchItem]] = defaultdict(deque)
+        for item in batch.items:
+            queues[item.model_id].append(item)
+        # 每个模型的工作协程数不超过批次并发数，实际并发由 _acquire 按两层额度控制
+        workers = [
+            asyncio.ensure_future(self._worker(batch, model_id, queue, session_factory))
+            for model_id, queue in queues.items()
+            for _ in range(min(batch.concurrency, len(queue)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            logger.info("批次 %s 已取消", batch.id)
+            status = BatchStatus.CANCELLED
+            # 等待额度的工作协程立即结束，gather 随之返回；等执行中的提示保存完再结束批次
+            await asyncio.wait(workers)
+        finally:
+            batch._finish(status)
+
+    async def _worker(
+        self,
+        batch: BatchJob,
+        model_id: str,
+        queue: Deque[BatchItem],
+        session_factory: async_sessionmaker
+    ) -> None:
+        while queue:
+            await self._acquire(batch, model_id, session_factory)
+            try:
+                # 等待额度期间其他工作协程可能已取走剩余的提示
+                if queue:
+                    await self._run_item(batch, queue.popleft(), session_factory)
+            finally:
+                self._release(batch, model_id)
+
+    async def _acquire(self, batch: BatchJob, model_id: str, session_factory: async_sessionmaker) -> None:
+        """等到批次和模型同时有空闲额度时一起占用，等待期间不占用任何额度"""
+        while True:
+            if self._limits_stale:
+                await self._refresh_limits(session_factory)
+            if batch._active < batch.concurrency and self._model_active[model_id] < self._model_limits[model_id]:
+                break
+            await self._released.wait()
+        batch._active += 1
+        self._model_active[model_id] += 1
+
+    async def _refresh_limits(self, session_factory: async_sessionmaker) -> None:
+        """重新读取各模型的并发上限（已删除的模型保持原上限）"""
+        self._limits_stale = False
+        async with session_factory() as db:
+            for model_id in list(self._model_limits):
+                model_config = await model_registry.get(db, model_id)
+                if model_config is not None:
+                    self._model_limits[model_id] = _model_limit(model_config)
+        self._wake()
+
+    def _release(self, batch: BatchJob, model_id: str) -> None:
+        batch._active -= 1
+        self._model_active[model_id] -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        released, self._released = self._released, asyncio.Event()
+        released.set()
+
+    async def _run_item(self, batch: BatchJob, item: BatchItem, session_factory: async_sessionmaker) -> None:
+        item.status = ItemStatus.RUNNING
+        job = None
+        try:
+            async with session_factory() as db:
+                # 批次中的生成没有发起它的客户端，接入后断开也不自动取消
+                job = await start_query(
+                    db, session_factory, item.conversation_id, item.prompt, self.runner, detached_timeout=0
+                )
+            item.message_id = job.id
+            await job.wait()
+        except asyncio.CancelledError:
+            # 批次取消时同时取消正在执行的生成，等待其保存已生成部分
+            if job is not None:
+                job.cancel()
+                await job.wait()
+            raise
+        except HTTPException as e:
+            item.status = ItemStatus.FAILED
+            item.error = e.detail
+        except Exception as e:
+            logger.exception("批次 %s 第 %d 条执行出错", batch.id, item.index)
+            item.status = ItemStatus.FAILED
+            item.error = str(e)
+        finally:
+            if job is not None and job.finished:
+                self._collect(item, job)
+            if item.status != ItemStatus.RUNNING:
+                batch._record(item)
+
+    @staticmethod
+    def _collect(item: BatchItem, job) -> None:
+        item.status = {
+            JobStatus.COMPLETED: ItemStatus.COMPLETED,
+            JobStatus.CANCELLED: ItemStatus.CANCELLED,
+        }.get(job.status, ItemStatus.FAILED)
+        message = job.collected().get("message")
+        item.content = clean_text(message) if message is not None else ""
+        errors = [content for chunk_type, content in job.chunks if chunk_type == "error"]
+        if errors:
+            item.error = errors[-1]
+
+batch_runner = BatchRunner()
+invalidation.subscribe(TOPIC_MODELS, batch_runner.invalidate_limits)
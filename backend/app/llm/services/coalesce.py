@@ -0,0 +1,113 @@
+import asyncio
+import time
+from typing import AsyncIterator, Callable, Optional
+
+from core.config import settings
+
+# 可以合并的增量类型
+COALESCE_TYPES = ("think", "message")
+
+async def coalesce_chunks(
+    chunks: AsyncIterator[dict],
+    window_ms: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    on_unflushed: Optional[Callable[[dict], None]] = None
+) -> AsyncIterator[dict]:
+    """
+    合并连续的同类型输出块
+
+    模型每个增量都单独成帧时，高速输出会产生大量很小的 SSE 事件和 socket 写入。
+    这里把连续的同类型（think/message）块合并后再输出：第一个块立即输出以保证首字延迟，
+    之后在类型变化、缓冲达到 max_bytes 或距缓冲开始超过 window_ms 时输出。
+    上游出错时先输出缓冲再抛出异常；消费方被取消时无法再 yield，缓冲交给 on_unflushed。
+
+    Args:
+        chunks: create_chat_completion 产生的输出块
+        window_ms: 合并时间窗口（毫秒），0 表示不合并
+        max_bytes: 缓冲内容达到该字节数时立即输出
+        on_unflushed: 提前结束（取消、关闭）时接收尚未输出的缓冲块
+
+    Yields:
+        Dict[str, Any]: 合并后的输出块
+    """
+    window_ms = settings.SSE_COALESCE_WINDOW_MS if window_ms is None else window_ms
+    max_bytes = settings.SSE_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+
+    iterator = chunks.__aiter__()
+    if window_ms <= 0:
+        async for chunk in iterator:
+            yield chunk
+        return
+
+    window = window_ms / 1000
+    buffer_type: Optional[str] = None
+    buffer: list = []
+    buffer_bytes = 0
+    deadline = 0.0
+    first = True
+    pending: Optional[asyncio.Task] = None
+
+    def flush() -> dict:
+        nonlocal buffer_type, buffer, buffer_bytes
+        chunk = {"type": buffer_type, "content": "".join(buffer)}
+        buffer_type, buffer, buffer_bytes = None, [], 0
+        return chunk
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+            # 有缓冲时最多等到窗口结束，超时先输出缓冲
+            timeout = max(deadline - time.monotonic(), 0) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield flush()
+                continue
+
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if buffer:
+                    yield flush()
+                raise
+
+            chunk_type = chunk.get("type", "message")
+            content = chunk.get("content", "")
+            if first:
+                first = False
+                yield chunk
+                continue
+
+            if buffer and chunk_type != buffer_type:
+                yield flush()
+            # action/observation 等结构化块不合并
+            if chunk_type not in COALESCE_TYPES:
+                yield chunk
+                continue
+            if not buffer:
+                buffer_type = chunk_type
+                deadline = time.monotonic() + window
+            buffer.append(content)
+            buffer_bytes += len(content.encode("utf-8"))
+            if buffer_bytes >= max_bytes:
+                yield flush()
+
+        if buffer:
+            yield flush()
+    finally:
+        if buffer and on_unflushed is not None:
+            on_unflushed(flush())
+        # 客户端断开等提前结束时，停止读取上游并关闭上游流
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,114 @@
+"""多模型对比
+
+`POST /conversations/{id}/compare` 把同一条提示同时发给多个模型：保存一条用户消息，
+为每个模型创建一条助手消息（同级，meta_info 记录 `compare_group` 即用户消息 ID 和 `model_id`），
+各自作为 GenerationJob 并发执行，总耗时取决于最慢的模型而不是各模型之和。
+
+各模型的输出在一个 SSE 连接上按到达顺序交错发送（只支持标准帧协议），每帧带 model_id 和
+message_id 区分：
+- `{"type": "start", "model_id": ..., "message_id": ...}` 每个模型一帧，最先发送
+- `{"type": "message", "content": ..., "model_id": ..., "message_id": ...}` 模型输出
+- `{"type": "end", "content": "completed", "model_id": ..., "message_id": ...}` 该模型结束，content 为任务状态
+- `{"type": "done", "conversation_id": ...}` 所有模型结束
+交错的流没有统一的事件 ID；断线后按各助手消息 ID 通过 `GET /messages/{id}/stream` 分别续传。
+"""
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import settings
+from core.serialization import dumps
+from .conversation_service import ConversationService
+from .generation import (
+    GenerationJob, GenerationRunner, ReplayExpired, generation_runner, query_messages, save_user_query
+)
+from .message import MessageService
+from .model_registry import model_registry
+from .sse import FrameEncoder, sse_event
+from ..models.message import MessageRole
+from ..schemas.message import MessageCreate
+
+async def start_compare(
+    db: AsyncSession,
+    session_factory: async_sessionmaker,
+    conversation_id: str,
+    query: str,
+    model_ids: List[str],
+    runner: Optional[GenerationRunner] = None
+) -> List[GenerationJob]:
+    """保存用户消息和各模型的助手消息并同时启动生成，按 model_ids 顺序返回任务
+
+    会话或模型不存在时抛出 404；返回前关闭 db。
+    """
+    model_ids = list(dict.fromkeys(model_ids))
+    if not model_ids or len(model_ids) > settings.COMPARE_MAX_MODELS:
+        raise HTTPException(status_code=400, detail=f"对比的模型数须在 1 到 {settings.COMPARE_MAX_MODELS} 之间")
+    message_service = MessageService(db)
+    conversation = await ConversationService(db).get_conversation(conversation_id)
+    model_configs = []
+    for model_id in model_ids:
+        model_config = await model_registry.get(db, model_id)
+        if model_config is None:
+            raise HTTPException(status_code=404, detail=f"模型不存在: {model_id}")
+        model_configs.append(model_config)
+
+    user_message = await save_user_query(message_service, conversation, query)
+    # 各模型的助手消息一次插入
+    assistant_messages = await message_service.create_messages([
+        MessageCreate(
+            conversation_id=conversation_id,
+            user_id=conversation.user_id,
+            role=MessageRole.ASSISTANT,
+            meta_info={"compare_group": user_message.id, "model_id": model_id}
+        )
+        for model_id in model_ids
+    ])
+    await db.close()
+
+    runner = runner or generation_runner
+    return [
+        runner.start(GenerationJob(
+            id=message.id,
+            conversation_id=conversation_id,
+            messages=query_messages(conversation_id, message.id, query),
+            model_config=model_config
+        ), session_factory)
+        for message, model_config in zip(assistant_messages, model_configs)
+    ]
+
+async def stream_compare(conversation_id: str, jobs: List[GenerationJob]) -> AsyncIterator[bytes]:
+    """把多个任务的输出交错编码为 SSE 帧；客户端断开只结束订阅，不影响任务"""
+    # 有界：客户端读取慢时各转发任务等待，输出仍留在任务的回放缓冲中
+    queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+    encoders = [
+        FrameEncoder(conversation_id, job.id, extra={"model_id": job.model_config.id})
+        for job in jobs
+    ]
+
+    async def forward(job: GenerationJob, encoder: FrameEncoder) -> None:
+        try:
+            async for _, chunk_type, content in job.subscribe():
+                await queue.put(encoder.frame(chunk_type, content))
+        except ReplayExpired:
+            await queue.put(encoder.error("输出缓冲已过期，请重新加载历史消息"))
+        await queue.put(encoder.frame("end", job.status.value))
+        await queue.put(None)
+
+    for encoder in encoders:
+        yield encoder.frame("start")
+    tasks = [asyncio.create_task(forward(job, encoder)) for job, encoder in zip(jobs, encoders)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            frame = await queue.get()
+            if frame is None:
+                remaining -= 1
+            else:
+                yield frame
+        yield sse_event(dumps({"type": "done", "conversation_id": conversation_id}))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,25 +1,48 @@
 from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 
+from core.change_feed import has_subscribers, record_change
+from core.invalidation import invalidation, TOPIC_CONVERSATIONS
 from ..models import Conversation, Message, MessageItem
 from ..schemas.conversation import (
     ConversationCreate,
     ConversationUpdate,
+    ConversationResponse,
     MessageCreate,
     MessageItemCreate
 )
 
+def _conversation_data(conversation: Conversation) -> dict:
+    return ConversationResponse.model_validate(conversation).model_dump(mode="json")
+
+def record_conversation_stats(db: AsyncSession, conversation_id: str, row) -> None:
+    """根据 UPDATE ... RETURNING (user_id, message_count, last_message_at) 记录会话统计变更"""
+    if row is None:
+        return
+    record_change(db, row.user_id, "conversation", "stats", conversation_id, {
+        "message_count": row.message_count,
+        "last_message_at": row.last_message_at.isoformat() if row.last_message_at else None,
+    })
+
 class ConversationService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
+    def _record(self, conversation: Conversation, action: str) -> None:
+        """记录会话变更，提交后推送给会话所属用户"""
+        if has_subscribers(conversation.user_id):
+            data = _conversation_data(conversation) if action != "deleted" else None
+            record_change(self.db, conversation.user_id, "conversation", action, conversation.id, data)
+
     async def create_conversation(self, data: ConversationCreate) -> Conversation:
         """创建新会话"""
         conversation = Conversation(**data.model_dump())
         self.db.add(conversation)
+        await self.db.flush()
+        self._record(conversation, "created")
         await self.db.commit()
         await self.db.refresh(conversation)
         return conversation
@@ -35,6 +58,22 @@ class ConversationService:
         
         return conversation
 
+    async def get_conversation_version(self, conversation_id: str):
+        """获取会话的版本信息（用于 ETag），不加载关联数据"""
+        stmt = select(
+            Conversation.id,
+            Conversation.updated_at,
+            Conversation.last_message_at,
+            Conversation.message_count
+        ).filter(Conversation.id == conversation_id)
+        result = await self.db.execute(stmt)
+        version = result.one_or_none()
+
+        if not version:
+            raise HTTPException(status_code=404, detail="会话不存在")
+
+        return version
+
     async def list_user_conversations(
         self,
         user_id: str,
@@ -66,6 +105,9 @@ class ConversationService:
         for key, value in update_data.items():
             setattr(conversation, key, value)
         
+        await invalidation.mark_changed(self.db, TOPIC_CONVERSATIONS)
+        await self.db.flush()
+        self._record(conversation, "updated")
         await self.db.commit()
         await self.db.refresh(conversation)
         return conversation
@@ -74,13 +116,23 @@ class ConversationService:
         """删除会话（软删除）"""
         conversation = await self.get_conversation(conversation_id)
         conversation.soft_delete()
+        await invalidation.mark_changed(self.db, TOPIC_CONVERSATIONS)
+        self._record(conversation, "deleted")
         await self.db.commit()
 
-    async def update_conversation_last_message(self, conversation_id: str) -> None:
-        """更新会话的最后消息时间"""
-        conversation = await self.get_conversation(conversation_id)
-        conversation.last_message_at = datetime.utcnow()
-        await self.db.commit()
+    async def update_conversation_last_message(self, conversation_id: str, commit: bool = True) -> None:
+        """更新会话的最后消息时间；commit=False 时由调用方提交"""
+        # 直接 UPDATE，不先查询会话；RETURNING 取回推送变更所需的字段
+        result = await self.db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(last_message_at=datetime.utcnow())
+            .returning(Conversation.user_id, Conversation.message_count, Conversation.last_message_at)
+            .execution_options(synchronize_session=False)
+        )
+        record_conversation_stats(self.db, conversation_id, result.first())
+        if commit:
+            await self.db.commit()
 
 class MessageService:
     def __init__(self, db: AsyncSession):
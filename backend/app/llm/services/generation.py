@@ -0,0 +1,503 @@
+"""后台生成任务
+
+/query 等接口把一次模型调用交给 GenerationRunner 在后台任务中执行，生成不再依赖
+HTTP 连接：客户端断开（网络抖动、刷新页面）后仍会跑完并保存结果。输出块按顺序
+记录在任务中，任意数量的订阅者都可以从头读取并继续接收后续输出块；客户端用任务 ID
+（即助手消息 ID）通过 `GET /messages/{id}/stream` 重新连接。
+
+每个输出块有递增的事件 ID（从 1 开始），重连时带上 `Last-Event-ID` 只接收之后的输出块。
+回放缓冲按任务限制大小（GENERATION_REPLAY_BUFFER_BYTES，超出时丢弃最早的输出块，
+保存结果用的内容另行累计），所有任务合计超过 GENERATION_REPLAY_TOTAL_BYTES 时先淘汰
+最早结束的任务；任务结束后最多保留 GENERATION_JOB_RETENTION_SECONDS 秒。
+缓冲中已没有所需输出块时只能从历史消息读取。
+
+任务可以通过 `POST /messages/{id}/cancel` 取消；所有订阅者断开超过
+GENERATION_DETACHED_CANCEL_SECONDS 秒没有重连时也会自动取消。取消时立即关闭上游流，
+已生成的部分照常保存，助手消息的 meta_info 记为 `{"status": "cancelled"}`。上游结束后
+任务进入保存阶段，此后的取消请求被忽略，内容、消息项和会话统计在同一事务中写入。
+
+任务只保存在发起生成的进程中。多 worker（run.py --workers）时重连、取消和 WebSocket 接入
+只有落在同一 worker 上才能找到任务，其他 worker 返回 404（提示见 missing_job_detail），
+需要这些功能时使用单 worker 或在前面按会话做粘性路由。
+
+任务的开始、输出块和结束同时以 JobEvent 发布到 conversation_hub（按会话 ID），
+同一会话在其他窗口或设备打开时通过 `GET /conversations/{id}/live` 实时接收；
+这些订阅者队列有界，跟不上时被断开，不影响生成和发起请求的客户端。
+"""
+import asyncio
+import logging
+import time
+from enum import Enum
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import settings
+from core.metrics import generation_jobs_running
+from core.pubsub import Hub
+from core.timing import RequestTimings, timed_stream
+from .agent import run_agent
+from .coalesce import coalesce_chunks
+from .conversation_service import ConversationService
+from .llm_service import create_chat_completion
+from .message import MessageService
+from .model_registry import ModelConfig, model_registry
+from .sse import FrameEncoder
+from .tools import ToolRegistry
+from ..models.message import MessageRole, MessageType
+from ..schemas.message import MessageCreate
+from ..schemas.message_item import MessageItemCreate
+
+logger = logging.getLogger(__name__)
+
+# 需要保存为消息项的输出类型
+ITEM_TYPES = ("think", "message", "action", "observation")
+# 连续出现时合为一个消息项的类型
+MERGED_TYPES = ("think", "message")
+
+# (事件 ID, 类型, 内容)
+Chunk = Tuple[int, str, str]
+
+def clean_text(text: str) -> str:
+    """清理文本，去除多余的换行符和空白字符"""
+    # 去除首尾的空白字符
+    text = text.strip()
+    # 将多个连续的换行符替换为单个换行符
+    text = '\n'.join(line.strip() for line in text.split('\n') if line.strip())
+    return text
+
+class JobEvent(NamedTuple):
+    """发布到 conversation_hub 的任务事件：type 为 start、done 或输出块类型"""
+    job_id: str
+    type: str
+    content: Optional[str] = None
+    id: Optional[int] = None
+
+# 按会话 ID 分发任务事件
+conversation_hub = Hub("conversation")
+
+class ReplayExpired(Exception):
+    """请求的输出块已不在回放缓冲中"""
+
+def missing_job_detail() -> str:
+    """本进程中找不到任务时的提示"""
+    if settings.WORKERS > 1:
+        return "生成任务不存在、已过期或在其他 worker 上（多 worker 模式下只能在发起生成的 worker 上重连和取消）"
+    return "生成任务不存在或已过期"
+
+class JobStatus(str, Enum):
+    """生成任务状态"""
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class GenerationJob:
+    """一次模型调用：输出块按顺序记录在回放缓冲中，订阅者各自维护读取位置"""
+
+    def __init__(
+        self,
+        id: str,
+        conversation_id: str,
+        messages: List[dict],
+        model_config: Optional[ModelConfig] = None,
+        buffer_bytes: Optional[int] = None,
+        detached_timeout: Optional[float] = None,
+        tools: Optional[ToolRegistry] = None
+    ):
+        self.id = id
+        self.conversation_id = conversation_id
+        self.messages = messages
+        self.model_config = model_config
+        self.buffer_bytes = settings.GENERATION_REPLAY_BUFFER_BYTES if buffer_bytes is None else buffer_bytes
+        # 回放缓冲：chunks[i] 的事件 ID 为 first_id + i
+        self.chunks: List[Tuple[str, str]] = []
+        self.first_id = 1
+        self.size = 0
+        self.detached_timeout = (
+            settings.GENERATION_DETACHED_CANCEL_SECONDS if detached_timeout is None else detached_timeout
+        )
+        self.status = JobStatus.RUNNING
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        # 上游结束后进入保存阶段，此后不再响应取消
+        self.saving = False
+        self._detached_handle: Optional[asyncio.TimerHandle] = None
+        self.tools = tools
+        # 需要保存的内容按输出顺序分段：连续的 think / message 合为一段，action / observation 每块一段
+        self._segments: List[Tuple[str, List[str]]] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status != JobStatus.RUNNING
+
+    @property
+    def last_id(self) -> int:
+        """最后一个输出块的事件 ID，还没有输出时为 0"""
+        return self.first_id + len(self.chunks) - 1
+
+    def append(self, chunk_type: str, content: str) -> None:
+        if chunk_type in ITEM_TYPES:
+            if chunk_type in MERGED_TYPES and self._segments and self._segments[-1][0] == chunk_type:
+                self._segments[-1][1].append(content)
+            else:
+                self._segments.append((chunk_type, [content]))
+        self.chunks.append((chunk_type, content))
+        self.size += len(content.encode())
+        if self.size > self.buffer_bytes:
+            self._trim(self.buffer_bytes)
+        self._notify()
+        conversation_hub.publish(self.conversation_id, JobEvent(self.id, chunk_type, content, self.last_id))
+
+    def _trim(self, limit: int) -> None:
+        """丢弃最早的输出块直到缓冲不超过 limit（至少保留最后一块）"""
+        dropped = 0
+        while self.size > limit and dropped < len(self.chunks) - 1:
+            self.size -= len(self.chunks[dropped][1].encode())
+            dropped += 1
+        del self.chunks[:dropped]
+        self.first_id += dropped
+
+    def can_resume(self, last_event_id: int) -> bool:
+        """last_event_id 之后的输出块是否都还在缓冲中"""
+        return self.first_id <= last_event_id + 1
+
+    def finish(self, status: JobStatus) -> None:
+        if not self.finished:
+            generation_jobs_running.dec()
+        self.status = status
+        self.finished_at = time.monotonic()
+        if self._detached_handle is not None:
+            self._detached_handle.cancel()
+        self._notify()
+        conversation_hub.publish(self.conversation_id, JobEvent(self.id, "done", status.value))
+
+    def cancel(self) -> bool:
+        """取消进行中的任务，已结束或正在保存结果时返回 False"""
+        if self.finished or self.saving or self.task is None or self.task.done():
+            return False
+        return self.task.cancel()
+
+    async def wait(self) -> None:
+        """等待任务结束（包括保存结果）"""
+        if self.task is not None:
+            await asyncio.wait({self.task})
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        # 任务在开始执行前就被取消时 _run 不会运行，这里补上结束状态
+        if not self.finished:
+            self.finish(JobStatus.CANCELLED)
+
+    def _attach(self) -> None:
+        self.subscribers += 1
+        if self._detached_handle is not None:
+            self._detached_handle.cancel()
+            self._detached_handle = None
+
+    def _detach(self) -> None:
+        self.subscribers -= 1
+        # 最后一个订阅者断开后等待一段时间，期间没有重连则取消
+        if self.subscribers == 0 and not self.finished and self.detached_timeout > 0:
+            self._detached_handle = asyncio.get_running_loop().call_later(self.detached_timeout, self.cancel)
+
+    def _notify(self) -> None:
+        # 唤醒所有等待者，之后的等待使用新的 Event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self, last_event_id: int = 0) -> AsyncIterator[Chunk]:
+        """读取事件 ID 大于 last_event_id 的输出块，任务结束且读完后停止
+
+        订阅者落后太多、所需输出块已被丢弃时抛出 ReplayExpired。
+        """
+        next_id = last_event_id + 1
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                while next_id <= self.last_id:
+                    if next_id < self.first_id:
+                        raise ReplayExpired(self.id)
+                    chunk_type, content = self.chunks[next_id - self.first_id]
+                    yield next_id, chunk_type, content
+                    next_id += 1
+                if self.finished:
+                    return
+                await changed.wait()
+        finally:
+            self._detach()
+
+    def collected(self) -> Dict[str, str]:
+        """按类型拼接的完整输出内容（不受回放缓冲大小限制）"""
+        contents: Dict[str, List[str]] = {}
+        for chunk_type, parts in self._segments:
+            contents.setdefault(chunk_type, []).extend(parts)
+        return {t: "".join(contents[t]) for t in ITEM_TYPES if t in contents}
+
+    def items(self) -> List[Tuple[str, str]]:
+        """按输出顺序的 (类型, 内容) 分段，保存为消息项"""
+        return [(chunk_type, "".join(parts)) for chunk_type, parts in self._segments]
+
+class GenerationRunner:
+    """在后台任务中执行生成并保存结果"""
+
+    def __init__(self, retention: Optional[float] = None, total_bytes: Optional[int] = None):
+        self.retention = settings.GENERATION_JOB_RETENTION_SECONDS if retention is None else retention
+        self.total_bytes = settings.GENERATION_REPLAY_TOTAL_BYTES if total_bytes is None else total_bytes
+        self._jobs: Dict[str, GenerationJob] = {}
+
+    def get(self, job_id: str) -> Optional[GenerationJob]:
+        self._evict()
+        return self._jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[GenerationJob]:
+        """取消任务并等待已生成部分保存完成，任务不存在时返回 None"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel()
+        await job.wait()
+        return job
+
+    def start(self, job: GenerationJob, session_factory: async_sessionmaker) -> GenerationJob:
+        """启动任务；任务在当前上下文的副本中运行，耗时仍计入发起请求的 RequestTimings"""
+        self._evict()
+        self._jobs[job.id] = job
+        generation_jobs_running.inc()
+        job.task = asyncio.create_task(self._run(job, session_factory), name=f"generation-{job.id}")
+        job.task.add_done_callback(job._on_task_done)
+        conversation_hub.publish(job.conversation_id, JobEvent(job.id, "start"))
+        return job
+
+    def running(self, conversation_id: str) -> List[GenerationJob]:
+        """会话中进行中的任务"""
+        return [
+            job for job in self._jobs.values()
+            if job.conversation_id == conversation_id and not job.finished
+        ]
+
+    async def shutdown(self, timeout: float = 5.0) -> None:
+        """等待运行中的任务结束，超时后取消"""
+        tasks = [job.task for job in self._jobs.values() if job.task and not job.task.done()]
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def _evict(self) -> None:
+        """淘汰超过保留时间的已结束任务，总缓冲超限时再按结束时间从早到晚淘汰"""
+        deadline = time.monotonic() - self.retention
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished_at is not None),
+            key=lambda job: job.finished_at
+        )
+        total = sum(job.size for job in self._jobs.values())
+        for job in finished:
+            if job.finished_at >= deadline and total <= self.total_bytes:
+                break
+            total -= job.size
+            del self._jobs[job.id]
+
+    async def _run(self, job: GenerationJob, session_factory: async_sessionmaker) -> None:
+        status = JobStatus.COMPLETED
+        try:
+            if job.tools is not None:
+                # 工具调用循环自行记录每次模型调用的耗时
+                source = run_agent(job.messages, job.tools, job.model_config)
+            else:
+                model_name = job.model_config.model_name if job.model_config else "default"
+                source = timed_stream(create_chat_completion(
+                    messages=job.messages,
+                    model_config=job.model_config,
+                    stream=True
+                ), model=model_name)
+            # 取消时合并缓冲中尚未输出的内容也记入结果
+            async for chunk in coalesce_chunks(source, on_unflushed=lambda chunk: self._append(job, chunk)):
+                self._append(job, chunk)
+        except asyncio.CancelledError:
+            # 取消已在各层生成器的 finally 中关闭上游流，这里只需保存已生成的部分
+            logger.info("生成任务 %s 已取消", job.id)
+            status = JobStatus.CANCELLED
+        except Exception as e:
+            logger.exception("生成任务 %s 出错", job.id)
+            job.append("error", f"发生错误: {str(e)}")
+            status = JobStatus.FAILED
+
+        # 出错或取消时也保存已生成的部分；保存期间不可取消，避免只保存了一部分
+        job.saving = True
+        save = asyncio.ensure_future(self._persist(job, session_factory, status))
+        while not save.done():
+            try:
+                await asyncio.shield(save)
+            except asyncio.CancelledError:
+                # 关闭进程时任务被直接取消，等保存完成再结束
+                asyncio.current_task().uncancel()
+            except Exception:
+                break
+        if save.exception() is not None:
+            logger.error("保存生成任务 %s 的结果失败", job.id, exc_info=save.exception())
+            status = JobStatus.FAILED
+        job.finish(status)
+
+    @staticmethod
+    def _append(job: GenerationJob, chunk: dict) -> None:
+        if chunk:
+            job.append(chunk.get("type", "message"), chunk.get("content", ""))
+
+    async def _persist(
+        self,
+        job: GenerationJob,
+        session_factory: async_sessionmaker,
+        status: JobStatus = JobStatus.COMPLETED
+    ) -> None:
+        """用短会话在一个事务中保存各类型的输出内容并更新会话统计"""
+        collected = job.collected()
+        message = collected.get("message")
+        meta_info = {"status": status.value} if status == JobStatus.CANCELLED else None
+        async with session_factory() as session:
+            message_service = MessageService(session)
+            # 更新助手消息的内容，取消时同时记录状态
+            if message is not None or meta_info is not None:
+                await message_service.update_message_content(
+                    job.id, clean_text(message) if message is not None else "", meta_info, commit=False
+                )
+            items = [
+                MessageItemCreate(
+                    message_id=job.id,
+                    conversation_id=job.conversation_id,
+                    content=clean_text(content),
+                    type=item_type,
+                    order=order
+                )
+                for order, (item_type, content) in enumerate(job.items())
+            ]
+            if items:
+                await message_service.create_message_items(items, commit=False)
+            # 更新会话的最后消息时间
+            await ConversationService(session).update_conversation_last_message(job.conversation_id, commit=False)
+            await session.commit()
+
+async def save_user_query(message_service: MessageService, conversation, query: str):
+    """保存用户消息及其消息项"""
+    user_message = await message_service.create_message(MessageCreate(
+        conversation_id=conversation.id,
+        user_id=conversation.user_id,
+        content=query,
+        role=MessageRole.USER
+    ))
+    await message_service.create_message_item(MessageItemCreate(
+        message_id=user_message.id,
+        conversation_id=conversation.id,
+        content=clean_text(query),
+        type="message"
+    ))
+    return user_message
+
+def query_messages(conversation_id: str, message_id: str, query: str) -> List[dict]:
+    """发送给模型的消息列表"""
+    return [{
+        "role": MessageRole.USER.value,
+        "content": query,
+        "conversation_id": conversation_id,
+        "message_id": message_id,
+        "type": MessageType.TEXT.value
+    }]
+
+async def start_query(
+    db: AsyncSession,
+    session_factory: async_sessionmaker,
+    conversation_id: str,
+    query: str,
+    runner: Optional[GenerationRunner] = None,
+    tools: Optional[ToolRegistry] = None,
+    detached_timeout: Optional[float] = None
+) -> GenerationJob:
+    """保存用户消息和助手消息并启动生成，会话不存在时抛出 404
+
+    指定 tools 时执行工具调用循环（见 services/agent.py）。detached_timeout 见 GenerationJob，
+    为 0 时客户端断开不自动取消。
+
+    返回前关闭 db 归还连接，流式输出可能持续数分钟；结果由任务用 session_factory 另开短会话保存。
+    """
+    message_service = MessageService(db)
+    conversation = await ConversationService(db).get_conversation(conversation_id)
+    # 模型配置从进程内缓存读取
+    model_config = await model_registry.get(db, conversation.model_id)
+
+    # 创建用户消息及其消息项
+    await save_user_query(message_service, conversation, query)
+
+    # 创建助手消息，生成结果写入该消息
+    assistant_message = await message_service.create_message(MessageCreate(
+        conversation_id=conversation_id,
+        user_id=conversation.user_id,
+        role=MessageRole.ASSISTANT
+    ))
+    await db.close()
+
+    return (runner or generation_runner).start(GenerationJob(
+        id=assistant_message.id,
+        conversation_id=conversation_id,
+        messages=query_messages(conversation_id, assistant_message.id, query),
+        model_config=model_config,  # 使用会话绑定的模型
+        tools=tools,
+        detached_timeout=detached_timeout
+    ), session_factory)
+
+async def stream_job(
+    job: GenerationJob,
+    encoder: FrameEncoder,
+    timings: Optional[RequestTimings] = None,
+    last_event_id: int = 0
+) -> AsyncIterator[bytes]:
+    """把任务输出编码为 SSE 帧；客户端断开只结束订阅，不影响任务"""
+    header = encoder.start()
+    if header:
+        yield header
+    try:
+        async for event_id, chunk_type, content in job.subscribe(last_event_id):
+            yield encoder.frame(chunk_type, content, id=event_id)
+    except ReplayExpired:
+        yield encoder.error("输出缓冲已过期，请重新加载历史消息")
+    if timings:
+        yield encoder.stats(timings.as_dict())
+    yield encoder.done()
+
+async def stream_conversation(
+    conversation_id: str,
+    runner: Optional[GenerationRunner] = None
+) -> AsyncIterator[bytes]:
+    """实时转发会话中所有生成的 SSE 帧（标准协议，帧中的 message_id 区分不同生成）
+
+    先订阅再补发进行中任务缓冲里的输出，之后跳过已补发的事件，保证不重不漏。
+    订阅者跟不上被断开时发送 error 帧后结束，客户端可按消息 ID 和 Last-Event-ID 补齐。
+    """
+    runner = runner or generation_runner
+    async with conversation_hub.subscribe(conversation_id) as subscription:
+        # 订阅后立即取快照，补发期间的新事件在订阅队列中
+        snapshots = [(job.id, job.first_id, list(job.chunks)) for job in runner.running(conversation_id)]
+        replayed = {job_id: first_id + len(chunks) - 1 for job_id, first_id, chunks in snapshots}
+        for job_id, first_id, chunks in snapshots:
+            encoder = FrameEncoder(conversation_id, job_id)
+            yield encoder.frame("start")
+            for offset, (chunk_type, content) in enumerate(chunks):
+                yield encoder.frame(chunk_type, content, id=first_id + offset)
+
+        async for event in subscription:
+            if event.id is not None and event.id <= replayed.get(event.job_id, 0):
+                continue
+            encoder = FrameEncoder(conversation_id, event.job_id)
+            if event.type == "done":
+                yield encoder.done()
+            elif event.type == "start":
+                yield encoder.frame("start")
+            else:
+                yield encoder.frame(event.type, event.content, id=event.id)
+        if subscription.dropped:
+            yield FrameEncoder(conversation_id, "").error("接收过慢，已断开实时订阅")
+
+generation_runner = GenerationRunner()
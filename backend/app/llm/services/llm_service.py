@@ -1,53 +1,75 @@
-from typing import Generator, Optional
-from openai import AsyncOpenAI
+import os
+from typing import TYPE_CHECKING, AsyncGenerator, Optional
 from fastapi import HTTPException
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 from core.config import get_settings
-from ..models.model import LLMModel
+from .model_registry import ModelConfig
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 settings = get_settings()
 
-def create_llm_client(model_config: LLMModel) -> AsyncOpenAI:
+# openai 与 tenacity 导入较慢，只在真正调用模型时才加载
+
+def create_llm_client(model_config: ModelConfig) -> "AsyncOpenAI":
     """
     根据模型配置创建LLM客户端
-    
+
     Args:
         model_config: LLM模型配置
-        
+
     Returns:
         AsyncOpenAI: OpenAI客户端实例
     """
+    from openai import AsyncOpenAI
+
     return AsyncOpenAI(
         api_key=model_config.api_key,
         base_url=model_config.base_url or os.getenv('DEFAULT_BASE_URI'),
     )
 
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=4, max=10)
-)
+def _to_openai_message(msg: dict) -> dict:
+    """只保留接口需要的字段；工具调用轮次的消息带 tool_calls / tool_call_id"""
+    message = {
+        "role": msg.get("role", "user"),
+        "content": msg.get("content", "")
+    }
+    for key in ("tool_calls", "tool_call_id"):
+        if msg.get(key):
+            message[key] = msg[key]
+    return message
+
 async def create_chat_completion(
     messages: list,
-    model_config: Optional[LLMModel] = None,
+    model_config: Optional[ModelConfig] = None,
     temperature: Optional[float] = None,
-    stream: bool = True
-) -> Generator[dict, None, None]:
+    stream: bool = True,
+    tools: Optional[list] = None
+) -> AsyncGenerator[dict, None]:
     """
     创建聊天完成并支持流式输出
-    
+
     Args:
         messages: 消息列表
         model_config: LLM模型配置，如果为None则使用默认配置
         temperature: 温度参数，如果为None则使用模型默认值
         stream: 是否使用流式输出
-        
+        tools: 可供模型调用的工具定义（OpenAI function 格式）
+
     Yields:
-        Dict[str, Any]: 包含类型和内容的字典
+        Dict[str, Any]: 包含类型和内容的字典；工具调用为 `{"type": "tool_call", "index", "id", "name", "arguments"}`，
+        同一 index 的多个块需要拼接 arguments
     """
+    from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
+
+    client = None
+    response = None
     try:
         # 如果没有提供模型配置，使用默认配置
         if model_config is None:
+            from openai import AsyncOpenAI
+
             client = AsyncOpenAI(
                 api_key=settings.OPENAI_API_KEY,
                 base_url=settings.OPENAI_API_BASE,
@@ -58,17 +80,22 @@ async def create_chat_completion(
             client = create_llm_client(model_config)
             model_name = model_config.model_name
             temperature = temperature or model_config.default_temperature
-        
-        response = await client.chat.completions.create(
-            model=model_name,
-            messages=[{
-                "role": msg.get("role", "user"),
-                "content": msg.get("content", "")
-            } for msg in messages],
-            temperature=temperature,
-            stream=stream
-        )
-        
+
+        # 只对建立请求进行重试，已经开始输出的流不再重试
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(3),
+            wait=wait_exponential(multiplier=1, min=4, max=10),
+            reraise=True
+        ):
+            with attempt:
+                response = await client.chat.completions.create(
+                    model=model_name,
+                    messages=[_to_openai_message(msg) for msg in messages],
+                    temperature=temperature,
+                    stream=stream,
+                    **({"tools": tools} if tools else {})
+                )
+
         if stream:
             async for chunk in response:
                 if chunk and chunk.choices and chunk.choices[0].delta:
@@ -85,12 +112,37 @@ async def create_chat_completion(
                             "type": "message",
                             "content": delta.content
                         }
+                    # 处理工具调用（参数分多个块到达）
+                    for call in getattr(delta, "tool_calls", None) or ():
+                        yield {
+                            "type": "tool_call",
+                            "index": call.index,
+                            "id": call.id,
+                            "name": call.function.name if call.function else None,
+                            "arguments": (call.function.arguments if call.function else None) or ""
+                        }
         else:
             if response.choices and response.choices[0].message:
-                yield {
-                    "type": "message",
-                    "content": response.choices[0].message.content
-                }
-                
+                message = response.choices[0].message
+                if message.content:
+                    yield {
+                        "type": "message",
+                        "content": message.content
+                    }
+                for index, call in enumerate(message.tool_calls or ()):
+                    yield {
+                        "type": "tool_call",
+                        "index": index,
+                        "id": call.id,
+                        "name": call.function.name,
+                        "arguments": call.function.arguments or ""
+                    }
+
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # 取消或提前关闭时立即释放上游连接，不等生成器被回收
+        if stream and response is not None:
+            await response.close()
+        if client is not None:
+            await client.close()
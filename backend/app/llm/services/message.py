@@ -1,31 +1,92 @@
+from datetime import datetime
 from typing import List, Optional
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
+from core.change_feed import record_change
+from app.llm.models.conversation import Conversation
 from app.llm.models.message import Message
 from app.llm.models.message_item import MessageItem
 from app.llm.schemas.message import MessageCreate, MessageResponse
 from app.llm.schemas.message_item import MessageItemCreate, MessageItemResponse
+from app.llm.services.conversation_service import record_conversation_stats
 
 class MessageService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
     async def create_message(self, message: MessageCreate) -> Message:
-        db_message = Message(**message.model_dump())
-        self.db.add(db_message)
+        db_message, = await self._add_messages([message])
         await self.db.commit()
         await self.db.refresh(db_message)
         return db_message
 
+    async def create_messages(self, messages: List[MessageCreate]) -> List[Message]:
+        """在同一会话中一次创建多条消息（一条 INSERT 和一条会话统计 UPDATE），不重新加载"""
+        db_messages = await self._add_messages(messages)
+        await self.db.commit()
+        return db_messages
+
+    async def _add_messages(self, messages: List[MessageCreate]) -> List[Message]:
+        conversation_id = messages[0].conversation_id
+        db_messages = [Message(**message.model_dump()) for message in messages]
+        self.db.add_all(db_messages)
+        # 同步会话统计，会话的 ETag 由这些字段生成（执行前自动 flush 插入消息）
+        result = await self.db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(
+                message_count=Conversation.message_count + len(db_messages),
+                last_message_at=datetime.utcnow()
+            )
+            .returning(Conversation.user_id, Conversation.message_count, Conversation.last_message_at)
+            .execution_options(synchronize_session=False)
+        )
+        stats = result.first()
+        if stats is not None:
+            for db_message in db_messages:
+                record_change(self.db, stats.user_id, "message", "created", db_message.id, {
+                    "conversation_id": db_message.conversation_id,
+                    "role": db_message.role.value,
+                })
+        record_conversation_stats(self.db, conversation_id, stats)
+        return db_messages
+
     async def update_message(self, message: Message) -> Message:
         """更新消息内容"""
         self.db.add(message)  # 确保消息被添加到会话中
+        # 提交后属性不过期，updated_at 在 flush 时已写入对象，无需再 refresh
         await self.db.commit()
-        await self.db.refresh(message)
         return message
 
+    async def update_message_content(
+        self,
+        message_id: str,
+        content: Optional[str],
+        meta_info: Optional[dict] = None,
+        commit: bool = True
+    ) -> None:
+        """只更新消息内容（和元数据），不加载消息；commit=False 时由调用方提交"""
+        values = {"content": content}
+        if meta_info is not None:
+            values["meta_info"] = meta_info
+        result = await self.db.execute(
+            update(Message)
+            .where(Message.id == message_id)
+            .values(**values)
+            .returning(Message.user_id, Message.conversation_id)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.first()
+        if row is not None:
+            record_change(self.db, row.user_id, "message", "updated", message_id, {
+                "conversation_id": row.conversation_id,
+                "meta_info": meta_info,
+            })
+        if commit:
+            await self.db.commit()
+
     async def create_message_item(self, item: MessageItemCreate) -> MessageItem:
         """创建消息区块节点"""
         db_item = MessageItem(**item.model_dump())
@@ -34,6 +95,14 @@ class MessageService:
         await self.db.refresh(db_item)
         return db_item
 
+    async def create_message_items(self, items: List[MessageItemCreate], commit: bool = True) -> List[MessageItem]:
+        """一次创建多个消息区块节点，不重新加载；commit=False 时由调用方提交"""
+        db_items = [MessageItem(**item.model_dump()) for item in items]
+        self.db.add_all(db_items)
+        if commit:
+            await self.db.commit()
+        return db_items
+
     async def get_message(self, message_id: str) -> Optional[Message]:
         """获取消息"""
         result = await self.db.execute(
@@ -51,7 +120,8 @@ class MessageService:
             .filter(Message.conversation_id == conversation_id)
             .order_by(Message.created_at)
         )
-        return list(result.scalars().all())
+        # message_items 为联表加载的集合，需要按主键去重
+        return list(result.unique().scalars().all())
 
     async def get_conversation_messages_with_items(self, conversation_id: str) -> List[Message]:
         """获取会话的所有消息及其关联的message_items"""
@@ -81,6 +151,9 @@ class MessageService:
         message = await self.get_message(message_id)
         if message:
             await self.db.delete(message)
+            record_change(self.db, message.user_id, "message", "deleted", message_id, {
+                "conversation_id": message.conversation_id,
+            })
             await self.db.commit()
             return True
         return False 
\ No newline at end of file
@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
 from core.exceptions import NotFoundException, ValidationError
+from core.invalidation import invalidation, TOPIC_MODELS
 from ..schemas.model import LLMModelCreate, LLMModelUpdate
 from ..models import Conversation, Message, LLMModel
 
@@ -36,6 +37,7 @@ class LLMModelService:
         # 创建模型
         model = LLMModel(**data.model_dump())
         self.session.add(model)
+        await invalidation.mark_changed(self.session, TOPIC_MODELS)
         await self.session.commit()
         return model
 
@@ -79,6 +81,7 @@ class LLMModelService:
         for key, value in update_data.items():
             setattr(model, key, value)
             
+        await invalidation.mark_changed(self.session, TOPIC_MODELS)
         await self.session.commit()
         return model
 
@@ -86,17 +89,16 @@ class LLMModelService:
         model = await self.get(model_id)
         # 检查是否有关联的会话
         conversation_count = await self.session.scalar(
-            select(func.count()).select_from(
-                select(LLMModel)
-                .join(LLMModel.conversations)
-                .filter(LLMModel.id == model_id)
-                .subquery()
+            select(func.count(Conversation.id)).filter(
+                Conversation.model_id == model_id,
+                Conversation.is_deleted == False
             )
         )
         if conversation_count > 0:
             raise ValidationError(f"Cannot delete model {model_id} as it has {conversation_count} associated conversations")
         
         await self.session.delete(model)
+        await invalidation.mark_changed(self.session, TOPIC_MODELS)
         await self.session.commit()
 
     async def update_token_usage(self, model_id: str, tokens: int) -> None:
@@ -0,0 +1,132 @@
+"""进程内模型配置缓存
+
+模型表只有少量行且很少变化，启动时整体加载到内存（API 密钥解密后保存），
+查询路径和 `/models` 列表直接读取缓存。模型的增删改通过 `invalidation.mark_changed`
+发布 TOPIC_MODELS，提交后（其他 worker 在轮询到变化后）清空缓存，下次访问时重新加载。
+"""
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.invalidation import invalidation, TOPIC_MODELS
+from core.metrics import cache_requests
+from ..models.model import LLMModel
+
+@dataclass(frozen=True)
+class ModelConfig:
+    """模型配置快照，与 LLMModel 字段一致（api_key 为明文）"""
+    id: str
+    name: str
+    type: str
+    model_name: str
+    api_key: str
+    created_at: datetime
+    updated_at: datetime
+    description: Optional[str] = None
+    base_url: Optional[str] = None
+    default_temperature: float = 0.7
+    default_max_tokens: Optional[int] = None
+    default_system_prompt: Optional[str] = None
+    is_active: bool = True
+    priority: int = 0
+    total_tokens_used: int = 0
+    daily_token_limit: Optional[int] = None
+    meta_info: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_model(cls, model: LLMModel) -> "ModelConfig":
+        return cls(
+            id=model.id,
+            name=model.name,
+            type=model.type,
+            model_name=model.model_name,
+            api_key=model.api_key,
+            created_at=model.created_at,
+            updated_at=model.updated_at,
+            description=model.description,
+            base_url=model.base_url,
+            default_temperature=model.default_temperature,
+            default_max_tokens=model.default_max_tokens,
+            default_system_prompt=model.default_system_prompt,
+            is_active=model.is_active,
+            priority=model.priority,
+            total_tokens_used=model.total_tokens_used,
+            daily_token_limit=model.daily_token_limit,
+            meta_info=model.meta_info or {},
+        )
+
+class ModelRegistry:
+    """模型配置缓存"""
+
+    def __init__(self):
+        self._models: Dict[str, ModelConfig] = {}
+        self._loaded = False
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def invalidate(self, topic: str = TOPIC_MODELS) -> None:
+        """清空缓存（invalidation 回调）"""
+        self._models = {}
+        self._loaded = False
+        self._generation += 1
+
+    async def load(self, session: AsyncSession) -> List[ModelConfig]:
+        """从数据库加载全部模型配置"""
+        generation = self._generation
+        result = await session.execute(select(LLMModel).filter(LLMModel.is_deleted == False))
+        models = {m.id: ModelConfig.from_model(m) for m in result.scalars().all()}
+        # 加载期间收到失效通知时，结果可能已过期，不写入缓存
+        if generation == self._generation:
+            self._models = models
+            self._loaded = True
+        return list(models.values())
+
+    async def _ensure_loaded(self, session: AsyncSession) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                await self.load(session)
+
+    async def get(self, session: AsyncSession, model_id: str) -> Optional[ModelConfig]:
+        """获取模型配置；缓存中没有时回查数据库（例如其他连接刚写入的行）"""
+        cached = self._loaded
+        await self._ensure_loaded(session)
+        config = self._models.get(model_id)
+        cache_requests.inc(cache="model_registry", result="hit" if cached and config else "miss")
+        if config is None:
+            model = await session.get(LLMModel, model_id)
+            if model is None or model.is_deleted:
+                return None
+            config = ModelConfig.from_model(model)
+            self._models[model_id] = config
+        return config
+
+    async def list(
+        self,
+        session: AsyncSession,
+        skip: int = 0,
+        limit: int = 10,
+        type: Optional[str] = None,
+        is_active: Optional[bool] = None
+    ) -> Tuple[List[ModelConfig], int]:
+        """按与 LLMModelService.list 相同的过滤和排序返回分页结果及总数"""
+        cache_requests.inc(cache="model_registry", result="hit" if self._loaded else "miss")
+        await self._ensure_loaded(session)
+        models = [
+            m for m in self._models.values()
+            if (not type or m.type == type) and (is_active is None or m.is_active == is_active)
+        ]
+        models.sort(key=lambda m: (m.priority, m.created_at), reverse=True)
+        return models[skip:skip + limit], len(models)
+
+model_registry = ModelRegistry()
+invalidation.subscribe(TOPIC_MODELS, model_registry.invalidate)
@@ -0,0 +1,223 @@
+"""WebSocket 多路复用
+
+一个 WebSocket 连接上同时运行多路生成流，避免每个并发对话各占一条 SSE 连接
+（浏览器对同一来源的并发连接数有限制）。消息均为 JSON 文本。
+
+客户端 → 服务端，`stream` 为客户端自定的流 ID：
+- `{"op": "start", "stream": "s1", "conversation_id": ..., "query": ...}` 发送查询并接收输出
+- `{"op": "attach", "stream": "s2", "message_id": ..., "last_event_id": 0}` 接入进行中的生成
+- `{"op": "credit", "stream": "s1", "credit": 32}` 追加可接收的帧数
+- `{"op": "cancel", "stream": "s1"}` 停止生成（已生成部分照常保存）
+- `{"op": "detach", "stream": "s1"}` 只停止接收，生成继续
+
+服务端 → 客户端：
+- `{"stream": "s1", "type": "meta", "conversation_id": ..., "message_id": ...}`
+- `{"stream": "s1", "type": "message", "id": 1, "content": ...}` 模型输出，id 同 SSE 事件 ID
+- `{"stream": "s1", "type": "done", "status": "completed"}`
+- `{"stream": "s1", "type": "error", "content": ...}` 请求无效或生成出错
+
+流控：每路流初始有 WS_STREAM_WINDOW 帧额度，每发送一个输出帧减一，额度用完后暂停该路
+（生成本身不受影响，输出留在回放缓冲中），直到客户端发送 credit。其他流不受影响。
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from core.config import settings
+from core.serialization import dumps_str
+from .generation import (
+    GenerationJob, GenerationRunner, ReplayExpired, generation_runner, missing_job_detail, start_query
+)
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - 取决于安装环境
+    import json
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+class _Stream:
+    """一路生成流的转发状态"""
+
+    def __init__(self, id: str, job: GenerationJob, credit: int, last_event_id: int = 0):
+        self.id = id
+        self.job = job
+        self.credit = credit
+        self.last_event_id = last_event_id
+        self.task: Optional[asyncio.Task] = None
+        self._granted = asyncio.Event()
+
+    def grant(self, credit: int) -> None:
+        self.credit += credit
+        self._granted.set()
+
+    async def acquire(self) -> None:
+        while self.credit <= 0:
+            self._granted.clear()
+            await self._granted.wait()
+        self.credit -= 1
+
+class StreamMultiplexer:
+    """处理一个 WebSocket 连接上的多路生成流"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        session_factory: async_sessionmaker,
+        window: Optional[int] = None,
+        max_streams: Optional[int] = None,
+        runner: Optional[GenerationRunner] = None
+    ):
+        self.websocket = websocket
+        self.session_factory = session_factory
+        self.window = settings.WS_STREAM_WINDOW if window is None else window
+        self.max_streams = settings.WS_MAX_STREAMS if max_streams is None else max_streams
+        self.runner = runner or generation_runner
+        self.streams: Dict[str, _Stream] = {}
+        # 所有流的帧经由同一个写任务发送，队列满时各流的转发任务等待
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=256)
+        self._receiver: Optional[asyncio.Task] = None
+        self._send_failed = False
+        self._closing = False
+
+    async def run(self) -> None:
+        await self.websocket.accept()
+        self._receiver = asyncio.current_task()
+        writer = asyncio.create_task(self._write())
+        try:
+            await self._receive()
+        except asyncio.CancelledError:
+            # 写任务发送失败时取消接收循环，其他取消照常传播
+            if not self._send_failed:
+                raise
+            self._receiver.uncancel()
+        finally:
+            self._closing = True
+            # 连接断开只停止转发，生成任务按断开超时的规则处理
+            tasks = [stream.task for stream in self.streams.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+
+    async def _receive(self) -> None:
+        while True:
+            try:
+                message = _loads(await self.websocket.receive_text())
+            except WebSocketDisconnect:
+                return
+            except ValueError:
+                await self._send(None, type="error", content="消息不是有效的 JSON")
+                continue
+            await self._handle(message)
+
+    async def _handle(self, message: dict) -> None:
+        op = message.get("op") if isinstance(message, dict) else None
+        stream_id = message.get("stream") if isinstance(message, dict) else None
+        if not isinstance(stream_id, str) or not stream_id:
+            await self._send(None, type="error", content="缺少 stream")
+            return
+
+        if op in ("start", "attach"):
+            if stream_id in self.streams:
+                await self._send(stream_id, type="error", content="stream 已存在")
+                return
+            if len(self.streams) >= self.max_streams:
+                await self._send(stream_id, type="error", content=f"同时进行的流不能超过 {self.max_streams} 个")
+                return
+            if op == "start":
+                await self._start(stream_id, message)
+            else:
+                await self._attach(stream_id, message)
+            return
+
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            await self._send(stream_id, type="error", content="stream 不存在")
+        elif op == "credit":
+            credit = message.get("credit")
+            if isinstance(credit, int) and credit > 0:
+                stream.grant(credit)
+        elif op == "cancel":
+            # 取消后转发任务照常发送剩余输出和 done
+            stream.job.cancel()
+        elif op == "detach":
+            stream.task.cancel()
+        else:
+            await self._send(stream_id, type="error", content=f"未知操作: {op}")
+
+    async def _start(self, stream_id: str, message: dict) -> None:
+        conversation_id = message.get("conversation_id")
+        query = message.get("query")
+        if not isinstance(conversation_id, str) or not isinstance(query, str):
+            await self._send(stream_id, type="error", content="start 需要 conversation_id 和 query")
+            return
+        try:
+            async with self.session_factory() as db:
+                job = await start_query(db, self.session_factory, conversation_id, query, self.runner)
+        except HTTPException as e:
+            await self._send(stream_id, type="error", content=e.detail)
+            return
+        self._open(stream_id, job)
+
+    async def _attach(self, stream_id: str, message: dict) -> None:
+        job = self.runner.get(message.get("message_id") or "")
+        last_event_id = message.get("last_event_id") or 0
+        if job is None:
+            await self._send(stream_id, type="error", content=missing_job_detail())
+        elif not isinstance(last_event_id, int) or not job.can_resume(last_event_id):
+            await self._send(stream_id, type="error", content="输出缓冲已过期，请重新加载历史消息")
+        else:
+            self._open(stream_id, job, last_event_id)
+
+    def _open(self, stream_id: str, job: GenerationJob, last_event_id: int = 0) -> None:
+        stream = _Stream(stream_id, job, self.window, last_event_id)
+        self.streams[stream_id] = stream
+        stream.task = asyncio.create_task(self._forward(stream))
+
+    async def _forward(self, stream: _Stream) -> None:
+        job = stream.job
+        try:
+            await self._send(stream.id, type="meta", conversation_id=job.conversation_id, message_id=job.id)
+            try:
+                async for event_id, chunk_type, content in job.subscribe(stream.last_event_id):
+                    await stream.acquire()
+                    await self._send(stream.id, type=chunk_type, id=event_id, content=content)
+            except ReplayExpired:
+                await self._send(stream.id, type="error", content="输出缓冲已过期，请重新加载历史消息")
+            await self._send(stream.id, type="done", status=job.status.value)
+        finally:
+            self.streams.pop(stream.id, None)
+
+    async def _send(self, stream_id: Optional[str], **frame) -> None:
+        if self._send_failed:
+            return
+        await self._outbox.put({"stream": stream_id, **frame})
+
+    async def _write(self) -> None:
+        while True:
+            frame = await self._outbox.get()
+            try:
+                await self.websocket.send_text(dumps_str(frame))
+            except Exception:
+                logger.debug("WebSocket 发送失败", exc_info=True)
+                await self._abort()
+                return
+
+    async def _abort(self) -> None:
+        """发送失败后结束连接：队列不再消费，等待入队的转发任务和接收循环都需取消"""
+        self._send_failed = True
+        for stream in self.streams.values():
+            stream.task.cancel()
+        if self._receiver is not None and not self._closing:
+            self._receiver.cancel()
+        try:
+            await self.websocket.close()
+        except Exception:
+            logger.debug("WebSocket 关闭失败", exc_info=True)
@@ -0,0 +1,104 @@
+"""SSE 帧编码
+
+标准协议每帧都是完整 JSON 对象（含 conversation_id / message_id）。
+客户端通过请求头 `X-SSE-Frames: compact` 协商紧凑协议：先发送一个 `meta` 事件
+携带会话和消息 ID，之后每帧为 `[类型码, 内容]` 数组，类型码见 TYPE_CODES。
+模型输出帧带递增的事件 ID（`id:` 字段），断线后可凭 `Last-Event-ID` 续传。
+"""
+from typing import Mapping, Optional
+
+from core.serialization import dumps
+
+SSE_FRAMES_HEADER = "X-SSE-Frames"
+COMPACT = "compact"
+
+# 紧凑协议的类型码
+TYPE_CODES = {
+    "message": "m",
+    "think": "t",
+    "action": "a",
+    "observation": "o",
+    "error": "e",
+    "done": "d",
+}
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Content-Type": "text/event-stream; charset=utf-8",
+    "X-Accel-Buffering": "no"
+}
+
+def wants_compact(headers: Mapping[str, str]) -> bool:
+    """客户端是否请求紧凑帧协议"""
+    return headers.get(SSE_FRAMES_HEADER, "").lower() == COMPACT
+
+def sse_headers(compact: bool) -> dict:
+    """流式响应头，紧凑协议时回显协商结果"""
+    if compact:
+        return {**SSE_HEADERS, SSE_FRAMES_HEADER: COMPACT}
+    return dict(SSE_HEADERS)
+
+def sse_event(data: bytes, event: Optional[str] = None, id: Optional[int] = None) -> bytes:
+    prefix = b""
+    if id is not None:
+        prefix += b"id: " + str(id).encode() + b"\n"
+    if event:
+        prefix += b"event: " + event.encode() + b"\n"
+    return prefix + b"data: " + data + b"\n\n"
+
+class FrameEncoder:
+    """按协商的协议把模型输出块编码为 SSE 帧"""
+
+    def __init__(
+        self,
+        conversation_id: str,
+        message_id: str,
+        compact: bool = False,
+        include_ids: bool = True,
+        extra: Optional[dict] = None
+    ):
+        self.conversation_id = conversation_id
+        self.message_id = message_id
+        self.compact = compact
+        # 标准协议下是否在每帧附带 ID（/messages 接口的旧格式不附带）
+        self.include_ids = include_ids
+        # 标准协议下每帧附带的其他字段（如多模型对比的 model_id）
+        self.extra = extra or {}
+
+    def start(self) -> Optional[bytes]:
+        """紧凑协议的头部事件，标准协议无需头部"""
+        if not self.compact:
+            return None
+        return sse_event(
+            dumps({"conversation_id": self.conversation_id, "message_id": self.message_id}),
+            event="meta"
+        )
+
+    def frame(self, chunk_type: str, content: Optional[str] = None, id: Optional[int] = None) -> bytes:
+        """编码一个输出块；id 为事件 ID，客户端重连时通过 Last-Event-ID 回传"""
+        if self.compact:
+            code = TYPE_CODES.get(chunk_type, chunk_type)
+            return sse_event(dumps([code] if content is None else [code, content]), id=id)
+        block = {"type": chunk_type}
+        if content is not None:
+            block["content"] = content
+        if self.include_ids:
+            block["conversation_id"] = self.conversation_id
+            block["message_id"] = self.message_id
+        block.update(self.extra)
+        return sse_event(dumps(block), id=id)
+
+    def stats(self, timings: dict) -> bytes:
+        """流结束前发送的耗时统计（`stats` 事件），标准协议同时带 type 字段"""
+        if self.compact:
+            return sse_event(dumps(timings), event="stats")
+        return sse_event(dumps({"type": "stats", **timings}), event="stats")
+
+    def error(self, content: str) -> bytes:
+        return self.frame("error", content)
+
+    def done(self) -> bytes:
+        if not self.compact and not self.include_ids:
+            return b"data: [DONE]\n\n"
+        return self.frame("done")
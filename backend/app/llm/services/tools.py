@@ -0,0 +1,254 @@
+"""智能体可调用的工具
+
+工具按执行方式分两类：
+- `async`：协程函数，直接在事件循环上运行（I/O 为主的工具）；
+- `process`：普通函数，在进程池中运行（CPU 密集或不可信的代码），不阻塞事件循环，
+  崩溃也不影响服务进程。函数及参数需可 pickle，即模块顶层定义的函数。
+每次调用都有超时（工具自身的 timeout，默认 AGENT_TOOL_TIMEOUT_SECONDS）。进程池中的调用超时后
+无法单独中止，此时结束整个进程池的工作进程并在下次调用时重建，同时进行的其他进程工具调用会失败。
+工作进程用 forkserver（不支持时 spawn）方式启动，不继承服务进程的事件循环、线程和连接。
+
+工具的结果和错误都以文本返回给模型，不抛出异常：参数无效、工具不存在、超时或出错时
+返回 `ToolResult(error=...)`，由模型决定如何继续。
+"""
+import ast
+import asyncio
+import inspect
+import json
+import logging
+import multiprocessing
+import operator
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Tool:
+    """工具定义：parameters 为 JSON Schema，mode 为 async 或 process"""
+    name: str
+    description: str
+    func: Callable[..., Any]
+    parameters: dict = field(default_factory=lambda: {"type": "object", "properties": {}})
+    mode: str = "async"
+    timeout: Optional[float] = None
+
+    def schema(self) -> dict:
+        """OpenAI function 格式的工具定义"""
+        return {
+            "type": "function",
+            "function": {"name": self.name, "description": self.description, "parameters": self.parameters},
+        }
+
+@dataclass
+class ToolCall:
+    """模型发起的一次工具调用（arguments 为 JSON 文本）"""
+    id: str
+    name: str
+    arguments: str = ""
+
+@dataclass
+class ToolResult:
+    content: Optional[str] = None
+    error: Optional[str] = None
+    duration: float = 0.0
+
+    @property
+    def text(self) -> str:
+        """回传给模型的内容"""
+        return self.content if self.error is None else f"错误: {self.error}"
+
+def _report_pid(pids) -> None:
+    pids.put(os.getpid())
+
+class ToolProcessPool(ProcessPoolExecutor):
+    """执行 process 类工具的进程池：工作进程启动时上报 pid，`kill_workers()` 结束全部工作进程"""
+
+    def __init__(self, max_workers: int):
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._worker_pids = context.SimpleQueue()
+        super().__init__(max_workers, mp_context=context, initializer=_report_pid, initargs=(self._worker_pids,))
+
+    def kill_workers(self) -> None:
+        """结束全部工作进程（包括正在执行的调用）并关闭进程池"""
+        while not self._worker_pids.empty():
+            try:
+                os.kill(self._worker_pids.get(), signal.SIGTERM)
+            except OSError:
+                pass
+        self.shutdown(wait=False, cancel_futures=True)
+
+class ToolRegistry:
+    """工具表及进程池"""
+
+    def __init__(self, tools: Iterable[Tool] = (), processes: Optional[int] = None):
+        self._tools: Dict[str, Tool] = {}
+        self.processes = settings.AGENT_TOOL_PROCESSES if processes is None else processes
+        self._pool: Optional[ToolProcessPool] = None
+        # select() 得到的子表使用原工具表的进程池
+        self._parent: Optional["ToolRegistry"] = None
+        for tool in tools:
+            self.register(tool)
+
+    def register(self, tool: Tool) -> Tool:
+        if tool.mode not in ("async", "process"):
+            raise ValueError(f"未知的执行方式: {tool.mode}")
+        if tool.mode == "async" and not inspect.iscoroutinefunction(tool.func):
+            raise ValueError(f"工具 {tool.name} 需要是协程函数")
+        self._tools[tool.name] = tool
+        return tool
+
+    def get(self, name: str) -> Optional[Tool]:
+        return self._tools.get(name)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def select(self, names: Iterable[str]) -> "ToolRegistry":
+        """只包含指定工具的工具表（共用进程池），工具不存在时抛出 KeyError"""
+        subset = ToolRegistry(processes=self.processes)
+        for name in names:
+            if name not in self._tools:
+                raise KeyError(name)
+            subset._tools[name] = self._tools[name]
+        subset._parent = self
+        return subset
+
+    def schemas(self) -> List[dict]:
+        return [tool.schema() for tool in self._tools.values()]
+
+    async def execute(self, call: ToolCall) -> ToolResult:
+        """执行一次工具调用，错误和超时也作为结果返回"""
+        start = time.perf_counter()
+        result = await self._execute(call)
+        result.duration = time.perf_counter() - start
+        return result
+
+    async def _execute(self, call: ToolCall) -> ToolResult:
+        tool = self._tools.get(call.name)
+        if tool is None:
+            return ToolResult(error=f"工具不存在: {call.name}")
+        try:
+            arguments = json.loads(call.arguments) if call.arguments.strip() else {}
+        except ValueError:
+            return ToolResult(error="参数不是有效的 JSON")
+        if not isinstance(arguments, dict):
+            return ToolResult(error="参数必须是 JSON 对象")
+
+        timeout = tool.timeout or settings.AGENT_TOOL_TIMEOUT_SECONDS
+        try:
+            if tool.mode == "process":
+                pool = self._process_pool()
+                future = asyncio.get_running_loop().run_in_executor(pool, _call, tool.func, arguments)
+                try:
+                    value = await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    self._reset_pool(pool)
+                    raise
+            else:
+                value = await asyncio.wait_for(tool.func(**arguments), timeout)
+        except asyncio.TimeoutError:
+            return ToolResult(error=f"执行超时（{timeout:g} 秒）")
+        except Exception as e:
+            logger.info("工具 %s 执行出错: %r", call.name, e)
+            return ToolResult(error=f"{type(e).__name__}: {e}")
+        return ToolResult(content=value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))
+
+    def _process_pool(self) -> ToolProcessPool:
+        owner = self._parent or self
+        if owner._pool is None:
+            owner._pool = ToolProcessPool(owner.processes)
+        return owner._pool
+
+    def _reset_pool(self, pool: ToolProcessPool) -> None:
+        """结束超时调用所在进程池的工作进程，下次调用时重建"""
+        owner = self._parent or self
+        if owner._pool is pool:
+            owner._pool = None
+        pool.kill_workers()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+def _call(func: Callable[..., Any], arguments: Dict[str, Any]) -> Any:
+    return func(**arguments)
+
+# 内置工具
+
+_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.USub: operator.neg, ast.UAdd: operator.pos,
+}
+
+# 整数运算数和结果的最大位数，及乘方指数的上限：超出时拒绝计算，避免 9 ** 9 ** 9 之类的表达式
+# 长时间占用 CPU 和内存
+CALCULATE_MAX_BITS = 4096
+CALCULATE_MAX_EXPONENT = 1000
+
+def _checked(value: Any) -> Any:
+    if isinstance(value, int) and value.bit_length() > CALCULATE_MAX_BITS:
+        raise ValueError("数值过大")
+    return value
+
+def _power(base: Any, exponent: Any) -> Any:
+    if abs(exponent) > CALCULATE_MAX_EXPONENT:
+        raise ValueError("指数过大")
+    if isinstance(base, int) and isinstance(exponent, int) and base.bit_length() * exponent > CALCULATE_MAX_BITS:
+        raise ValueError("数值过大")
+    return operator.pow(base, exponent)
+
+def calculate(expression: str) -> str:
+    """计算算术表达式（只允许数字和四则、乘方、取模运算，数值大小有上限）"""
+    def evaluate(node: ast.AST) -> Any:
+        if isinstance(node, ast.Expression):
+            return evaluate(node.body)
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return _checked(node.value)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            return _checked(_power(evaluate(node.left), evaluate(node.right)))
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            return _checked(_OPERATORS[type(node.op)](evaluate(node.left), evaluate(node.right)))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](evaluate(node.operand))
+        raise ValueError("只支持数字和算术运算")
+    return str(evaluate(ast.parse(expression, mode="eval")))
+
+async def current_time(timezone_offset: float = 0) -> str:
+    """当前时间（ISO 8601）"""
+    return datetime.now(timezone(timedelta(hours=timezone_offset))).isoformat(timespec="seconds")
+
+tool_registry = ToolRegistry([
+    Tool(
+        name="calculate",
+        description="计算算术表达式，例如 (1 + 2) * 3 ** 2",
+        func=calculate,
+        parameters={
+            "type": "object",
+            "properties": {"expression": {"type": "string", "description": "算术表达式"}},
+            "required": ["expression"],
+        },
+        mode="process",
+        timeout=5,
+    ),
+    Tool(
+        name="current_time",
+        description="获取当前时间",
+        func=current_time,
+        parameters={
+            "type": "object",
+            "properties": {"timezone_offset": {"type": "number", "description": "相对 UTC 的小时数，默认 0"}},
+        },
+    ),
+])
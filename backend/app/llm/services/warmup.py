@@ -0,0 +1,26 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Conversation
+from .message import MessageService
+
+async def prewarm_recent_conversations(session: AsyncSession, limit: int) -> int:
+    """预读最近会话的历史消息
+
+    执行与前端打开会话时相同的查询，使相关数据页进入 SQLite 页缓存，
+    语句编译结果进入 SQLAlchemy 缓存。
+    """
+    result = await session.execute(
+        select(Conversation.id)
+        .filter(Conversation.is_deleted == False)
+        .order_by(Conversation.last_message_at.desc())
+        .limit(limit)
+    )
+    conversation_ids = list(result.scalars().all())
+
+    message_service = MessageService(session)
+    for conversation_id in conversation_ids:
+        await message_service.get_conversation_messages_with_items(conversation_id)
+    # 预热只为填充缓存，不保留对象
+    session.expunge_all()
+    return len(conversation_ids)
@@ -3,12 +3,14 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.database import get_session
+from core.query_debug import query_budget
 from ..services.user_service import UserService
 from ..schemas.user import UserResponse
 
 router = APIRouter(prefix="/user", tags=["users"])
 
 @router.get("/test-user", response_model=UserResponse)
+@query_budget(3)
 async def get_test_user(
     session: AsyncSession = Depends(get_session)
 ):
@@ -17,6 +19,7 @@ async def get_test_user(
     return await service.get_test_user()
 
 @router.get("/{user_id}/settings", response_model=Dict[str, Any])
+@query_budget(1)
 async def get_user_settings(
     user_id: str,
     session: AsyncSession = Depends(get_session)
@@ -29,6 +32,7 @@ async def get_user_settings(
         raise e
 
 @router.put("/{user_id}/settings", response_model=Dict[str, Any])
+@query_budget(3)
 async def update_user_settings(
     user_id: str,
     settings: Dict[str, Any],
@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from fastapi import HTTPException
 
+from core.invalidation import invalidation, TOPIC_SETTINGS
 from ..models.user import User
 
 class UserService:
@@ -47,5 +48,6 @@ class UserService:
         current_settings.update(settings)
         user.settings = current_settings
         
+        await invalidation.mark_changed(self.db, TOPIC_SETTINGS)
         await self.db.commit()
         return user.settings 
\ No newline at end of file
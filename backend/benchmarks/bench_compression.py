@@ -0,0 +1,88 @@
+"""历史消息响应的压缩率与耗时
+
+构造包含 think / message 区块的合成会话（默认 5000 条消息），对比各压缩算法的
+响应大小、压缩耗时，以及压缩放在事件循环内和线程池中时事件循环被阻塞的时间。
+
+用法::
+
+    python -m benchmarks.bench_compression --messages 5000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime
+
+from core.compression import COMPRESSORS
+from core.serialization import dumps
+
+def synthetic_history(count: int) -> list:
+    """模拟 /conversations/{id}/messages 的响应"""
+    conversation_id = str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
+    messages = []
+    for i in range(count):
+        message_id = str(uuid.uuid4())
+        assistant = i % 2 == 1
+        content = ("这是第 %d 条回复，包含一些解释和代码示例。" % i) * (6 if assistant else 1)
+        items = [{"id": str(uuid.uuid4()), "message_id": message_id, "conversation_id": conversation_id,
+                  "type": "message", "content": content, "order": 0, "created_at": now}]
+        if assistant:
+            items.insert(0, {"id": str(uuid.uuid4()), "message_id": message_id,
+                             "conversation_id": conversation_id, "type": "think",
+                             "content": "先分析用户的问题，再给出步骤。" * 10, "order": 0, "created_at": now})
+        messages.append({
+            "id": message_id, "conversation_id": conversation_id, "user_id": "u1",
+            "role": "assistant" if assistant else "user", "type": "text", "content": content,
+            "tokens": 0, "processing_time": 0.0, "created_at": now, "updated_at": now,
+            "message_items": items,
+        })
+    return messages
+
+async def max_loop_stall(work, interval: float = 0.001) -> float:
+    """执行 work 期间事件循环最长一次没有被调度的时间（毫秒）"""
+    stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            stall = max(stall, now - last - interval)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(interval * 2)
+    await work()
+    running = False
+    await task
+    return stall * 1000
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+
+    body = dumps(synthetic_history(args.messages))
+    print(f"{args.messages} 条消息, 原始 {len(body) / 1024 / 1024:.2f} MiB")
+    for name, compress in COMPRESSORS.items():
+        start = time.perf_counter()
+        compressed = compress(body)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        async def inline():
+            compress(body)
+
+        async def offload():
+            await asyncio.to_thread(compress, body)
+
+        print(
+            f"{name:5s} {len(compressed) / 1024:9.1f} KiB  比例 {len(body) / len(compressed):5.1f}x  "
+            f"{elapsed:7.1f} ms  事件循环阻塞: 内联 {await max_loop_stall(inline):6.1f} ms / "
+            f"线程池 {await max_loop_stall(offload):6.1f} ms"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""日志管道对请求延迟的影响
+
+对比同步 FileHandler 与队列日志管道在开启详细日志时的请求延迟。
+
+用法::
+
+    python -m benchmarks.bench_logging --requests 2000 --lines 20
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from core import logger as log_module
+from core.config import settings
+
+def build_app(lines: int) -> FastAPI:
+    app = FastAPI()
+    log = logging.getLogger("maoflow.bench")
+
+    @app.get("/ping")
+    async def ping():
+        for i in range(lines):
+            log.info("verbose request log line %d with some payload %s", i, "x" * 80)
+        return {"ok": True}
+
+    return app
+
+def setup_sync_logging(log_dir: str) -> None:
+    """旧的同步日志配置：直接在请求线程中写文件"""
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.setLevel(logging.INFO)
+    handler = logging.FileHandler(f"{log_dir}/sync.log", encoding="utf-8")
+    handler.setFormatter(logging.Formatter(log_module.TEXT_FORMAT))
+    root.addHandler(handler)
+
+def teardown_logging() -> None:
+    log_module.shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        handler.close()
+        root.removeHandler(handler)
+
+async def run(app: FastAPI, requests: int, concurrency: int) -> list:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                await client.get("/ping")
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+def report(name: str, latencies: list, elapsed: float) -> None:
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:8s} p50={statistics.median(latencies):7.3f} ms  "
+          f"p99={p99:7.3f} ms  throughput={len(latencies) / elapsed:8.1f} req/s")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=20, help="每个请求写入的日志行数")
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    args = parser.parse_args()
+
+    app = build_app(args.lines)
+    with tempfile.TemporaryDirectory() as log_dir:
+        for name in ("sync", "queue"):
+            if name == "sync":
+                setup_sync_logging(log_dir)
+            else:
+                settings.LOG_DIR = log_dir
+                settings.LOG_TO_CONSOLE = False
+                settings.LOG_FORMAT = args.format
+                log_module.setup_logging()
+
+            start = time.perf_counter()
+            latencies = asyncio.run(run(app, args.requests, args.concurrency))
+            report(name, latencies, time.perf_counter() - start)
+            teardown_logging()
+
+if __name__ == "__main__":
+    sys.exit(main())
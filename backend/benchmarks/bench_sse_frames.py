@@ -0,0 +1,48 @@
+"""SSE 帧的字节数与 CPU 开销
+
+对比旧的逐帧 json.dumps 格式、orjson 标准帧和紧凑帧协议编码单个 token 的开销。
+
+用法::
+
+    python -m benchmarks.bench_sse_frames --tokens 100000
+"""
+import argparse
+import json
+import time
+import uuid
+
+from app.llm.services.sse import FrameEncoder
+
+def legacy_frame(chunk_type: str, content: str, conversation_id: str, message_id: str) -> bytes:
+    """改造前 generate_response 的编码方式"""
+    block = {"type": chunk_type, "content": content, "conversation_id": conversation_id, "message_id": message_id}
+    return f"data: {json.dumps(block, ensure_ascii=False)}\n\n".encode("utf-8")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=100000)
+    args = parser.parse_args()
+
+    conversation_id, message_id = str(uuid.uuid4()), str(uuid.uuid4())
+    # 模型逐 token 输出，平均每个 token 两三个字符
+    tokens = [("message", t) for t in ["你好", "，", "这是", "一个", " token", "流"]] * (args.tokens // 6)
+
+    standard = FrameEncoder(conversation_id, message_id)
+    compact = FrameEncoder(conversation_id, message_id, compact=True)
+    encoders = {
+        "legacy": lambda t, c: legacy_frame(t, c, conversation_id, message_id),
+        "standard": standard.frame,
+        "compact": compact.frame,
+    }
+    payload = sum(len(c.encode("utf-8")) for _, c in tokens)
+    print(f"{len(tokens)} tokens, 内容 {payload / len(tokens):.1f} B/token")
+    for name, encode in encoders.items():
+        start = time.process_time()
+        total = sum(len(encode(t, c)) for t, c in tokens)
+        if name == "compact":
+            total += len(compact.start())
+        cpu = time.process_time() - start
+        print(f"{name:8s} {total / len(tokens):6.1f} B/token  {cpu / len(tokens) * 1e6:6.2f} us/token")
+
+if __name__ == "__main__":
+    main()
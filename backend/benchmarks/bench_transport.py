@@ -0,0 +1,112 @@
+"""TCP 与 Unix 域套接字传输延迟对比
+
+分别以 TCP 端口和 Unix 域套接字启动 uvicorn，测量 SSE 查询流（与
+/conversations/{id}/query 相同的帧格式）和历史消息加载的延迟。
+
+用法::
+
+    python -m benchmarks.bench_transport --rounds 200 --tokens 500 --messages 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+app = FastAPI()
+
+@app.get("/stream")
+async def stream(tokens: int = 500):
+    async def generate():
+        for i in range(tokens):
+            block = {"type": "message", "content": f"tok{i} ", "conversation_id": "c" * 36, "message_id": "m" * 36}
+            yield f"data: {json.dumps(block, ensure_ascii=False)}\n\n"
+        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+@app.get("/history")
+async def history(messages: int = 200):
+    return [
+        {
+            "id": str(i), "conversation_id": "c" * 36, "user_id": "u" * 36,
+            "role": "assistant", "type": "text", "content": "回答内容 " * 40,
+            "message_items": [{"id": str(i), "type": "message", "content": "回答内容 " * 40}]
+        }
+        for i in range(messages)
+    ]
+
+def start_server(bind_args: list) -> subprocess.Popen:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_transport:app", "--log-level", "warning", *bind_args],
+        cwd=backend_dir,
+    )
+
+async def wait_ready(client: httpx.AsyncClient) -> None:
+    for _ in range(100):
+        try:
+            await client.get("/history", params={"messages": 1})
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("服务启动超时")
+
+async def measure(client: httpx.AsyncClient, rounds: int, tokens: int, messages: int) -> dict:
+    await wait_ready(client)
+    ttfb, stream_total, history_total = [], [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        async with client.stream("GET", "/stream", params={"tokens": tokens}) as response:
+            first = None
+            async for _ in response.aiter_raw():
+                if first is None:
+                    first = time.perf_counter()
+        ttfb.append((first - start) * 1000)
+        stream_total.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        (await client.get("/history", params={"messages": messages})).json()
+        history_total.append((time.perf_counter() - start) * 1000)
+    return {"stream_ttfb": ttfb, "stream_total": stream_total, "history": history_total}
+
+def summary(values: list) -> str:
+    values = sorted(values)
+    return f"p50={statistics.median(values):7.3f} ms p99={values[int(len(values) * 0.99) - 1]:7.3f} ms"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=500, help="每个 SSE 流的帧数")
+    parser.add_argument("--messages", type=int, default=200, help="历史消息条数")
+    parser.add_argument("--port", type=int, default=17399)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, "bench.sock")
+        transports = {
+            "tcp": (["--port", str(args.port)], httpx.AsyncHTTPTransport(), f"http://127.0.0.1:{args.port}"),
+            "uds": (["--uds", socket_path], httpx.AsyncHTTPTransport(uds=socket_path), "http://backend"),
+        }
+        for name, (bind_args, transport, base_url) in transports.items():
+            server = start_server(bind_args)
+            try:
+                async def run():
+                    async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+                        return await measure(client, args.rounds, args.tokens, args.messages)
+                results = asyncio.run(run())
+            finally:
+                server.terminate()
+                server.wait()
+            for key, values in results.items():
+                print(f"{name} {key:13s} {summary(values)}")
+
+if __name__ == "__main__":
+    main()
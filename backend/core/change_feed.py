@@ -0,0 +1,144 @@
+"""按用户推送的数据变更
+
+服务层在写入时调用 `record_change` 把变更挂在当前会话上，事务提交后（after_commit）
+才发布到 change_hub（按用户 ID），回滚则丢弃，客户端不会收到未提交的数据。
+客户端通过 `GET /conversations/user/{user_id}/changes` 订阅，据此增量更新会话列表，
+不再轮询。重连期间的变更不会补发，客户端重连后应重新拉取一次列表。
+
+多 worker 时订阅者可能连在其他进程上：change_relay 启用后每个事务的变更在提交前写入
+change_log 表（与数据同一事务），其他进程在 core.invalidation 的 data_version 轮询中读取
+新增的行并推送给本进程的订阅者，延迟约一个 INVALIDATION_POLL_INTERVAL。日志保留
+CHANGE_LOG_RETENTION_SECONDS 秒。seq 只在同一连接内递增。
+
+变更格式：`{"seq": 1, "entity": "conversation", "action": "updated", "id": ..., "data": {...}}`
+entity 为 conversation / message，action 为 created / updated / deleted / stats。
+"""
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, String, Table, Text, event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .base_model import Base
+from .config import settings
+from .invalidation import InvalidationChannel
+from .pubsub import Hub
+from .serialization import dumps_str
+
+_SESSION_KEY = "pending_changes"
+
+# 按用户 ID 分发变更
+change_hub = Hub("changes")
+
+_seq = itertools.count(1)
+
+change_log = Table(
+    "change_log",
+    Base.metadata,
+    Column("seq", Integer, primary_key=True, autoincrement=True),
+    Column("origin", Integer, nullable=False),  # 写入进程的 pid，本进程的变更已在提交时推送
+    Column("user_id", String(36), nullable=False),
+    Column("change", Text, nullable=False),  # JSON
+    Column("created_at", Float, nullable=False, index=True),  # time.time()
+    # AUTOINCREMENT：清理后表为空时 seq 也不会从 1 重新开始，各进程记录的 _last_seq 保持有效
+    sqlite_autoincrement=True,
+)
+
+class ChangeRelay:
+    """经 change_log 表把变更转发给其他 worker 进程的订阅者"""
+
+    def __init__(self, origin: Optional[int] = None):
+        self.origin = os.getpid() if origin is None else origin
+        self.enabled = False
+        self._last_seq: Optional[int] = None
+        self._last_purge = 0.0
+
+    def enable(self, channel: InvalidationChannel) -> None:
+        """写入 change_log，并在 channel 的轮询中读取其他进程的变更（在 channel.start 前调用）"""
+        self.enabled = True
+        channel.add_reader(self._read, self._deliver)
+
+    def _read(self, conn: sqlite3.Connection) -> List[Tuple[str, dict]]:
+        """读取上次之后其他进程写入的变更，并定期清理过期日志（在轮询线程中执行）"""
+        if self._last_seq is None:
+            # 启动前的变更没有订阅者需要
+            self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+            return []
+        rows = conn.execute(
+            "SELECT seq, origin, user_id, change FROM change_log WHERE seq > ? ORDER BY seq",
+            (self._last_seq,)
+        ).fetchall()
+        if rows:
+            self._last_seq = rows[-1][0]
+        elif conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0] < self._last_seq:
+            # 没有 AUTOINCREMENT 的旧表清空后 seq 会重新编号，从头读取
+            self._last_seq = 0
+            return self._read(conn)
+        now = time.time()
+        if now - self._last_purge > settings.CHANGE_LOG_RETENTION_SECONDS:
+            self._last_purge = now
+            conn.execute("DELETE FROM change_log WHERE created_at < ?", (now - settings.CHANGE_LOG_RETENTION_SECONDS,))
+            conn.commit()
+        return [(user_id, json.loads(change)) for _, origin, user_id, change in rows if origin != self.origin]
+
+    def _deliver(self, changes: List[Tuple[str, dict]]) -> None:
+        for user_id, change in changes:
+            change_hub.publish(user_id, {"seq": next(_seq), **change})
+
+change_relay = ChangeRelay()
+
+def has_subscribers(user_id: Optional[str]) -> bool:
+    """没有订阅者时调用方可以跳过构造变更数据"""
+    return user_id is not None and change_hub.subscriber_count(user_id) > 0
+
+def record_change(
+    session: AsyncSession,
+    user_id: Optional[str],
+    entity: str,
+    action: str,
+    id: str,
+    data: Optional[Dict[str, Any]] = None
+) -> None:
+    """记录一条变更，随当前事务提交后推送给该用户的订阅者"""
+    # 跨进程转发时其他 worker 上可能有订阅者，总是记录
+    if user_id is None or not (change_relay.enabled or has_subscribers(user_id)):
+        return
+    change = {"entity": entity, "action": action, "id": id, "data": data or {}}
+    session.sync_session.info.setdefault(_SESSION_KEY, []).append((user_id, change))
+
+@event.listens_for(Session, "before_commit")
+def _log_before_commit(session: Session) -> None:
+    pending = session.info.get(_SESSION_KEY)
+    if change_relay.enabled and pending:
+        now = time.time()
+        session.execute(change_log.insert(), [
+            {"origin": change_relay.origin, "user_id": user_id, "change": dumps_str(change), "created_at": now}
+            for user_id, change in pending
+        ])
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session) -> None:
+    for user_id, change in session.info.pop(_SESSION_KEY, ()):
+        change_hub.publish(user_id, {"seq": next(_seq), **change})
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+async def watch_changes(user_id: str, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """逐条返回该用户的变更；超过 heartbeat 秒没有变更时返回 None，供调用方发送心跳"""
+    heartbeat = settings.CHANGE_FEED_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+    async with change_hub.subscribe(user_id) as subscription:
+        while True:
+            try:
+                yield await asyncio.wait_for(subscription.__anext__(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+            except StopAsyncIteration:
+                return
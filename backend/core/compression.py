@@ -0,0 +1,144 @@
+"""响应压缩中间件
+
+按 Accept-Encoding 协商 zstd / br / gzip，只压缩超过阈值的非流式响应，
+SSE（text/event-stream）和已经编码过的响应原样透传。较大的响应体在线程池中压缩，
+避免阻塞事件循环。zstd 和 brotli 依赖 zstandard / brotli（见 requirements.txt），未安装时只使用 gzip。
+"""
+import asyncio
+import gzip
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 取决于安装环境
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 取决于安装环境
+    brotli = None
+
+def _gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+def _build_compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    compressors: Dict[str, Callable[[bytes], bytes]] = {}
+    if zstandard is not None:
+        compressors["zstd"] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+    if brotli is not None:
+        compressors["br"] = lambda body: brotli.compress(body, quality=4)
+    compressors["gzip"] = _gzip
+    return compressors
+
+# 按优先级排列：同等 q 值时优先压缩率和速度更好的算法
+COMPRESSORS = _build_compressors()
+
+# 不压缩的内容类型
+SKIP_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip")
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """解析 Accept-Encoding，返回 编码 -> q 值"""
+    result: Dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[name] = q
+    return result
+
+def choose_encoding(header: str, available: Optional[List[str]] = None) -> Optional[str]:
+    """选出客户端接受且 q 值最高的编码，没有可用编码时返回 None"""
+    accepted = parse_accept_encoding(header)
+    best: Optional[Tuple[float, str]] = None
+    for name in available or list(COMPRESSORS):
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > 0 and (best is None or q > best[0]):
+            best = (q, name)
+    return best[1] if best else None
+
+class CompressionMiddleware:
+    """协商压缩中间件
+
+    Args:
+        minimum_size: 小于该字节数的响应不压缩
+        offload_size: 不小于该字节数的响应在线程池中压缩
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, offload_size: int = 256 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self, encoding, send)(self.app, scope, receive)
+
+class _CompressionResponder:
+    """缓存单个响应的起始消息，拿到完整响应体后决定是否压缩"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message: Optional[Message] = None
+        self.passthrough = False
+
+    async def __call__(self, app: ASGIApp, scope: Scope, receive: Receive) -> None:
+        await app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message: Message) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            if "content-encoding" in headers or content_type.startswith(SKIP_CONTENT_TYPES):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        # 流式响应（多个 body 消息）不压缩，避免缓冲整个流
+        if message.get("more_body", False) or len(body) < self.middleware.minimum_size:
+            self.passthrough = True
+            await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        compress = COMPRESSORS[self.encoding]
+        if len(body) >= self.middleware.offload_size:
+            compressed = await asyncio.to_thread(compress, body)
+        else:
+            compressed = compress(body)
+
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": compressed})
@@ -25,10 +25,72 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     HOST: str = "localhost"
     PORT: int = 17349
+    UDS_PATH: Optional[str] = None  # 设置后监听 Unix 域套接字而不是 TCP 端口（桌面端）
     
+    # 启动性能：后端导入耗时预算（毫秒），由 tests/core/test_startup.py 校验
+    STARTUP_IMPORT_BUDGET_MS: int = 2500
+
+    # 日志配置
+    LOG_LEVEL: str = "INFO"
+    LOG_DIR: Optional[str] = None  # 默认为 backend/logs，打包环境为可执行文件旁的 logs
+    LOG_FORMAT: str = "text"  # text 或 json（结构化日志）
+    LOG_TO_CONSOLE: bool = True
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024  # 按大小轮转的单文件上限
+    LOG_ROTATE_WHEN: Optional[str] = None  # 设置后按时间轮转，如 "midnight"、"H"
+    LOG_BACKUP_COUNT: int = 5  # 保留的历史日志文件数
+
+    # SSE 输出合并：连续的同类型增量在时间窗口内合并为一帧，首个增量立即输出
+    SSE_COALESCE_WINDOW_MS: int = 25  # 0 表示不合并
+    SSE_COALESCE_MAX_BYTES: int = 1024
+    GENERATION_JOB_RETENTION_SECONDS: int = 300  # 生成任务结束后保留多久供客户端重连
+    GENERATION_REPLAY_BUFFER_BYTES: int = 1024 * 1024  # 单个任务的回放缓冲上限
+    GENERATION_REPLAY_TOTAL_BYTES: int = 64 * 1024 * 1024  # 所有任务回放缓冲合计上限
+    PUBSUB_QUEUE_SIZE: int = 256  # 发布/订阅每个订阅者的队列长度，满时断开该订阅者
+    CHANGE_FEED_HEARTBEAT_SECONDS: float = 15  # 变更订阅无数据时的心跳间隔，防止代理断开空闲连接
+    CHANGE_LOG_RETENTION_SECONDS: int = 300  # 多 worker 时跨进程转发用的变更日志保留时间
+    WS_STREAM_WINDOW: int = 64  # WebSocket 每路流的初始帧额度（流控）
+    WS_MAX_STREAMS: int = 64  # 单个 WebSocket 连接同时进行的流数上限
+    BATCH_WORKERS: int = 8  # 每个批次默认的并发数
+    BATCH_MODEL_CONCURRENCY: int = 4  # 每个模型在所有批次中的默认并发上限（模型 custom_settings.max_concurrency 优先）
+    BATCH_MAX_ITEMS: int = 10000  # 单个批次的提示数上限
+    BATCH_RETENTION_SECONDS: int = 86400  # 批次结束后保留进度和结果的时间
+    AGENT_MAX_STEPS: int = 8  # 工具调用循环最多调用模型的轮数
+    AGENT_TOOL_TIMEOUT_SECONDS: float = 30  # 单次工具调用的默认超时
+    AGENT_TOOL_PROCESSES: int = 2  # 执行 process 类工具的进程数
+    COMPARE_MAX_MODELS: int = 8  # 多模型对比一次最多的模型数
+    FLOW_MAX_CONCURRENCY: int = 8  # 单次流程执行同时运行的节点数上限
+    FLOW_RUN_RETENTION_SECONDS: int = 300  # 流程执行结束后在内存中保留事件的时间（结果已存库）
+    FLOW_NODE_CACHE_TTL_SECONDS: int = 7 * 24 * 3600  # 节点输出缓存的有效期
+    FLOW_NODE_CACHE_MAX_ENTRIES: int = 10000  # 节点输出缓存的最大条数，超出时删除最早写入的
+    GENERATION_DETACHED_CANCEL_SECONDS: float = 30  # 所有客户端断开超过该时间未重连则取消生成，0 表示不取消
+
+    # 响应压缩（SSE 不压缩）
+    COMPRESSION_MIN_SIZE: int = 1024  # 小于该字节数的响应不压缩
+    COMPRESSION_OFFLOAD_SIZE: int = 256 * 1024  # 超过该字节数时在线程池中压缩
+
+    # 事件循环延迟监控
+    LOOP_MONITOR_INTERVAL_MS: int = 100  # 采样间隔，0 表示关闭
+    LOOP_BLOCK_THRESHOLD_MS: int = 100  # 超过该延迟视为阻塞
+    LOOP_BLOCK_CAPTURE_STACKS: bool = False  # 调试用：阻塞时记录事件循环线程的调用栈
+
     # 数据库配置
     DB_PATH: Optional[str] = None
     SQL_ECHO: bool = False
+    # 开发调试：统计每个请求的 SQL 语句数，超出接口预算或疑似 N+1 时记录警告
+    SQL_DEBUG: bool = False
+    SQL_DEBUG_REPEAT_THRESHOLD: int = 3  # 同一语句形状重复执行达到该次数视为 N+1
+    SQLITE_WAL: bool = True  # 多进程共享数据库时需要 WAL 模式
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
+    # 启动预热
+    DB_POOL_WARMUP: int = 2  # 启动时预先建立的连接数
+    PREWARM_CONVERSATIONS: int = 5  # 启动时预读最近会话的历史消息数
+
+    # 多进程部署
+    WORKERS: int = 1  # 大于 1 时以多 worker 进程启动（run.py --workers）
+    READY_ANNOUNCE_ADDRESS: Optional[str] = None  # 多 worker 模式由 run.py 设置，各 worker 启动完成后输出就绪行
+    RUN_MIGRATIONS_ON_STARTUP: bool = True  # 多 worker 时由主进程统一迁移
+    INVALIDATION_POLL_INTERVAL: float = 0.5  # 跨进程缓存失效轮询间隔（秒）
     
     @property
     def SQLITE_URL(self) -> str:
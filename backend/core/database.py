@@ -1,51 +1,18 @@
 from typing import AsyncGenerator
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 import os
-import sys
-import alembic.config
-import alembic.command
 import logging
-import datetime
 
 from .config import settings
+from .metrics import instrument_database
+from .query_debug import instrument_queries
+from .timing import instrument_engine
 
 # 强制声明依赖关系
 __all__ = ['sqlalchemy', 'aiosqlite']
 
-# 设置日志
-def setup_logging():
-    """设置日志"""
-    if getattr(sys, 'frozen', False):
-        # 如果是打包后的环境
-        base_dir = os.path.dirname(sys.executable)
-        if 'Resources' in base_dir:
-            log_dir = os.path.join(os.path.dirname(base_dir), 'backend', 'logs')
-        else:
-            log_dir = os.path.join(base_dir, 'logs')
-    else:
-        log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
-    
-    # 确保日志目录存在
-    os.makedirs(log_dir, exist_ok=True)
-    
-    # 创建日志文件名（使用当前时间）
-    current_time = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    log_file = os.path.join(log_dir, f'maoflow_{current_time}.log')
-    
-    # 配置日志
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s [%(levelname)s] %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    return log_file
-
-# 设置日志
-log_file = setup_logging()
 logger = logging.getLogger(__name__)
 
 # 创建异步数据库引擎
@@ -54,6 +21,21 @@ engine = create_async_engine(
     echo=settings.SQL_ECHO,
 )
 
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """WAL 模式允许多个 worker 进程并发读写同一个 SQLite 数据库"""
+    cursor = dbapi_connection.cursor()
+    if settings.SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+# 记录每个请求的 SQL 耗时和语句数（Server-Timing）以及连接池指标（/metrics）
+instrument_engine(engine.sync_engine)
+instrument_database(engine.sync_engine)
+if settings.SQL_DEBUG:
+    instrument_queries(engine.sync_engine)
+
 # 创建异步会话工厂
 async_session = async_sessionmaker(
     engine,
@@ -72,8 +54,40 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
+# 模型、用户路由使用的依赖名称
+get_session = get_db
+
+def get_session_factory() -> async_sessionmaker:
+    """会话工厂依赖
+
+    流式接口不能在整个响应期间占用 get_db 的会话（及其连接），生成结束后用工厂
+    另开短会话写入结果。测试中替换该依赖即可指向测试数据库。
+    """
+    return async_session
+
+async def warm_up_pool(connections: int = None) -> int:
+    """预先建立数据库连接，避免首批请求承担建连和 PRAGMA 的开销"""
+    connections = connections or settings.DB_POOL_WARMUP
+    # 同时持有多个连接，连接池才会真正建立多条连接
+    opened = [await engine.connect() for _ in range(connections)]
+    try:
+        for conn in opened:
+            await conn.execute(text("SELECT 1"))
+    finally:
+        for conn in opened:
+            await conn.close()
+    return connections
+
+def get_database_url() -> str:
+    """获取当前数据库 URL"""
+    return settings.SQLITE_URL
+
 def run_migrations():
     """运行数据库迁移"""
+    # alembic 只在迁移时需要，延迟导入以缩短启动时间
+    import alembic.config
+    import alembic.command
+
     try:
         logger.info("\n=== 开始数据库迁移 ===")
         # 获取项目根目录
@@ -88,8 +102,9 @@ def run_migrations():
             logger.warning(f"警告: 未找到alembic.ini文件，路径: {alembic_ini_path}")
             return False
             
-        # 创建 Alembic 配置
+        # 创建 Alembic 配置（保留应用已配置的日志，不让 alembic.ini 覆盖）
         alembic_cfg = alembic.config.Config(alembic_ini_path)
+        alembic_cfg.attributes['configure_logger'] = False
         
         # 设置迁移脚本的路径
         script_location = os.path.join(project_root, 'alembic')
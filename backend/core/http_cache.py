@@ -0,0 +1,70 @@
+"""HTTP 条件请求（ETag / Last-Modified）
+
+读取接口先用一条轻量查询取出资源的版本信息（updated_at、last_message_at、
+message_count 等）生成 ETag，客户端缓存仍然有效时直接返回 304，
+不再执行完整查询和序列化。
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+# 客户端每次使用前都需要重新验证
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts: Any) -> str:
+    """由版本信息生成弱 ETag"""
+    raw = "|".join("" if p is None else str(p) for p in parts)
+    return 'W/"' + hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest() + '"'
+
+def latest(*values: Optional[datetime]) -> Optional[datetime]:
+    """取最晚的时间，忽略空值"""
+    values = [_as_utc(v) for v in values if v is not None]
+    return max(values) if values else None
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite 读出的时间不带时区，库里统一存的是 UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match 使用弱比较
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """判断客户端缓存是否仍然有效；有 If-None-Match 时忽略 If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP 日期只精确到秒：与 since 同一秒内的修改可能发生在客户端取得响应之后，
+        # 只有修改时间在更早的一秒时才能确定未修改，否则返回完整响应（之后用 ETag 校验）
+        return _as_utc(last_modified).replace(microsecond=0) < _as_utc(since)
+    return False
+
+def cache_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(last_modified), usegmt=True)
+    return headers
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, last_modified))
@@ -0,0 +1,155 @@
+"""跨进程缓存失效通道
+
+多个 worker 进程共享同一个 SQLite 数据库，各自持有进程内缓存。写入方在同一事务中
+递增 `cache_version` 表中对应主题的版本号；每个进程用独立连接轮询
+`PRAGMA data_version`（其他连接提交后才会变化，开销极小），发现变化后再读取版本表，
+对版本号变化的主题调用本进程注册的回调。
+
+本进程内的提交在 after_commit 时立即通知，不依赖轮询。其他模块可以用 `add_reader`
+在同一轮询中读取自己的表（例如 core.change_feed 的变更日志）。
+"""
+import asyncio
+import logging
+import sqlite3
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .base_model import Base
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# 常用缓存主题
+TOPIC_MODELS = "models"
+TOPIC_SETTINGS = "settings"
+TOPIC_CONVERSATIONS = "conversations"
+
+cache_version = Table(
+    "cache_version",
+    Base.metadata,
+    Column("topic", String(100), primary_key=True),
+    Column("version", Integer, nullable=False, default=0),
+)
+
+_SESSION_KEY = "invalidated_topics"
+
+class InvalidationChannel:
+    """缓存失效的订阅与分发"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._versions: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._readers: List[Tuple[Callable[[sqlite3.Connection], Any], Callable[[Any], None]]] = []
+        # 首次轮询（记录基准版本）完成后触发，之后的提交都会被发现
+        self.polled = asyncio.Event()
+
+    def add_reader(self, read: Callable[[sqlite3.Connection], Any], handle: Callable[[Any], None]) -> None:
+        """data_version 变化时（包括首次轮询）在轮询线程中调用 read(conn)，结果交给 handle 在事件循环中处理"""
+        self._readers.append((read, handle))
+
+    def subscribe(self, topic: str, callback: Callable[[str], None]) -> None:
+        """注册主题失效回调，回调需是快速的同步函数"""
+        self._subscribers[topic].append(callback)
+
+    def unsubscribe(self, topic: str, callback: Callable[[str], None]) -> None:
+        if callback in self._subscribers.get(topic, []):
+            self._subscribers[topic].remove(callback)
+
+    async def mark_changed(self, session: AsyncSession, *topics: str) -> None:
+        """在当前事务中递增主题版本号，提交后通知所有进程"""
+        for topic in topics:
+            stmt = insert(cache_version).values(topic=topic, version=1)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[cache_version.c.topic],
+                set_={"version": cache_version.c.version + 1}
+            )
+            await session.execute(stmt)
+        session.sync_session.info.setdefault(_SESSION_KEY, set()).update(topics)
+
+    def notify(self, *topics: str) -> None:
+        """调用本进程中主题的失效回调"""
+        for topic in topics:
+            for callback in list(self._subscribers.get(topic, [])):
+                try:
+                    callback(topic)
+                except Exception:
+                    logger.exception("缓存失效回调出错: %s", topic)
+
+    def _read_versions(self, conn: sqlite3.Connection, last_data_version: int):
+        """读取 data_version，变化时同时读取版本表（在线程中执行）"""
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == last_data_version:
+            return data_version, None, []
+        rows = conn.execute(str(select(cache_version.c.topic, cache_version.c.version))).fetchall()
+        return data_version, dict(rows), [read(conn) for read, _ in self._readers]
+
+    def _handle(self, results: List[Any]) -> None:
+        for (_, handle), result in zip(self._readers, results):
+            try:
+                handle(result)
+            except Exception:
+                logger.exception("处理轮询结果出错")
+
+    async def _poll(self, db_path: str, interval: float) -> None:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            data_version, versions, results = await asyncio.to_thread(self._read_versions, conn, -1)
+            self._versions = versions or {}
+            self._handle(results)
+            self.polled.set()
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    data_version, versions, results = await asyncio.to_thread(
+                        self._read_versions, conn, data_version
+                    )
+                except sqlite3.Error as e:
+                    logger.warning("读取缓存版本失败: %s", e)
+                    continue
+                if versions is None:
+                    continue
+                self._handle(results)
+                changed = [
+                    topic for topic, version in versions.items()
+                    if self._versions.get(topic) != version
+                ]
+                self._versions = versions
+                if changed:
+                    self.notify(*changed)
+        finally:
+            conn.close()
+
+    def start(self, db_path: str, interval: float = None) -> None:
+        """启动轮询任务（需在事件循环中调用）"""
+        if self._task is None:
+            self.polled = asyncio.Event()
+            self._task = asyncio.create_task(
+                self._poll(db_path, interval or settings.INVALIDATION_POLL_INTERVAL)
+            )
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+invalidation = InvalidationChannel()
+
+@event.listens_for(Session, "after_commit")
+def _notify_after_commit(session: Session) -> None:
+    topics = session.info.pop(_SESSION_KEY, None)
+    if topics:
+        invalidation.notify(*topics)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,142 @@
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Optional
+
+from .config import settings
+
+# 后台写日志的监听线程，由 setup_logging 创建
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["QueueHandler"] = None
+_log_file: Optional[str] = None
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    """结构化 JSON 日志格式，每条记录输出一行"""
+
+    # LogRecord 的标准属性，其余属性视为 extra 字段输出
+    _reserved = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in self._reserved and not key.startswith("_"):
+                data[key] = value
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """放入队列前只合并消息参数，保留 exc_info / exc_text / stack_info
+
+    标准库的 prepare 会用默认格式把异常堆栈拼进消息并清空 exc_info，JSON 日志就拿不到
+    单独的 exc_info 字段。队列在进程内，记录不需要序列化，由写文件的格式化器处理异常信息。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+def get_log_dir() -> str:
+    """获取日志目录"""
+    if settings.LOG_DIR:
+        return settings.LOG_DIR
+    if getattr(sys, 'frozen', False):
+        # 如果是打包后的环境
+        base_dir = os.path.dirname(sys.executable)
+        if 'Resources' in base_dir:
+            return os.path.join(os.path.dirname(base_dir), 'backend', 'logs')
+        return os.path.join(base_dir, 'logs')
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
+
+def get_log_file_name() -> str:
+    """日志文件名；多 worker 时每个进程写自己的文件，各自轮转互不干扰"""
+    if settings.WORKERS > 1:
+        return f'maoflow.{os.getpid()}.log'
+    return 'maoflow.log'
+
+def _create_file_handler(log_file: str) -> logging.Handler:
+    """按配置创建按时间或按大小轮转的文件处理器"""
+    if settings.LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            log_file,
+            when=settings.LOG_ROTATE_WHEN,
+            backupCount=settings.LOG_BACKUP_COUNT,
+            encoding='utf-8',
+            delay=True
+        )
+    return logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=settings.LOG_MAX_BYTES,
+        backupCount=settings.LOG_BACKUP_COUNT,
+        encoding='utf-8',
+        delay=True
+    )
+
+def setup_logging() -> str:
+    """设置日志（在应用启动时调用，重复调用只配置一次）
+
+    请求路径中的日志调用只把记录放入队列，由后台线程负责格式化和写盘，
+    避免磁盘 I/O 阻塞事件循环。
+    """
+    global _listener, _queue_handler, _log_file
+    if _listener:
+        return _log_file
+
+    log_dir = get_log_dir()
+    # 确保日志目录存在
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, get_log_file_name())
+
+    formatter = JsonFormatter() if settings.LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [_create_file_handler(log_file)]
+    if settings.LOG_TO_CONSOLE:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL)
+    _queue_handler = QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    _log_file = log_file
+    return log_file
+
+def log_queue_depth() -> int:
+    """等待后台线程写出的日志记录数"""
+    if _queue_handler is None:
+        return 0
+    return _queue_handler.queue.qsize()
+
+def shutdown_logging() -> None:
+    """停止后台日志线程并写完队列中剩余的记录"""
+    global _listener, _queue_handler
+    if _queue_handler:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,104 @@
+"""事件循环延迟监控
+
+采样任务每隔 interval 休眠一次，实际醒来时间与预期的差值就是事件循环的调度延迟，
+计入 `maoflow_event_loop_lag_seconds` 直方图。开启 capture_stacks 时另起一个看门狗线程：
+事件循环超过 block_threshold 没有推进心跳，就抓取事件循环线程当前的调用栈并记录警告，
+用于定位阻塞事件循环的同步代码（解密、大段文本处理、大列表校验等）。
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+loop_lag = metrics.registry.histogram(
+    "maoflow_event_loop_lag_seconds", "事件循环调度延迟",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+loop_blocks = metrics.registry.counter(
+    "maoflow_event_loop_blocks_total", "事件循环阻塞超过阈值的次数")
+
+class LoopMonitor:
+    """事件循环延迟采样与阻塞调用栈抓取"""
+
+    def __init__(self, interval: float = 0.1, block_threshold: float = 0.1,
+                 capture_stacks: bool = False, max_reports: int = 20):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.capture_stacks = capture_stacks
+        # 最近的阻塞记录：{"duration": 秒, "stack": 调用栈文本}
+        self.reports: Deque[Dict] = deque(maxlen=max_reports)
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        if self.capture_stacks:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(now - expected, 0.0)
+            loop_lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.block_threshold:
+                loop_blocks.inc()
+                if not self.capture_stacks:
+                    logger.warning("事件循环阻塞 %.0f ms", lag * 1000)
+
+    def _watch(self) -> None:
+        """看门狗线程：心跳停滞时抓取事件循环线程的调用栈，每次阻塞只记录一次"""
+        reported_for = None
+        check = min(self.block_threshold / 2, 0.05)
+        while not self._stop.wait(check):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat
+            # 心跳预期每 interval 推进一次，超出部分才是阻塞
+            if stalled - self.interval < self.block_threshold or reported_for == heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported_for = heartbeat
+            stack = "".join(traceback.format_stack(frame))
+            self.reports.append({"duration": stalled - self.interval, "stack": stack})
+            logger.warning("事件循环阻塞超过 %.0f ms，当前调用栈:\n%s", self.block_threshold * 1000, stack)
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,118 @@
+"""进程内发布/订阅
+
+按键（如会话 ID、用户 ID）分发消息给任意数量的订阅者。每个订阅者有一个有界队列，
+发布方只做 put_nowait，从不等待：队列满（消费者跟不上）时直接断开该订阅者，
+而不是拖慢发布方或其他订阅者。被断开的订阅者结束迭代并置 `dropped`，可以自行重连补齐。
+多 worker 部署时只在本进程内分发。
+"""
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Hashable, Optional, Set
+
+from . import metrics
+from .config import settings
+
+_CLOSED = object()
+
+pubsub_dropped = metrics.registry.counter(
+    "maoflow_pubsub_dropped_subscribers_total", "队列已满被断开的订阅者数", ("hub",))
+
+class Subscription:
+    """一个订阅者：异步迭代接收消息，用 async with 保证退出时取消订阅"""
+
+    def __init__(self, hub: "Hub", key: Hashable, maxsize: int):
+        self.hub = hub
+        self.key = key
+        self.maxsize = maxsize
+        self.dropped = False
+        # 长度由 _offer 限制，结束标记总能放入
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._closed = False
+
+    def _offer(self, item: Any) -> bool:
+        if self._closed:
+            return False
+        if self._queue.qsize() >= self.maxsize:
+            self.dropped = True
+            self._close(discard=True)
+            return False
+        self._queue.put_nowait(item)
+        return True
+
+    def _close(self, discard: bool = False) -> None:
+        """结束迭代；discard 时丢弃未读消息"""
+        if self._closed:
+            return
+        self._closed = True
+        while discard and not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_CLOSED)
+
+    def close(self) -> None:
+        """取消订阅，未读消息不再返回"""
+        self.hub._remove(self)
+        self._close(discard=True)
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Any:
+        item = await self._queue.get()
+        if item is _CLOSED:
+            # 保留结束标记，重复迭代也立即结束
+            self._queue.put_nowait(_CLOSED)
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self) -> "Subscription":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
+
+class Hub:
+    """按键分发消息的订阅表"""
+
+    def __init__(self, name: str, queue_size: Optional[int] = None):
+        self.name = name
+        self.queue_size = queue_size
+        self._subscribers: Dict[Hashable, Set[Subscription]] = defaultdict(set)
+
+    def subscribe(self, key: Hashable, maxsize: Optional[int] = None) -> Subscription:
+        size = maxsize or self.queue_size or settings.PUBSUB_QUEUE_SIZE
+        subscription = Subscription(self, key, size)
+        self._subscribers[key].add(subscription)
+        return subscription
+
+    def publish(self, key: Hashable, item: Any) -> int:
+        """发送给该键的所有订阅者，返回送达的订阅者数"""
+        subscribers = self._subscribers.get(key)
+        if not subscribers:
+            return 0
+        delivered = 0
+        for subscription in list(subscribers):
+            if subscription._offer(item):
+                delivered += 1
+            else:
+                subscribers.discard(subscription)
+                pubsub_dropped.inc(hub=self.name)
+        if not subscribers:
+            del self._subscribers[key]
+        return delivered
+
+    def subscriber_count(self, key: Hashable) -> int:
+        return len(self._subscribers.get(key, ()))
+
+    def close_all(self) -> None:
+        """结束所有订阅（关闭时让长连接退出），已收到的消息仍可读完"""
+        for subscribers in list(self._subscribers.values()):
+            for subscription in list(subscribers):
+                subscription._close()
+        self._subscribers.clear()
+
+    def _remove(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.key]
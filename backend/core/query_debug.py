@@ -0,0 +1,146 @@
+"""SQL 语句计数与 N+1 检测（开发 / 测试用）
+
+`SQL_DEBUG=true` 时 QueryDebugMiddleware 记录每个请求执行的 SQL 语句，请求结束后：
+- 超过接口用 `@query_budget(n)` 声明的语句数上限时记录警告；
+- 同一语句形状（参数替换为占位符后的 SQL）重复执行达到 `SQL_DEBUG_REPEAT_THRESHOLD`
+  次时记录警告，这通常是循环内的懒加载或逐行查询（N+1）。
+测试中用 `count_queries()` 统计一段代码的语句，`assert_query_budget()` 断言。
+统计范围是当前上下文及其中创建的任务；请求结束后仍继续运行的后台任务（如流程执行）用
+`detached_context()` 启动，不计入发起请求的预算。
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_BUDGET_ATTR = "__query_budget__"
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_statement(statement: str) -> str:
+    """语句形状：合并空白，IN 列表展开的多个占位符合并为一个"""
+    statement = _WHITESPACE.sub(" ", statement.strip())
+    return _PLACEHOLDER_LIST.sub("?...", statement)
+
+def query_budget(limit: int) -> Callable:
+    """声明接口的 SQL 语句数上限（放在路由装饰器下方）"""
+    def decorator(func: Callable) -> Callable:
+        setattr(func, _BUDGET_ATTR, limit)
+        return func
+    return decorator
+
+def get_query_budget(endpoint: Optional[Callable]) -> Optional[int]:
+    return getattr(endpoint, _BUDGET_ATTR, None)
+
+class QueryLog:
+    """一段时间内执行的语句形状"""
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def record(self, statement: str) -> None:
+        self.statements.append(normalize_statement(statement))
+
+    def repeated(self, threshold: Optional[int] = None) -> Dict[str, int]:
+        """重复次数达到阈值的语句形状"""
+        threshold = threshold or settings.SQL_DEBUG_REPEAT_THRESHOLD
+        return {shape: n for shape, n in Counter(self.statements).items() if n >= threshold}
+
+    def problems(self, budget: Optional[int] = None, threshold: Optional[int] = None) -> List[str]:
+        """超出预算和疑似 N+1 的描述，没有问题时返回空列表"""
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f"执行了 {self.count} 条 SQL，超过预算 {budget}")
+        for shape, n in self.repeated(threshold).items():
+            problems.append(f"疑似 N+1，同一语句执行 {n} 次: {shape[:200]}")
+        return problems
+
+_current: ContextVar[Optional[QueryLog]] = ContextVar("query_log", default=None)
+_collectors: ContextVar[Tuple[QueryLog, ...]] = ContextVar("query_collectors", default=())
+
+def instrument_queries(engine: Engine) -> None:
+    """把引擎执行的语句记入当前请求和 count_queries()，异步引擎需传入 engine.sync_engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        log = _current.get()
+        if log is not None:
+            log.record(statement)
+        for collector in _collectors.get():
+            collector.record(statement)
+
+@contextmanager
+def count_queries() -> Iterator[QueryLog]:
+    """统计代码块内（包括其中创建的任务）执行的语句（引擎需已调用 instrument_queries）"""
+    log = QueryLog()
+    token = _collectors.set(_collectors.get() + (log,))
+    try:
+        yield log
+    finally:
+        _collectors.reset(token)
+
+def detached_context() -> Context:
+    """当前上下文的副本，其中执行的语句不计入当前请求和 count_queries()
+
+    用于请求中启动、在响应之后继续运行的后台任务：`asyncio.create_task(coro, context=detached_context())`。
+    """
+    context = copy_context()
+    context.run(_current.set, None)
+    context.run(_collectors.set, ())
+    return context
+
+def assert_query_budget(log: QueryLog, endpoint: Callable, threshold: Optional[int] = None) -> None:
+    """断言语句数不超过接口声明的预算且没有 N+1"""
+    budget = get_query_budget(endpoint)
+    if budget is None:
+        raise AssertionError(f"{endpoint.__qualname__} 没有声明 query_budget")
+    problems = log.problems(budget, threshold)
+    if problems:
+        raise AssertionError(
+            f"{endpoint.__qualname__}: " + "; ".join(problems) + "\n" + "\n".join(log.statements)
+        )
+
+class QueryDebugMiddleware:
+    """记录每个请求的语句数，超出预算或出现 N+1 时记录警告"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = _current.set(log)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # 流式响应在发送头部后仍会执行语句，完整数量见日志
+                MutableHeaders(scope=message)["X-Query-Count"] = str(log.count)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            endpoint = scope.get("endpoint")
+            problems = log.problems(get_query_budget(endpoint))
+            for problem in problems:
+                logger.warning("%s %s: %s", scope["method"], scope["path"], problem)
+            logger.debug("%s %s 执行 %d 条 SQL", scope["method"], scope["path"], log.count)
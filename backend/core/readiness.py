@@ -0,0 +1,86 @@
+"""后端就绪状态
+
+启动时依次完成迁移、连接池预热、模型配置加载和最近会话的页缓存预热，全部完成后
+标记为就绪：`/health/ready` 返回 200，run.py 在开始监听后向 stdout 输出一行
+`MAOFLOW_READY {...}`，供 Electron 主进程判断何时可以请求历史数据。
+
+迁移和连接池是必需步骤：失败时启动照常结束并输出就绪行（`"ok": false`，便于 Electron 提示错误），
+但不标记为就绪，`/health/ready` 保持 503。其他步骤失败只影响首次请求的速度。
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# stdout 就绪行前缀，Electron 端按此匹配
+READY_PREFIX = "MAOFLOW_READY"
+
+class Readiness:
+    """记录启动预热各步骤的耗时和结果"""
+
+    def __init__(self):
+        # started：启动步骤已全部执行；ready：且必需步骤都成功
+        self.started = False
+        self.ready = False
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.failed: List[str] = []
+        self._started = time.perf_counter()
+
+    @property
+    def ok(self) -> bool:
+        """必需步骤是否都成功"""
+        return not self.failed
+
+    def record(
+        self,
+        name: str,
+        elapsed_ms: float,
+        ok: bool = True,
+        error: str = None,
+        required: bool = False
+    ) -> None:
+        self.steps[name] = {"ok": ok, "elapsed_ms": round(elapsed_ms, 1)}
+        if error:
+            self.steps[name]["error"] = error
+        if required and not ok:
+            self.failed.append(name)
+
+    async def run_step(self, name: str, awaitable: Awaitable, required: bool = False) -> Any:
+        """执行一个启动步骤；失败只记录，不中断启动，必需步骤失败时不会标记为就绪"""
+        start = time.perf_counter()
+        try:
+            result = await awaitable
+        except Exception as e:
+            logger.exception("启动步骤 %s 失败", name)
+            self.record(name, (time.perf_counter() - start) * 1000, ok=False, error=str(e), required=required)
+            return None
+        ok = result is not False
+        self.record(name, (time.perf_counter() - start) * 1000, ok=ok, required=required)
+        return result
+
+    def mark_ready(self) -> None:
+        """启动步骤执行完毕：必需步骤都成功时标记为就绪"""
+        self.started = True
+        self.ready = self.ok
+        if self.ready:
+            logger.info("后端已就绪: %s", self.steps)
+        else:
+            logger.error("必需的启动步骤失败（%s），后端未就绪: %s", ", ".join(self.failed), self.steps)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "ok": self.ok,
+            "uptime_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            "steps": self.steps,
+        }
+
+    def announce(self, address: str) -> None:
+        """输出机器可读的就绪行（在服务开始监听之后调用）"""
+        payload = {"pid": os.getpid(), "address": address, **self.status()}
+        print(f"{READY_PREFIX} {json.dumps(payload, ensure_ascii=False)}", flush=True)
+
+readiness = Readiness()
@@ -1,9 +1,6 @@
 import os
 from typing import Tuple
 from base64 import b64encode, b64decode
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import padding
 
 from .config import Settings
 
@@ -31,6 +28,11 @@ def encrypt_text(text: str) -> Tuple[str, str]:
     """
     if not text:
         return "", ""
+
+    # 延迟导入 cryptography，避免拖慢后端启动
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import padding
     
     # 生成随机IV
     iv = os.urandom(16)
@@ -70,6 +72,11 @@ def decrypt_text(encrypted_text: str, iv_text: str) -> str:
     """
     if not encrypted_text or not iv_text:
         return ""
+
+    # 延迟导入 cryptography，避免拖慢后端启动
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import padding
     
     try:
         # 解码base64
@@ -0,0 +1,95 @@
+"""启动导入耗时分析
+
+基于 `python -X importtime` 统计后端启动（导入 main 并创建应用）时各模块的导入耗时。
+
+用法::
+
+    python -m core.startup_profile --top 30
+"""
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import List
+
+# 与 run.py 的启动路径保持一致：解析参数并创建应用实例
+STARTUP_SNIPPET = "import main; main.configure_from_cli([]); main.create_app()"
+
+# 启动阶段不应加载的重量级模块，首次使用时才导入
+LAZY_MODULES = ("openai", "tenacity", "cryptography", "alembic")
+
+@dataclass
+class ImportRecord:
+    """单个模块的导入耗时（微秒）"""
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+def run_importtime(snippet: str = STARTUP_SNIPPET) -> str:
+    """在子进程中以 -X importtime 运行启动代码，返回原始 stderr 输出"""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", snippet],
+        cwd=backend_dir,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"启动代码执行失败:\n{result.stderr[-2000:]}")
+    return result.stderr
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    """解析 -X importtime 输出"""
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, _, fields = line.partition(":")
+        self_us, cumulative_us, name = fields.split("|", 2)
+        records.append(ImportRecord(
+            module=name.strip(),
+            self_us=int(self_us),
+            cumulative_us=int(cumulative_us),
+            depth=(len(name) - len(name.lstrip()) - 1) // 2,
+        ))
+    return records
+
+def total_import_ms(records: List[ImportRecord]) -> float:
+    """所有模块导入自身耗时之和（毫秒）"""
+    return sum(r.self_us for r in records) / 1000
+
+def loaded_lazy_modules(records: List[ImportRecord]) -> List[str]:
+    """返回启动阶段被提前加载的重量级模块"""
+    loaded = {r.module.split(".")[0] for r in records}
+    return [m for m in LAZY_MODULES if m in loaded]
+
+def format_report(records: List[ImportRecord], top: int = 20) -> str:
+    """生成按累计耗时排序的启动导入报告"""
+    lines = [f"后端启动导入总耗时: {total_import_ms(records):.1f} ms"]
+
+    # 按顶层包汇总
+    packages = {}
+    for r in records:
+        package = r.module.split(".")[0]
+        packages[package] = packages.get(package, 0) + r.self_us
+    lines.append("\n=== 顶层包耗时 ===")
+    for package, us in sorted(packages.items(), key=lambda x: -x[1])[:top]:
+        lines.append(f"{us / 1000:10.1f} ms  {package}")
+
+    lines.append("\n=== 模块累计耗时 ===")
+    for r in sorted(records, key=lambda r: -r.cumulative_us)[:top]:
+        lines.append(f"{r.cumulative_us / 1000:10.1f} ms  {'  ' * r.depth}{r.module}")
+
+    lazy = loaded_lazy_modules(records)
+    if lazy:
+        lines.append(f"\n警告: 启动阶段加载了应延迟导入的模块: {', '.join(lazy)}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MaoFlow 后端启动导入耗时报告")
+    parser.add_argument("--top", type=int, default=20, help="显示耗时最多的前 N 项")
+    args = parser.parse_args()
+    print(format_report(parse_importtime(run_importtime()), top=args.top))
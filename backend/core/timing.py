@@ -0,0 +1,162 @@
+"""请求耗时分解
+
+TimingMiddleware 为每个请求创建一个 RequestTimings 并放入 contextvar，各处把耗时
+累加进去：数据库语句（db，SQLAlchemy 引擎事件）、模型首个 token 等待（provider_ttft）
+和上游流总耗时（upstream，timed_stream 包装 create_chat_completion）、
+JSON 序列化（serialize，FastJSONResponse）。普通响应通过
+`Server-Timing` 响应头返回，流式响应的头部在生成前已发送，改为在结束前发送 `stats` 事件。
+同样的数据也汇总到 core.metrics，供 `/metrics` 抓取。
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Iterator, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import metrics
+
+T = TypeVar("T")
+
+class RequestTimings:
+    """单个请求的耗时累计（毫秒）和 SQL 语句数"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self.db_count = 0
+
+    def add(self, name: str, elapsed_ms: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + elapsed_ms
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        """用于 SSE stats 事件"""
+        result = {name: round(ms, 1) for name, ms in self.durations.items()}
+        result["db_count"] = self.db_count
+        result["total"] = round(self.total_ms(), 1)
+        return result
+
+    def header(self) -> str:
+        """Server-Timing 响应头的值"""
+        parts = []
+        for name, ms in self.durations.items():
+            part = f"{name};dur={ms:.1f}"
+            if name == "db":
+                part += f';desc="{self.db_count} queries"'
+            parts.append(part)
+        parts.append(f"app;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def current_timings() -> Optional[RequestTimings]:
+    """当前请求的耗时记录，不在请求中时返回 None"""
+    return _current.get()
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    """累计当前请求中一段代码的耗时，不在请求中时不做任何事"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    with timings.measure(name):
+        yield
+
+async def timed_stream(
+    chunks: AsyncIterator[T],
+    model: str = "",
+    first: str = "provider_ttft",
+    total: str = "upstream"
+) -> AsyncIterator[T]:
+    """记录上游流的首块等待时间和总耗时（包括建立请求），同时计入 /metrics"""
+    timings = _current.get()
+    start = time.perf_counter()
+    first_at: Optional[float] = None
+    count = 0
+    try:
+        async for chunk in chunks:
+            count += 1
+            if first_at is None:
+                first_at = time.perf_counter()
+                metrics.llm_ttft.observe(first_at - start, model=model)
+                if timings is not None:
+                    timings.add(first, (first_at - start) * 1000)
+            yield chunk
+    except Exception:
+        metrics.llm_upstream_errors.inc(model=model)
+        raise
+    finally:
+        end = time.perf_counter()
+        metrics.llm_stream_duration.observe(end - start, model=model)
+        if first_at is not None and count > 1 and end > first_at:
+            metrics.llm_tokens_per_second.observe((count - 1) / (end - first_at), model=model)
+        if timings is not None:
+            timings.add(total, (end - start) * 1000)
+
+def instrument_engine(engine: Engine) -> None:
+    """监听引擎的语句执行，异步引擎需传入 engine.sync_engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("timing_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["timing_start"].pop()
+        timings = _current.get()
+        if timings is not None:
+            timings.add("db", (time.perf_counter() - start) * 1000)
+            timings.db_count += 1
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("timing_start"):
+            conn.info["timing_start"].pop()
+
+class TimingMiddleware:
+    """为每个请求记录耗时并写入 Server-Timing 响应头"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.header())
+                # 用路由模板作为标签，避免按具体 ID 产生大量序列
+                route = scope.get("route")
+                route_path = getattr(route, "path", "unmatched")
+                metrics.http_requests.inc(
+                    method=scope["method"], route=route_path, status=str(message["status"]))
+                metrics.http_duration.observe(
+                    timings.total_ms() / 1000, method=scope["method"], route=route_path)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
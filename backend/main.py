@@ -1,74 +1,181 @@
 import argparse
+import asyncio
 import os
 from pathlib import Path
+from typing import Optional, Sequence
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from core.config import settings
-from core.database import run_migrations
-from app.system.routers import user_router
-from app.llm.routers import conversation_router, message_router, model_router
-from app.api.api_v1.api import api_router
-
-# 解析命令行参数
-parser = argparse.ArgumentParser(description='MaoFlow Backend Server')
-parser.add_argument('--db-path', type=str, help='SQLite数据库文件的路径')
-args = parser.parse_args()
-
-# 如果指定了数据库路径，更新配置
-if args.db_path:
-    settings.DB_PATH = args.db_path
-elif os.environ.get('MAOFLOW_DB_PATH'):
-    settings.DB_PATH = os.environ.get('MAOFLOW_DB_PATH')
-
-# 确保数据库目录存在
-if settings.DB_PATH:
-    db_dir = Path(settings.DB_PATH).parent
-    db_dir.mkdir(parents=True, exist_ok=True)
-
-app = FastAPI(
-    title=settings.APP_NAME,
-    openapi_url=f"{settings.API_PREFIX}/openapi.json" if settings.docs_enabled else None,
-    docs_url=f"{settings.API_PREFIX}/docs" if settings.docs_enabled else None,
-    redoc_url=f"{settings.API_PREFIX}/redoc" if settings.docs_enabled else None,
-)
-
-# 配置CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.CORS_ORIGINS,
-    allow_credentials=True,
-    allow_methods=settings.CORS_METHODS,
-    allow_headers=settings.CORS_HEADERS
-)
-
-# 注册路由
-app.include_router(user_router, prefix=settings.API_PREFIX)
-app.include_router(conversation_router, prefix=settings.API_PREFIX)
-app.include_router(message_router, prefix=settings.API_PREFIX)
-app.include_router(model_router, prefix=settings.API_PREFIX)
-app.include_router(api_router, prefix=settings.API_PREFIX)
-
-@app.get("/")
-async def root():
-    """健康检查"""
-    return {
-        "status": "ok",
-        "service": settings.APP_NAME,
-        "version": "1.0.0"
-    }
-
-# 启动事件
-@app.on_event("startup")
-async def startup_event():
-    # 运行数据库迁移
-    run_migrations()
+
+def configure_from_cli(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    """解析命令行参数并更新配置，需在导入 core.database 之前调用"""
+    parser = argparse.ArgumentParser(description='MaoFlow Backend Server')
+    parser.add_argument('--db-path', type=str, help='SQLite数据库文件的路径')
+    parser.add_argument('--workers', type=int, help='worker 进程数，大于 1 时启用多进程模式')
+    parser.add_argument('--uds', type=str, help='监听的 Unix 域套接字路径（替代 TCP 端口）')
+    # 忽略 uvicorn / pytest 等宿主进程的参数
+    args, _ = parser.parse_known_args(argv)
+
+    # 如果指定了数据库路径，更新配置
+    if args.db_path:
+        settings.DB_PATH = args.db_path
+    elif os.environ.get('MAOFLOW_DB_PATH'):
+        settings.DB_PATH = os.environ.get('MAOFLOW_DB_PATH')
+    if args.workers:
+        settings.WORKERS = args.workers
+    if args.uds:
+        settings.UDS_PATH = args.uds
+
+    # 确保数据库目录存在
+    if settings.DB_PATH:
+        db_dir = Path(settings.DB_PATH).parent
+        db_dir.mkdir(parents=True, exist_ok=True)
+    return args
+
+def create_app() -> FastAPI:
+    """创建应用实例
+
+    路由和数据库模块在这里才导入，使 `import main` 保持轻量，
+    并保证数据库路径在引擎创建前已经确定。
+    """
+    from fastapi.responses import JSONResponse, Response
+    from core.change_feed import change_hub, change_relay
+    from core.compression import CompressionMiddleware
+    from core.database import run_migrations, get_database_url, warm_up_pool, async_session
+    from core.invalidation import invalidation
+    from core.logger import setup_logging, shutdown_logging
+    from core.loop_monitor import loop_monitor
+    from core.metrics import registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+    from core.readiness import readiness
+    from core.serialization import FastJSONResponse
+    from core.timing import TimingMiddleware
+    from core.query_debug import QueryDebugMiddleware
+    from app.llm.services.batch import batch_runner
+    from app.llm.services.generation import generation_runner, conversation_hub
+    from app.llm.services.model_registry import model_registry
+    from app.llm.services.tools import tool_registry
+    from app.llm.services.warmup import prewarm_recent_conversations
+    from app.system.routers import user_router
+    from app.flow.routers import flow_router
+    from app.flow.services import flow_runner
+    from app.llm.routers import batch_router, conversation_router, message_router, model_router, stream_router
+
+    setup_logging()
+
+    app = FastAPI(
+        title=settings.APP_NAME,
+        openapi_url=f"{settings.API_PREFIX}/openapi.json" if settings.docs_enabled else None,
+        docs_url=f"{settings.API_PREFIX}/docs" if settings.docs_enabled else None,
+        redoc_url=f"{settings.API_PREFIX}/redoc" if settings.docs_enabled else None,
+        default_response_class=FastJSONResponse,
+    )
+
+    # 配置CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=settings.CORS_METHODS,
+        allow_headers=settings.CORS_HEADERS
+    )
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        offload_size=settings.COMPRESSION_OFFLOAD_SIZE
+    )
+    if settings.SQL_DEBUG:
+        app.add_middleware(QueryDebugMiddleware)
+    # 最外层，总耗时包含其他中间件
+    app.add_middleware(TimingMiddleware)
+
+    # 注册路由
+    app.include_router(user_router, prefix=settings.API_PREFIX)
+    app.include_router(conversation_router, prefix=settings.API_PREFIX)
+    app.include_router(message_router, prefix=settings.API_PREFIX)
+    app.include_router(model_router, prefix=settings.API_PREFIX)
+    app.include_router(stream_router, prefix=settings.API_PREFIX)
+    app.include_router(batch_router, prefix=settings.API_PREFIX)
+    app.include_router(flow_router, prefix=settings.API_PREFIX)
+
+    @app.get("/")
+    async def root():
+        """健康检查"""
+        return {
+            "status": "ok",
+            "service": settings.APP_NAME,
+            "version": "1.0.0"
+        }
+
+    @app.get("/health/ready")
+    async def health_ready():
+        """就绪检查：启动预热全部完成后返回 200"""
+        return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus 格式的进程内指标"""
+        return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+    # 启动事件
+    @app.on_event("startup")
+    async def startup_event():
+        # 运行数据库迁移（多 worker 模式下由主进程在启动前完成）
+        if settings.RUN_MIGRATIONS_ON_STARTUP:
+            await readiness.run_step("migrations", asyncio.to_thread(run_migrations), required=True)
+        # 预热连接池、模型配置和最近会话，完成后才对外报告就绪（迁移和连接池失败时不就绪）
+        await readiness.run_step("db_pool", warm_up_pool(), required=True)
+        async with async_session() as session:
+            await readiness.run_step("model_registry", model_registry.load(session))
+            await readiness.run_step(
+                "page_cache",
+                prewarm_recent_conversations(session, settings.PREWARM_CONVERSATIONS)
+            )
+        readiness.mark_ready()
+        # 多 worker 模式下 socket 已由主进程监听，各 worker 启动完成即可处理请求
+        if settings.READY_ANNOUNCE_ADDRESS:
+            readiness.announce(settings.READY_ANNOUNCE_ADDRESS)
+        if settings.LOOP_MONITOR_INTERVAL_MS > 0:
+            loop_monitor.interval = settings.LOOP_MONITOR_INTERVAL_MS / 1000
+            loop_monitor.block_threshold = settings.LOOP_BLOCK_THRESHOLD_MS / 1000
+            loop_monitor.capture_stacks = settings.LOOP_BLOCK_CAPTURE_STACKS
+            loop_monitor.start()
+        # 多进程共享数据库时，轮询其他 worker 的缓存失效通知和数据变更
+        if settings.WORKERS > 1:
+            change_relay.enable(invalidation)
+            invalidation.start(get_database_url().replace('sqlite+aiosqlite:///', ''))
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        # 取消运行中的批次和流程执行，再等待进行中的生成完成保存
+        await batch_runner.shutdown()
+        await flow_runner.shutdown()
+        await generation_runner.shutdown()
+        tool_registry.shutdown()
+        # 结束实时订阅的长连接
+        conversation_hub.close_all()
+        change_hub.close_all()
+        await invalidation.stop()
+        await loop_monitor.stop()
+        # 写完队列中剩余的日志
+        shutdown_logging()
+
+    return app
+
+def __getattr__(name: str):
+    """`uvicorn main:app` 访问 app 时才创建应用实例"""
+    if name == "app":
+        global app
+        configure_from_cli([])
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     import uvicorn
+    configure_from_cli()
     uvicorn.run(
-        app,
+        create_app(),
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.DEBUG
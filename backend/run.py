@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 import uvicorn
-from main import create_app
+import multiprocessing
 import os
 import sys
-from core.database import run_migrations, get_database_url
+import time
+from main import configure_from_cli, create_app
 
 if __name__ == "__main__":
+    # 打包环境下多 worker 模式需要
+    multiprocessing.freeze_support()
     print("\n=== 应用启动 ===")
     # 从配置获取默认值（需确保已正确加载环境变量）
     from core.config import get_settings
     settings = get_settings()
+
+    # 命令行参数（如 --db-path）必须在数据库引擎创建前生效
+    configure_from_cli()
+    from core.database import run_migrations, get_database_url
     
     # 获取工作目录
     if getattr(sys, 'frozen', False):
@@ -74,24 +81,66 @@ if __name__ == "__main__":
         print("数据库文件不存在，将在迁移时创建")
     
     print("\n=== 运行数据库迁移 ===")
+    from core.readiness import readiness
+    migration_start = time.perf_counter()
     if not run_migrations():
         print("数据库迁移失败")
         sys.exit(1)
+    readiness.record("migrations", (time.perf_counter() - migration_start) * 1000)
+    
+    # 迁移已在此完成，应用启动时不再重复执行
+    settings.RUN_MIGRATIONS_ON_STARTUP = False
+    
+    # 监听地址：桌面端通过 Unix 域套接字通信，避免 TCP 开销和端口冲突
+    if settings.UDS_PATH:
+        if os.path.exists(settings.UDS_PATH):
+            os.remove(settings.UDS_PATH)
+        bind = {"uds": settings.UDS_PATH}
+        address = f"unix:{settings.UDS_PATH}"
+    else:
+        bind = {"host": "0.0.0.0", "port": settings.PORT}  # 允许外部访问
+        address = f"http://{settings.HOST}:{settings.PORT}"
+    print(f"\n启动服务器: {address}")
+    
+    if settings.WORKERS > 1:
+        # 多 worker 模式：各 worker 进程通过 main:app 自行创建应用，配置经环境变量传递
+        print(f"多进程模式: {settings.WORKERS} 个 worker")
+        print("注意: 进行中的生成只保存在发起它的 worker 中，重连（/messages/{id}/stream）、"
+              "取消和 WebSocket 接入落在其他 worker 上时返回 404；需要这些功能请使用单 worker 或按会话粘性路由")
+        if settings.DB_PATH:
+            os.environ['MAOFLOW_DB_PATH'] = os.path.abspath(settings.DB_PATH)
+        os.environ['WORKERS'] = str(settings.WORKERS)
+        os.environ['RUN_MIGRATIONS_ON_STARTUP'] = 'false'
+        # 各 worker 启动完成后分别输出就绪行（带各自的 pid）
+        os.environ['READY_ANNOUNCE_ADDRESS'] = address
+        uvicorn.run(
+            "main:app",
+            **bind,
+            workers=settings.WORKERS,
+            log_config=None,
+            access_log=True
+        )
+        sys.exit(0)
     
     # 创建应用实例
     print("\n=== 创建应用实例 ===")
     app = create_app()
     
-    print(f"\n启动服务器: http://{settings.HOST}:{settings.PORT}")
+    class ReadyServer(uvicorn.Server):
+        """开始监听后输出就绪行，通知 Electron 可以请求数据（必需步骤失败时 ok 为 false）"""
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            if not self.should_exit and readiness.started:
+                readiness.announce(address)
     
     # 启动服务器
-    uvicorn.run(
+    config = uvicorn.Config(
         app=app,
-        host="0.0.0.0",  # 允许外部访问
-        port=settings.PORT,
+        **bind,
         ssl_certfile=None,  # 明确禁用SSL
         ssl_keyfile=None,
         reload=False,
         log_config=None,
         access_log=True  # 启用访问日志以便调试
-    )
\ No newline at end of file
+    )
+    ReadyServer(config).run()
\ No newline at end of file
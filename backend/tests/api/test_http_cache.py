@@ -0,0 +1,83 @@
+from datetime import timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+
+import pytest
+from httpx import AsyncClient
+
+from app.llm.models import Conversation, LLMModel
+from app.llm.schemas.message import MessageCreate
+from app.llm.models.message import MessageRole
+from app.llm.services import MessageService
+
+@pytest.fixture
+async def conversation(session):
+    model = LLMModel(name="cache", type="open_ai_like", model_name="cache", api_key="")
+    session.add(model)
+    await session.flush()
+    conversation = Conversation(title="t", model_id=model.id, user_id="u1")
+    session.add(conversation)
+    await session.commit()
+    return conversation
+
+async def test_conversation_not_modified(client: AsyncClient, conversation):
+    """测试会话详情的 ETag 和 304，更新后 ETag 变化"""
+    url = f"/api/conversations/{conversation.id}"
+    response = await client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    await client.patch(url, json={"title": "new"})
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+async def test_messages_not_modified(client: AsyncClient, session, conversation):
+    """测试消息列表在新增消息前返回 304，之后返回新内容"""
+    url = f"/api/conversations/{conversation.id}/messages"
+    response = await client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    await MessageService(session).create_message(MessageCreate(
+        conversation_id=conversation.id,
+        user_id="u1",
+        content="hi",
+        role=MessageRole.USER
+    ))
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+async def test_messages_if_modified_since(client: AsyncClient, conversation):
+    """测试 If-Modified-Since 只在修改时间早于其所在的秒时返回 304，同一秒内返回完整响应"""
+    url = f"/api/conversations/{conversation.id}/messages"
+    response = await client.get(url)
+    last_modified = response.headers["Last-Modified"]
+
+    response = await client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 200
+    assert "ETag" in response.headers
+
+    later = format_datetime(parsedate_to_datetime(last_modified) + timedelta(seconds=1), usegmt=True)
+    response = await client.get(url, headers={"If-Modified-Since": later})
+    assert response.status_code == 304
+
+async def test_models_not_modified(client: AsyncClient, conversation):
+    response = await client.get("/api/models")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = await client.get("/api/models", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # 过滤条件不同则内容和 ETag 不同
+    response = await client.get("/api/models", params={"type": "none"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
@@ -0,0 +1,166 @@
+"""每个接口的 SQL 语句数预算
+
+预算用 `@query_budget(n)` 声明在接口函数上；这里逐个调用接口，断言实际语句数
+不超过预算且没有重复执行的同形语句（N+1）。
+"""
+import pytest
+from httpx import AsyncClient
+
+from app.flow.routers import flow as flow_api
+from app.flow.services import engine as flow_engine
+from app.llm.models import Conversation, LLMModel
+from app.llm.routers import conversation as conversation_api
+from app.llm.routers import message as message_api
+from app.llm.routers import model as model_api
+from app.system.routers import user as user_api
+from app.llm.schemas.message import MessageCreate
+from app.llm.models.message import MessageRole
+from app.llm.services import MessageService, generation
+from core.query_debug import QueryLog, assert_query_budget, count_queries
+
+async def fake_completion(messages, model_config=None, temperature=None, stream=True):
+    for token in ["a", "b", "c"]:
+        yield {"type": "message", "content": token}
+
+@pytest.fixture
+async def conversation(session, monkeypatch):
+    monkeypatch.setattr(generation, "create_chat_completion", fake_completion)
+    model = LLMModel(name="budget", type="open_ai_like", model_name="budget", api_key="k")
+    session.add(model)
+    await session.flush()
+    conversation = Conversation(title="t", model_id=model.id, user_id="u1")
+    session.add(conversation)
+    await session.commit()
+    # 几条带区块的历史消息，用于发现逐条加载
+    service = MessageService(session)
+    for i in range(3):
+        await service.create_message(MessageCreate(
+            conversation_id=conversation.id, user_id="u1", content=f"m{i}", role=MessageRole.USER
+        ))
+    return conversation
+
+async def call(client: AsyncClient, method: str, url: str, **kwargs) -> QueryLog:
+    with count_queries() as log:
+        response = await client.request(method, url, **kwargs)
+    assert response.status_code < 500, response.text
+    return log
+
+async def test_conversation_router_budgets(client: AsyncClient, conversation):
+    cid = conversation.id
+    cases = [
+        (conversation_api.create_conversation, "POST", "/api/conversations",
+         {"json": {"title": "n", "user_id": "u1", "model_id": conversation.model_id}}),
+        (conversation_api.query_conversation, "POST", f"/api/conversations/{cid}/query", {"params": {"query": "hi"}}),
+        (conversation_api.compare_models, "POST", f"/api/conversations/{cid}/compare",
+         {"json": {"query": "hi", "model_ids": [conversation.model_id]}}),
+        (conversation_api.get_conversation, "GET", f"/api/conversations/{cid}", {}),
+        (conversation_api.list_user_conversations, "GET", "/api/conversations/user/u1", {}),
+        (conversation_api.update_conversation, "PATCH", f"/api/conversations/{cid}", {"json": {"title": "x"}}),
+        (conversation_api.get_conversation_messages, "GET", f"/api/conversations/{cid}/messages", {}),
+        (conversation_api.delete_conversation, "DELETE", f"/api/conversations/{cid}", {}),
+    ]
+    for endpoint, method, url, kwargs in cases:
+        log = await call(client, method, url, **kwargs)
+        assert_query_budget(log, endpoint)
+
+async def test_message_router_budgets(client: AsyncClient, conversation):
+    cid = conversation.id
+    cases = [
+        (message_api.create_message, "POST", "/api/messages",
+         {"json": {"conversation_id": cid, "user_id": "u1", "content": "hi", "role": "user"}}),
+        (message_api.list_conversation_messages, "GET", f"/api/messages/{cid}/messages", {}),
+    ]
+    for endpoint, method, url, kwargs in cases:
+        log = await call(client, method, url, **kwargs)
+        assert_query_budget(log, endpoint)
+
+async def test_model_router_budgets(client: AsyncClient, conversation):
+    log = await call(client, "POST", "/api/models", json={"name": "n", "model_name": "n", "api_key": "k"})
+    assert_query_budget(log, model_api.create_model)
+    model_id = (await client.get("/api/models", params={"limit": 100})).json()["items"][0]["id"]
+
+    log = await call(client, "GET", "/api/models")
+    assert_query_budget(log, model_api.list_models)
+    log = await call(client, "PUT", f"/api/models/{model_id}", json={"description": "d"})
+    assert_query_budget(log, model_api.update_model)
+    log = await call(client, "DELETE", f"/api/models/{model_id}")
+    assert_query_budget(log, model_api.delete_model)
+
+async def test_flow_router_budgets(client: AsyncClient, conversation, monkeypatch):
+    monkeypatch.setattr(flow_engine, "create_chat_completion", fake_completion)
+    definition = {
+        "inputs": ["q"],
+        "nodes": [
+            {"id": "answer", "type": "llm", "model_id": conversation.model_id, "prompt": "{{q}}"},
+            {"id": "report", "type": "template", "template": "> {{answer}}"},
+        ],
+        "edges": [{"source": "answer", "target": "report"}],
+    }
+    log = await call(client, "POST", "/api/flows", json={"name": "f", "user_id": "u1", "definition": definition})
+    assert_query_budget(log, flow_api.create_flow)
+    flow_id = (await client.get("/api/flows/user/u1")).json()[0]["id"]
+
+    cases = [
+        (flow_api.get_flow, "GET", f"/api/flows/{flow_id}", {}),
+        (flow_api.list_user_flows, "GET", "/api/flows/user/u1", {}),
+        (flow_api.update_flow, "PATCH", f"/api/flows/{flow_id}", {"json": {"definition": definition}}),
+        (flow_api.run_flow, "POST", f"/api/flows/{flow_id}/runs", {"json": {"inputs": {"q": "hi"}}}),
+        (flow_api.list_runs, "GET", f"/api/flows/{flow_id}/runs", {}),
+    ]
+    for endpoint, method, url, kwargs in cases:
+        log = await call(client, method, url, **kwargs)
+        assert_query_budget(log, endpoint)
+
+    run_id = (await client.get(f"/api/flows/{flow_id}/runs")).json()[0]["id"]
+    log = await call(client, "GET", f"/api/flows/runs/{run_id}")
+    assert_query_budget(log, flow_api.get_run)
+    log = await call(client, "DELETE", f"/api/flows/{flow_id}")
+    assert_query_budget(log, flow_api.delete_flow)
+
+async def test_user_router_budgets(client: AsyncClient):
+    log = await call(client, "GET", "/api/user/test-user")
+    assert_query_budget(log, user_api.get_test_user)
+    user_id = (await client.get("/api/user/test-user")).json()["id"]
+
+    log = await call(client, "GET", f"/api/user/{user_id}/settings")
+    assert_query_budget(log, user_api.get_user_settings)
+    log = await call(client, "PUT", f"/api/user/{user_id}/settings", json={"theme": "dark"})
+    assert_query_budget(log, user_api.update_user_settings)
+
+def test_detects_repeated_statements():
+    """测试同形语句重复执行被识别为 N+1"""
+    log = QueryLog()
+    for i in range(3):
+        log.record(f"SELECT * FROM message_item WHERE message_id = ?")
+    log.record("SELECT * FROM message WHERE id IN (?, ?, ?)")
+    log.record("SELECT * FROM message WHERE id IN (?, ?)")
+    assert log.repeated(3) == {"SELECT * FROM message_item WHERE message_id = ?": 3}
+    assert log.repeated(2)["SELECT * FROM message WHERE id IN (?...)"] == 2
+    assert len(log.problems(budget=4, threshold=3)) == 2
+
+async def test_debug_middleware_warns(caplog):
+    """测试调试中间件在超出预算和 N+1 时记录警告"""
+    from fastapi import FastAPI
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from core.query_debug import QueryDebugMiddleware, instrument_queries, query_budget
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    instrument_queries(engine.sync_engine)
+    app = FastAPI()
+    app.add_middleware(QueryDebugMiddleware)
+
+    @app.get("/loop")
+    @query_budget(2)
+    async def loop():
+        async with engine.connect() as conn:
+            for i in range(4):
+                await conn.execute(text("select :i"), {"i": i})
+        return {}
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/loop")
+    assert response.headers["X-Query-Count"] == "4"
+    warnings = [r.getMessage() for r in caplog.records if r.name == "core.query_debug"]
+    assert any("超过预算 2" in w for w in warnings)
+    assert any("N+1" in w for w in warnings)
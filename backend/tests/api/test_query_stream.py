@@ -0,0 +1,69 @@
+import pytest
+from httpx import AsyncClient
+
+from app.llm.models import Conversation, LLMModel
+from app.llm.services import generation
+from tests.sse_helpers import data_frames, parse_events
+
+async def fake_completion(messages, model_config=None, temperature=None, stream=True):
+    yield {"type": "think", "content": "思考"}
+    for token in ["你", "好"]:
+        yield {"type": "message", "content": token}
+
+@pytest.fixture
+async def conversation(session, monkeypatch):
+    monkeypatch.setattr(generation, "create_chat_completion", fake_completion)
+    model = LLMModel(name="stub", type="open_ai_like", model_name="stub", api_key="")
+    session.add(model)
+    await session.flush()
+    conversation = Conversation(title="t", model_id=model.id, user_id="u1")
+    session.add(conversation)
+    await session.commit()
+    return conversation
+
+async def test_query_stream_standard_frames(client: AsyncClient, conversation):
+    """测试标准帧协议每帧携带会话和消息ID"""
+    response = await client.post(f"/api/conversations/{conversation.id}/query", params={"query": "hi"})
+    assert response.status_code == 200
+
+    frames = data_frames(response.text)
+    assert [f["type"] for f in frames] == ["think", "message", "done"]
+    assert all(f["conversation_id"] == conversation.id for f in frames)
+
+async def test_query_stream_compact_frames(client: AsyncClient, conversation):
+    """测试协商紧凑帧协议：ID 只在 meta 事件中发送一次"""
+    response = await client.post(
+        f"/api/conversations/{conversation.id}/query",
+        params={"query": "hi"},
+        headers={"X-SSE-Frames": "compact"}
+    )
+    assert response.headers["X-SSE-Frames"] == "compact"
+
+    events = parse_events(response.text)
+    assert events[0]["event"] == "meta"
+    meta = events[0]["data"]
+    assert meta["conversation_id"] == conversation.id
+
+    assert data_frames(response.text) == [["t", "思考"], ["m", "你好"], ["d"]]
+
+async def test_query_stream_stats_event(client: AsyncClient, conversation):
+    """测试流结束前发送耗时统计事件"""
+    response = await client.post(f"/api/conversations/{conversation.id}/query", params={"query": "hi"})
+    assert "Server-Timing" in response.headers
+
+    events = parse_events(response.text)
+    assert events[-2]["event"] == "stats"
+    stats = events[-2]["data"]
+    assert stats["type"] == "stats"
+    assert stats["provider_ttft"] <= stats["upstream"] <= stats["total"]
+
+async def test_query_stream_event_ids(client: AsyncClient, conversation):
+    """测试模型输出帧带递增事件 ID，重连时凭 Last-Event-ID 只接收之后的帧"""
+    response = await client.post(f"/api/conversations/{conversation.id}/query", params={"query": "hi"})
+    events = [e for e in parse_events(response.text) if e["id"] is not None]
+    assert [e["id"] for e in events] == ["1", "2"]
+    message_id = events[0]["data"]["message_id"]
+
+    response = await client.get(f"/api/messages/{message_id}/stream", headers={"Last-Event-ID": "1"})
+    resumed = [e for e in parse_events(response.text) if e["event"] is None]
+    assert [(e["id"], e["data"]["type"]) for e in resumed] == [("2", "message"), (None, "done")]
@@ -0,0 +1,94 @@
+"""流式输出期间不占用数据库连接
+
+连接池只有少量连接，大量并发的长时间流式请求仍应全部完成：
+每个请求只在流开始前和结束后短暂借用连接。
+"""
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.llm.models import Conversation, LLMModel
+from app.llm.services import generation
+from core.base_model import Base
+from core.database import get_db, get_session_factory
+from conftest import app
+
+POOL_SIZE = 5
+CONCURRENCY = 200
+STREAM_SECONDS = 1.0
+
+@pytest.fixture
+async def pool_engine(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+        # 连接被流式请求占住时，排队请求会在 2 秒后超时
+        pool_timeout=2,
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _busy_timeout(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=10000")
+        cursor.close()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield engine
+    finally:
+        await engine.dispose()
+
+async def test_streams_do_not_hold_connections(pool_engine, monkeypatch):
+    """200 个并发的 1 秒流式请求在 5 个连接的池上全部完成"""
+    factory = async_sessionmaker(pool_engine, class_=AsyncSession, expire_on_commit=False)
+    checked_out = []
+
+    async def slow_completion(messages, model_config=None, temperature=None, stream=True):
+        for token in ["慢", "速"]:
+            await asyncio.sleep(STREAM_SECONDS / 2)
+            checked_out.append(pool_engine.sync_engine.pool.checkedout())
+            yield {"type": "message", "content": token}
+
+    async def override_get_db():
+        async with factory() as session:
+            yield session
+
+    monkeypatch.setattr(generation, "create_chat_completion", slow_completion)
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: factory
+
+    async with factory() as session:
+        model = LLMModel(name="pool", type="open_ai_like", model_name="pool", api_key="")
+        session.add(model)
+        await session.flush()
+        conversation = Conversation(title="t", model_id=model.id, user_id="u1")
+        session.add(conversation)
+        await session.commit()
+
+    try:
+        async with AsyncClient(app=app, base_url="http://test", timeout=60) as client:
+            responses = await asyncio.gather(*[
+                client.post(f"/api/conversations/{conversation.id}/query", params={"query": f"q{i}"})
+                for i in range(CONCURRENCY)
+            ])
+    finally:
+        app.dependency_overrides.clear()
+
+    assert all(r.status_code == 200 for r in responses)
+    assert all('"type": "done"' in r.text or '"type":"done"' in r.text for r in responses)
+    assert len(checked_out) == CONCURRENCY * 2
+    # 流式输出期间借出的连接只来自其他请求的前后处理，从不超过池大小
+    assert max(checked_out) <= POOL_SIZE
+    assert pool_engine.sync_engine.pool.checkedout() == 0
+
+    async with factory() as session:
+        saved = await session.get(Conversation, conversation.id)
+        assert saved.message_count == CONCURRENCY * 2
@@ -2,13 +2,16 @@ import os
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
-from app.main import app
-from app.database import get_db
-from app.models.base import Base
+from main import create_app
+from core.database import get_db, get_session_factory
+from core.base_model import Base
+from core.query_debug import instrument_queries
+
+app = create_app()
 
 # 使用内存数据库进行测试
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -22,6 +25,8 @@ async def engine():
         poolclass=StaticPool,
         echo=True
     )
+    # 供 count_queries() 统计接口执行的语句
+    instrument_queries(engine.sync_engine)
     
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
@@ -31,6 +36,21 @@ async def engine():
     finally:
         await engine.dispose()
 
+@pytest_asyncio.fixture(loop_scope="function")
+async def file_session_factory(tmp_path):
+    """文件数据库的会话工厂
+
+    内存数据库只有一条共享连接，多个任务并发保存结果（多路生成、批次、流程节点）的测试
+    改用每个会话独立连接的文件数据库。
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    finally:
+        await engine.dispose()
+
 @pytest_asyncio.fixture
 async def session(engine):
     """创建测试数据库会话"""
@@ -50,6 +70,10 @@ async def client(session):
             await session.close()
     
     app.dependency_overrides[get_db] = override_get_db
+    # 流式接口结束后另开的短会话同样指向测试数据库
+    app.dependency_overrides[get_session_factory] = lambda: sessionmaker(
+        session.bind, class_=AsyncSession, expire_on_commit=False
+    )
     
     async with AsyncClient(app=app, base_url="http://test") as client:
         yield client
@@ -0,0 +1,158 @@
+import asyncio
+import sqlite3
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from core.base_model import Base
+from core.config import settings
+from core.change_feed import ChangeRelay, change_hub, change_log, change_relay, record_change, watch_changes
+from core.invalidation import InvalidationChannel, cache_version
+from app.llm.models import LLMModel
+from app.llm.models.message import MessageRole
+from app.llm.schemas.conversation import ConversationCreate, ConversationUpdate
+from app.llm.schemas.message import MessageCreate
+from app.llm.services import ConversationService, MessageService
+
+def drain(subscription):
+    """取出订阅队列中已有的变更"""
+    items = []
+    while not subscription._queue.empty():
+        items.append(subscription._queue.get_nowait())
+    return items
+
+async def test_published_after_commit(session):
+    """测试变更在提交后才推送，回滚的变更丢弃"""
+    subscription = change_hub.subscribe("feed-u1")
+    record_change(session, "feed-u1", "conversation", "updated", "c1", {"title": "a"})
+    assert drain(subscription) == []
+    await session.commit()
+    (change,) = drain(subscription)
+    assert change["seq"] > 0
+    assert {k: change[k] for k in ("entity", "action", "id", "data")} == {
+        "entity": "conversation", "action": "updated", "id": "c1", "data": {"title": "a"}
+    }
+
+    await session.execute(text("SELECT 1"))
+    record_change(session, "feed-u1", "conversation", "deleted", "c1")
+    await session.rollback()
+    await session.commit()
+    assert drain(subscription) == []
+    subscription.close()
+
+async def test_skipped_without_subscribers(session):
+    """测试没有订阅者时不记录变更"""
+    record_change(session, "feed-nobody", "message", "created", "m1")
+    assert "pending_changes" not in session.sync_session.info
+
+async def test_services_emit_changes(session):
+    """测试服务层的会话和消息写入推送给会话所属用户"""
+    model = LLMModel(name="feed", type="open_ai_like", model_name="feed", api_key="")
+    session.add(model)
+    await session.commit()
+    subscription = change_hub.subscribe("feed-u2")
+
+    conversations = ConversationService(session)
+    conversation = await conversations.create_conversation(
+        ConversationCreate(title="t", model_id=model.id, user_id="feed-u2")
+    )
+    await conversations.update_conversation(conversation.id, ConversationUpdate(title="t2"))
+    message = await MessageService(session).create_message(MessageCreate(
+        conversation_id=conversation.id, user_id="feed-u2", role=MessageRole.USER, content="hi"
+    ))
+    await MessageService(session).update_message_content(message.id, "hello")
+    await conversations.delete_conversation(conversation.id)
+
+    changes = drain(subscription)
+    assert [(c["entity"], c["action"]) for c in changes] == [
+        ("conversation", "created"),
+        ("conversation", "updated"),
+        ("message", "created"),
+        ("conversation", "stats"),
+        ("message", "updated"),
+        ("conversation", "deleted"),
+    ]
+    assert [c["seq"] for c in changes] == sorted(c["seq"] for c in changes)
+    assert changes[1]["data"]["title"] == "t2"
+    assert changes[2]["data"] == {"conversation_id": conversation.id, "role": "user"}
+    assert changes[3]["data"]["message_count"] == 1
+    subscription.close()
+
+async def test_watch_changes_heartbeat():
+    """测试无变更时按间隔返回心跳，关闭订阅后结束"""
+    received = []
+
+    async def watch():
+        async for change in watch_changes("feed-u3", heartbeat=0.01):
+            received.append(change)
+
+    task = asyncio.create_task(watch())
+    await asyncio.sleep(0.035)
+    change_hub.publish("feed-u3", {"seq": 1})
+    await asyncio.sleep(0)
+    change_hub.close_all()
+    await asyncio.wait_for(task, 1)
+    assert None in received
+    assert received[-1] == {"seq": 1}
+
+async def test_relayed_across_processes(tmp_path, monkeypatch):
+    """测试多 worker 时变更随事务写入 change_log，其他进程轮询读到，本进程写入的行被跳过"""
+    db_path = str(tmp_path / "shared.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[cache_version, change_log])
+    monkeypatch.setattr(change_relay, "enabled", True)
+
+    # 模拟另一个 worker 进程的轮询通道和转发器
+    channel = InvalidationChannel()
+    other, same = ChangeRelay(origin=-1), ChangeRelay(origin=change_relay.origin)
+    received, own = [], []
+    channel.add_reader(other._read, received.extend)
+    channel.add_reader(same._read, own.extend)
+    channel.start(db_path, interval=0.01)
+    await asyncio.wait_for(channel.polled.wait(), 5)
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession)
+    async with session_factory() as session:
+        await session.execute(text("SELECT 1"))
+        record_change(session, "feed-u4", "conversation", "deleted", "c0")
+        await session.rollback()
+        record_change(session, "feed-u4", "conversation", "updated", "c1", {"title": "a"})
+        await session.commit()
+
+    for _ in range(100):
+        if received:
+            break
+        await asyncio.sleep(0.01)
+    await channel.stop()
+    await engine.dispose()
+    assert received == [("feed-u4", {"entity": "conversation", "action": "updated", "id": "c1", "data": {"title": "a"}})]
+    assert own == []
+
+def test_relay_continues_after_purge(tmp_path, monkeypatch):
+    """测试过期日志清空整张表后，新写入的变更仍被转发（seq 不重新编号）"""
+    db_path = tmp_path / "purge.db"
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(sync_engine, tables=[change_log])
+    sync_engine.dispose()
+    monkeypatch.setattr(settings, "CHANGE_LOG_RETENTION_SECONDS", 0)
+
+    conn = sqlite3.connect(db_path)
+    insert = "INSERT INTO change_log (origin, user_id, change, created_at) VALUES (1, 'u', ?, ?)"
+    relay = ChangeRelay(origin=-1)
+    try:
+        conn.execute(insert, ('{"id": "c0"}', 0))
+        conn.commit()
+        assert relay._read(conn) == []
+        conn.execute(insert, ('{"id": "c1"}', 0))
+        conn.commit()
+        # 读取后清理：两行都已过期，表被清空
+        assert relay._read(conn) == [("u", {"id": "c1"})]
+        assert conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0] == 0
+
+        conn.execute(insert, ('{"id": "c2"}', time.time()))
+        conn.commit()
+        assert relay._read(conn) == [("u", {"id": "c2"})]
+    finally:
+        conn.close()
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import AsyncClient
+
+from core.compression import CompressionMiddleware, choose_encoding
+
+def create_test_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100, offload_size=2000)
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/large")
+    async def large(n: int = 100):
+        return [{"type": "think", "content": "思考" * 10}] * n
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for _ in range(3):
+                yield b"data: " + b"x" * 200 + b"\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+app = create_test_app()
+
+async def test_compress_large_json():
+    """测试超过阈值的 JSON 响应按协商结果压缩"""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        for n in (10, 100):  # 小于 / 大于 offload_size
+            response = await client.get("/large", params={"n": n}, headers={"Accept-Encoding": "gzip"})
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert "Accept-Encoding" in response.headers["Vary"]
+            assert len(response.json()) == n
+
+@pytest.mark.parametrize("encoding, module, decompress", [
+    ("br", "brotli", lambda module, body: module.decompress(body)),
+    ("zstd", "zstandard", lambda module, body: module.ZstdDecompressor().decompressobj().decompress(body)),
+])
+async def test_negotiate_optional_encodings(encoding, module, decompress):
+    """测试浏览器同时接受多种编码时优先使用 br / zstd，响应体可以正确解压"""
+    module = pytest.importorskip(module)
+    accept = "gzip, deflate, br" if encoding == "br" else "gzip, deflate, br, zstd"
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        for n in (10, 100):  # 小于 / 大于 offload_size
+            # 读取原始字节自行解压，不依赖 httpx 对各编码的支持
+            async with client.stream("GET", "/large", params={"n": n}, headers={"Accept-Encoding": accept}) as response:
+                body = b"".join([chunk async for chunk in response.aiter_raw()])
+            assert response.headers["Content-Encoding"] == encoding
+            assert int(response.headers["Content-Length"]) == len(body)
+            assert len(json.loads(decompress(module, body))) == n
+
+async def test_skip_small_and_unaccepted():
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+        response = await client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in response.headers
+
+async def test_event_stream_untouched():
+    """测试 SSE 响应不压缩"""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+        assert response.text.count("data: ") == 3
+
+def test_choose_encoding():
+    available = ["zstd", "br", "gzip"]
+    assert choose_encoding("gzip, deflate, br, zstd", available) == "zstd"
+    assert choose_encoding("gzip;q=1.0, br;q=0.5", available) == "gzip"
+    assert choose_encoding("br;q=0, gzip;q=0.1", available) == "gzip"
+    assert choose_encoding("deflate", available) is None
+    assert choose_encoding("*", ["gzip"]) == "gzip"
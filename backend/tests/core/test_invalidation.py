@@ -0,0 +1,56 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from core.base_model import Base
+from core.invalidation import InvalidationChannel, invalidation, cache_version
+
+async def test_cross_process_invalidation(tmp_path):
+    """测试其他连接提交的版本变化会被轮询发现"""
+    db_path = str(tmp_path / "shared.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[cache_version])
+
+    # 模拟另一个 worker 进程中的通道
+    other = InvalidationChannel()
+    received = []
+    other.subscribe("models", received.append)
+    other.start(db_path, interval=0.01)
+    await asyncio.wait_for(other.polled.wait(), 5)
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession)
+    async with session_factory() as session:
+        await invalidation.mark_changed(session, "models")
+        await session.commit()
+
+    for _ in range(100):
+        if received:
+            break
+        await asyncio.sleep(0.01)
+
+    await other.stop()
+    await engine.dispose()
+    assert received == ["models"]
+
+async def test_local_notify_after_commit_only(tmp_path):
+    """测试本进程在提交后立即收到通知，回滚则不通知"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'local.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[cache_version])
+
+    received = []
+    invalidation.subscribe("settings", received.append)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession)
+    try:
+        async with session_factory() as session:
+            await invalidation.mark_changed(session, "settings")
+            await session.rollback()
+            assert received == []
+
+            await invalidation.mark_changed(session, "settings")
+            await session.commit()
+            assert received == ["settings"]
+    finally:
+        invalidation.unsubscribe("settings", received.append)
+        await engine.dispose()
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+
+from core import logger as log_module
+from core.config import settings
+
+def test_json_formatter_includes_extra_fields():
+    """测试结构化日志输出 extra 字段"""
+    record = logging.LogRecord("maoflow", logging.INFO, __file__, 1, "query %s", ("done",), None)
+    record.conversation_id = "c1"
+
+    data = json.loads(log_module.JsonFormatter().format(record))
+    assert data["message"] == "query done"
+    assert data["level"] == "INFO"
+    assert data["conversation_id"] == "c1"
+
+def test_queue_pipeline_writes_rotated_file(tmp_path, monkeypatch):
+    """测试日志经后台线程写入轮转文件"""
+    log_module.shutdown_logging()
+    monkeypatch.setattr(settings, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LOG_TO_CONSOLE", False)
+    monkeypatch.setattr(settings, "LOG_MAX_BYTES", 200)
+    monkeypatch.setattr(settings, "LOG_BACKUP_COUNT", 2)
+
+    log_file = log_module.setup_logging()
+    try:
+        for i in range(50):
+            logging.getLogger("maoflow.test").info("line %d", i)
+    finally:
+        log_module.shutdown_logging()
+
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == ["maoflow.log", "maoflow.log.1", "maoflow.log.2"]
+    assert "line 49" in open(log_file, encoding="utf-8").read()
+
+def test_workers_write_separate_files(tmp_path, monkeypatch):
+    """测试多 worker 时每个进程写自己的日志文件，轮转不会互相覆盖"""
+    log_module.shutdown_logging()
+    monkeypatch.setattr(settings, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LOG_TO_CONSOLE", False)
+    monkeypatch.setattr(settings, "WORKERS", 4)
+
+    log_file = log_module.setup_logging()
+    log_module.shutdown_logging()
+    assert os.path.basename(log_file) == f"maoflow.{os.getpid()}.log"
+
+def test_queue_keeps_exception_for_json_file(tmp_path, monkeypatch):
+    """测试经队列写出的 JSON 日志中异常堆栈单独放在 exc_info 字段"""
+    log_module.shutdown_logging()
+    monkeypatch.setattr(settings, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LOG_TO_CONSOLE", False)
+    monkeypatch.setattr(settings, "LOG_FORMAT", "json")
+
+    log_file = log_module.setup_logging()
+    try:
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("maoflow.test").exception("failed %s", "c1", extra={"conversation_id": "c1"})
+    finally:
+        log_module.shutdown_logging()
+
+    (line,) = [l for l in open(log_file, encoding="utf-8") if "failed" in l]
+    data = json.loads(line)
+    assert data["message"] == "failed c1"
+    assert data["conversation_id"] == "c1"
+    assert data["exc_info"].startswith("Traceback") and "ValueError: boom" in data["exc_info"]
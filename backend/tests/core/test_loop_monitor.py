@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+from core.loop_monitor import LoopMonitor, loop_lag
+
+def blocking_work(seconds: float) -> None:
+    time.sleep(seconds)
+
+async def test_records_lag_and_blocking_stack():
+    """测试阻塞事件循环时记录延迟并抓到阻塞代码的调用栈"""
+    monitor = LoopMonitor(interval=0.01, block_threshold=0.05, capture_stacks=True)
+    before = loop_lag.count()
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        blocking_work(0.2)
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    assert loop_lag.count() > before
+    assert monitor.max_lag >= 0.1
+    assert monitor.reports
+    assert "blocking_work" in monitor.reports[0]["stack"]
+
+async def test_no_report_without_blocking():
+    monitor = LoopMonitor(interval=0.01, block_threshold=0.1, capture_stacks=True)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+    assert not monitor.reports
@@ -0,0 +1,34 @@
+from httpx import AsyncClient
+
+from core.metrics import MetricsRegistry
+
+def test_render_prometheus_text():
+    """测试计数器、直方图和采集型仪表的文本格式"""
+    registry = MetricsRegistry()
+    counter = registry.counter("test_requests_total", "请求数", ("route",))
+    histogram = registry.histogram("test_latency_seconds", "延迟", ("route",), buckets=(0.1, 1.0))
+    registry.gauge("test_depth", "队列深度", collect=lambda: 3)
+
+    counter.inc(route="/a")
+    counter.inc(2, route="/a")
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5, route="/a")
+
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{route="/a"} 3' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{route="/a"} 3' in text
+    assert "test_depth 3" in text
+
+async def test_metrics_endpoint(client: AsyncClient):
+    """测试 /metrics 按路由模板统计请求"""
+    await client.get("/api/conversations/not-exist")
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/api/conversations/{conversation_id}",status="404"' in response.text
+    assert "maoflow_db_commit_duration_seconds" in response.text
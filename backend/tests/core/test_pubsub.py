@@ -0,0 +1,40 @@
+import asyncio
+
+from core.pubsub import Hub, pubsub_dropped
+
+async def test_fan_out_to_all_subscribers():
+    """测试同一键的所有订阅者收到相同消息，其他键不受影响"""
+    hub = Hub("test_fan_out")
+    first, second, other = hub.subscribe("c1"), hub.subscribe("c1"), hub.subscribe("c2")
+    assert hub.publish("c1", "a") == 2
+    assert hub.publish("c1", "b") == 2
+    first.close()
+    assert hub.subscriber_count("c1") == 1
+
+    assert [item async for item in first] == []
+    hub.close_all()
+    assert [item async for item in second] == ["a", "b"]
+    assert [item async for item in other] == []
+
+async def test_slow_subscriber_is_dropped():
+    """测试队列满的订阅者被断开，发布方不等待，其他订阅者照常接收"""
+    hub = Hub("test_slow", queue_size=2)
+    slow, fast = hub.subscribe("k"), hub.subscribe("k")
+    received = []
+
+    async def consume():
+        async for item in fast:
+            received.append(item)
+
+    consumer = asyncio.create_task(consume())
+    for i in range(5):
+        hub.publish("k", i)
+        await asyncio.sleep(0)
+    assert slow.dropped and not fast.dropped
+    assert [item async for item in slow] == []
+    assert hub.subscriber_count("k") == 1
+    assert pubsub_dropped.get(hub="test_slow") == 1
+
+    fast.close()
+    await asyncio.wait_for(consumer, 1)
+    assert received == [0, 1, 2, 3, 4]
@@ -0,0 +1,55 @@
+import json
+
+from httpx import AsyncClient
+
+from core.readiness import Readiness, readiness
+
+async def test_run_step_records_failure_without_raising():
+    """测试预热步骤失败只记录，不中断启动"""
+    state = Readiness()
+
+    async def broken():
+        raise RuntimeError("boom")
+
+    async def ok():
+        return 3
+
+    assert await state.run_step("broken", broken()) is None
+    assert await state.run_step("ok", ok()) == 3
+    assert state.steps["broken"]["ok"] is False
+    assert state.steps["broken"]["error"] == "boom"
+    assert state.steps["ok"]["ok"] is True
+
+async def test_health_ready_reports_503_until_ready(client: AsyncClient, monkeypatch):
+    """测试就绪前 /health/ready 返回 503"""
+    monkeypatch.setattr(readiness, "ready", False)
+    response = await client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+    readiness.mark_ready()
+    response = await client.get("/health/ready")
+    assert response.status_code == 200
+
+async def test_required_step_failure_keeps_not_ready(capsys):
+    """测试必需步骤失败时启动照常结束，但不就绪，就绪行带 ok=false"""
+    state = Readiness()
+
+    async def broken():
+        raise RuntimeError("database is locked")
+
+    async def ok():
+        return 3
+
+    await state.run_step("migrations", broken(), required=True)
+    await state.run_step("page_cache", ok())
+    state.mark_ready()
+    assert state.started and not state.ready
+    assert state.status()["ok"] is False
+    assert state.failed == ["migrations"]
+
+    state.announce("unix:/tmp/maoflow.sock")
+    line = capsys.readouterr().out.strip()
+    assert line.startswith("MAOFLOW_READY ")
+    payload = json.loads(line.split(" ", 1)[1])
+    assert payload["ok"] is False and payload["ready"] is False
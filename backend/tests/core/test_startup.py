@@ -0,0 +1,21 @@
+from core.config import settings
+from core.startup_profile import (
+    run_importtime,
+    parse_importtime,
+    total_import_ms,
+    loaded_lazy_modules,
+    format_report
+)
+
+def test_startup_import_budget():
+    """测试后端启动导入耗时不超过预算"""
+    records = parse_importtime(run_importtime())
+    assert records
+
+    total_ms = total_import_ms(records)
+    assert total_ms <= settings.STARTUP_IMPORT_BUDGET_MS, format_report(records)
+
+def test_heavy_modules_are_lazy():
+    """测试启动阶段不加载模型SDK和迁移模块"""
+    records = parse_importtime(run_importtime())
+    assert loaded_lazy_modules(records) == []
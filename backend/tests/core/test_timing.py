@@ -0,0 +1,40 @@
+from fastapi import FastAPI
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from core.serialization import FastJSONResponse
+from core.timing import TimingMiddleware, instrument_engine
+
+def create_test_app() -> FastAPI:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    instrument_engine(engine.sync_engine)
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(TimingMiddleware)
+
+    @app.get("/items")
+    async def items():
+        async with engine.connect() as conn:
+            for _ in range(3):
+                await conn.execute(text("select 1"))
+        return {"items": list(range(100))}
+
+    return app
+
+app = create_test_app()
+
+def parse_server_timing(header: str) -> dict:
+    metrics = {}
+    for part in header.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        metrics[name] = dict(p.split("=", 1) for p in params)
+    return metrics
+
+async def test_server_timing_header():
+    """测试 Server-Timing 包含数据库、序列化和总耗时"""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/items")
+    metrics = parse_server_timing(response.headers["Server-Timing"])
+    assert metrics["db"]["desc"] == '"3 queries"'
+    assert "serialize" in metrics
+    assert float(metrics["app"]["dur"]) >= float(metrics["db"]["dur"])
@@ -0,0 +1,224 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import func, select
+
+from app.flow.models import FlowNodeCache, FlowRun
+from app.flow.schemas import FlowCreate, FlowDefinition, FlowRunCreate, FlowUpdate
+from app.flow.services import FlowRunner, FlowService, engine
+from app.flow.services.engine import RunStatus, start_run
+from app.flow.services.graph import FlowDefinitionError, FlowGraph
+from app.llm.models import LLMModel
+from app.llm.services.model_registry import model_registry
+from core.config import settings
+from tests.sse_helpers import data_frames
+
+DELAY = 0.1
+
+class FakeModel:
+    """每次调用耗时 DELAY 秒，回答 `模型名: 提示`；提示含 boom 时出错"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def __call__(self, messages, model_config=None, temperature=None, stream=True):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        await asyncio.sleep(DELAY)
+        if "boom" in prompt:
+            raise RuntimeError("upstream failed")
+        yield {"type": "message", "content": f"{model_config.model_name}: "}
+        yield {"type": "message", "content": prompt}
+
+def definition(model_id: str, summary_prompt: str = "总结 {{topic}}") -> FlowDefinition:
+    """两个互不依赖的模型节点，汇总到一个模板节点"""
+    return FlowDefinition.model_validate({
+        "inputs": ["topic"],
+        "nodes": [
+            {"id": "summary", "type": "llm", "model_id": model_id, "prompt": summary_prompt},
+            {"id": "keywords", "type": "llm", "model_id": model_id, "prompt": "关键词 {{topic}}"},
+            {"id": "report", "type": "template", "template": "{{summary}} | {{keywords}}"},
+        ],
+        "edges": [
+            {"source": "summary", "target": "report"},
+            {"source": "keywords", "target": "report"},
+        ],
+    })
+
+@pytest_asyncio.fixture(loop_scope="function")
+async def flow_db(file_session_factory, monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(engine, "create_chat_completion", model)
+    factory = file_session_factory
+    async with factory() as session:
+        llm = LLMModel(name="fake", type="open_ai_like", model_name="fake", api_key="")
+        session.add(llm)
+        await session.commit()
+    return factory, llm.id, model
+
+async def create_flow(factory, data: FlowDefinition) -> str:
+    async with factory() as db:
+        flow = await FlowService(db).create_flow(FlowCreate(name="f", user_id="u1", definition=data))
+        return flow.id
+
+async def run(factory, flow_id: str, runner: FlowRunner, **inputs):
+    async with factory() as db:
+        job = await start_run(db, factory, flow_id, FlowRunCreate(inputs=inputs or {"topic": "t"}), runner)
+    await job.wait()
+    return job
+
+async def test_branches_run_concurrently(flow_db):
+    """测试互不依赖的节点并发执行，下游节点拿到两者的输出"""
+    factory, model_id, _ = flow_db
+    flow_id = await create_flow(factory, definition(model_id))
+    started = time.perf_counter()
+    job = await run(factory, flow_id, FlowRunner())
+    assert time.perf_counter() - started < 2 * DELAY - 0.03
+
+    assert job.status == RunStatus.COMPLETED
+    assert job.outputs() == {"report": "fake: 总结 t | fake: 关键词 t"}
+    types = [event["type"] for event in job.events]
+    assert types[:3] == ["run_started", "node_started", "node_started"]
+    assert types[-1] == "run_finished"
+
+    async with factory() as db:
+        saved = await db.get(FlowRun, job.id)
+    assert saved.status == "completed"
+    assert saved.outputs == job.outputs()
+    assert saved.nodes["summary"]["status"] == "completed"
+
+async def test_rerun_reuses_unchanged_nodes(flow_db):
+    """测试再次执行时输入不变的节点命中缓存，只重算改动的节点及其下游"""
+    factory, model_id, model = flow_db
+    flow_id = await create_flow(factory, definition(model_id))
+    runner = FlowRunner()
+    await run(factory, flow_id, runner)
+    assert len(model.prompts) == 2
+
+    again = await run(factory, flow_id, runner)
+    assert len(model.prompts) == 2
+    assert {node_id: node["cached"] for node_id, node in again.nodes.items()} == {
+        "summary": True, "keywords": True, "report": False
+    }
+
+    async with factory() as db:
+        await FlowService(db).update_flow(flow_id, FlowUpdate(definition=definition(model_id, "摘要 {{topic}}")))
+    changed = await run(factory, flow_id, runner)
+    assert model.prompts[2:] == ["摘要 t"]
+    assert {node_id: node["cached"] for node_id, node in changed.nodes.items()} == {
+        "summary": False, "keywords": True, "report": False
+    }
+    assert changed.outputs() == {"report": "fake: 摘要 t | fake: 关键词 t"}
+
+    # 输入改变时全部重算
+    await run(factory, flow_id, runner, topic="other")
+    assert len(model.prompts) == 5
+    async with factory() as db:
+        assert await db.scalar(select(func.count()).select_from(FlowNodeCache)) == 5
+
+async def test_cache_follows_model_config_and_expires(flow_db, monkeypatch):
+    """测试修改模型配置后不命中旧缓存，过期和超出条数上限的缓存被清理"""
+    factory, model_id, model = flow_db
+    flow_id = await create_flow(factory, definition(model_id))
+    runner = FlowRunner()
+    await run(factory, flow_id, runner)
+
+    async with factory() as db:
+        llm = await db.get(LLMModel, model_id)
+        llm.default_temperature = 0.1
+        await db.commit()
+    model_registry.invalidate()
+    again = await run(factory, flow_id, runner)
+    assert len(model.prompts) == 4
+    assert not again.nodes["summary"]["cached"]
+
+    monkeypatch.setattr(settings, "FLOW_NODE_CACHE_TTL_SECONDS", 0)
+    expired = await run(factory, flow_id, runner)
+    assert len(model.prompts) == 6 and not expired.nodes["summary"]["cached"]
+
+    monkeypatch.setattr(settings, "FLOW_NODE_CACHE_TTL_SECONDS", 3600)
+    monkeypatch.setattr(settings, "FLOW_NODE_CACHE_MAX_ENTRIES", 1)
+    async with factory() as db:
+        await db.execute(engine.purge_cache_statement(datetime.utcnow()))
+        await db.commit()
+        assert await db.scalar(select(func.count()).select_from(FlowNodeCache)) == 1
+
+async def test_failure_skips_descendants(flow_db):
+    """测试节点失败时下游跳过，其他分支照常完成"""
+    factory, model_id, _ = flow_db
+    flow_id = await create_flow(factory, definition(model_id, "boom {{topic}}"))
+    job = await run(factory, flow_id, FlowRunner())
+
+    assert job.status == RunStatus.FAILED
+    assert {node_id: node["status"] for node_id, node in job.nodes.items()} == {
+        "summary": "failed", "keywords": "completed", "report": "skipped"
+    }
+    assert job.nodes["summary"]["error"] == "RuntimeError: upstream failed"
+    async with factory() as db:
+        assert (await db.get(FlowRun, job.id)).status == "failed"
+
+@pytest.mark.parametrize("nodes, edges, message", [
+    (
+        [{"id": "a", "type": "template", "template": "{{b}}"}, {"id": "b", "type": "template", "template": "{{a}}"}],
+        [{"source": "a", "target": "b"}, {"source": "b", "target": "a"}],
+        "环",
+    ),
+    ([{"id": "a", "type": "template", "template": "{{missing}}"}], [], "missing"),
+    ([{"id": "a", "type": "llm", "prompt": "hi"}], [], "model_id"),
+])
+def test_invalid_definition(nodes, edges, message):
+    """测试环、未连接的引用和缺少字段的节点被拒绝"""
+    with pytest.raises(FlowDefinitionError, match=message):
+        FlowGraph(FlowDefinition.model_validate({"nodes": nodes, "edges": edges}))
+
+async def test_run_over_sse(client: AsyncClient):
+    """测试通过接口创建并执行流程，进度以 SSE 返回，结果保存为执行记录"""
+    response = await client.post("/api/flows", json={
+        "name": "greeting",
+        "user_id": "u1",
+        "definition": {
+            "inputs": ["name"],
+            "nodes": [
+                {"id": "hello", "type": "template", "template": "Hello {{name}}"},
+                {"id": "shout", "type": "template", "template": "{{hello}}!"},
+            ],
+            "edges": [{"source": "hello", "target": "shout"}],
+        },
+    })
+    assert response.status_code == 200
+    flow_id = response.json()["id"]
+
+    assert (await client.post(f"/api/flows/{flow_id}/runs", json={"inputs": {}})).status_code == 400
+    response = await client.post(f"/api/flows/{flow_id}/runs", json={"inputs": {"name": "flow"}})
+    assert response.status_code == 200
+    events = data_frames(response.text)
+    assert [e["type"] for e in events] == [
+        "run_started", "node_started", "node_completed", "node_started", "node_completed", "run_finished"
+    ]
+    assert events[-1]["outputs"] == {"shout": "Hello flow!"}
+
+    run_id = response.headers["X-Flow-Run-ID"]
+    response = await client.get(f"/api/flows/runs/{run_id}")
+    assert response.json()["status"] == "completed"
+    assert response.json()["outputs"] == {"shout": "Hello flow!"}
+    assert [r["id"] for r in (await client.get(f"/api/flows/{flow_id}/runs")).json()] == [run_id]
+
+async def test_invalid_flow_rejected(client: AsyncClient):
+    """测试引用不存在的工具或形成环的流程返回 400"""
+    response = await client.post("/api/flows", json={
+        "name": "bad", "user_id": "u1",
+        "definition": {"nodes": [{"id": "a", "type": "tool", "tool": "missing"}]},
+    })
+    assert response.status_code == 400
+    response = await client.post("/api/flows", json={
+        "name": "bad", "user_id": "u1",
+        "definition": {
+            "nodes": [{"id": "a", "type": "template", "template": "x"}, {"id": "b", "type": "template", "template": "y"}],
+            "edges": [{"source": "a", "target": "b"}, {"source": "b", "target": "a"}],
+        },
+    })
+    assert response.status_code == 400
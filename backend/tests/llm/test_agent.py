@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.llm.models import Conversation, LLMModel, MessageItem
+from app.llm.models.message import MessageRole
+from app.llm.schemas.message import MessageCreate
+from app.llm.services import MessageService, agent
+from app.llm.services.agent import run_agent
+from app.llm.services.generation import GenerationJob, GenerationRunner, JobStatus
+from app.llm.services.tools import Tool, ToolCall, ToolRegistry, calculate
+
+@pytest.fixture
+async def assistant_message(session):
+    model = LLMModel(name="agent", type="open_ai_like", model_name="agent", api_key="")
+    session.add(model)
+    await session.flush()
+    conversation = Conversation(title="t", model_id=model.id, user_id="u1")
+    session.add(conversation)
+    await session.commit()
+    return await MessageService(session).create_message(MessageCreate(
+        conversation_id=conversation.id, user_id="u1", role=MessageRole.ASSISTANT
+    ))
+
+async def slow_lookup(key: str) -> str:
+    await asyncio.sleep(0.1)
+    return f"value of {key}"
+
+def spin(seconds: float) -> str:
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+    return "done"
+
+def registry() -> ToolRegistry:
+    return ToolRegistry([
+        Tool(name="lookup", description="查询", func=slow_lookup),
+        Tool(name="calculate", description="计算", func=calculate, mode="process"),
+        Tool(name="spin", description="占用 CPU", func=spin, mode="process", timeout=0.2),
+    ], processes=1)
+
+class ScriptedModel:
+    """第一轮请求两个工具，拿到结果后给出回答"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, messages, model_config=None, temperature=None, stream=True, tools=None):
+        self.calls.append(list(messages))
+        if not any(m.get("role") == "tool" for m in messages):
+            yield {"type": "message", "content": "查一下"}
+            yield {"type": "tool_call", "index": 0, "id": "c1", "name": "lookup", "arguments": '{"ke'}
+            yield {"type": "tool_call", "index": 1, "id": "c2", "name": "lookup", "arguments": '{"key": "b"}'}
+            yield {"type": "tool_call", "index": 0, "id": None, "name": None, "arguments": 'y": "a"}'}
+        else:
+            yield {"type": "message", "content": "答案"}
+
+async def test_tools_run_concurrently(monkeypatch):
+    """测试同一轮的工具调用并发执行，结果回传给模型后继续"""
+    model = ScriptedModel()
+    monkeypatch.setattr(agent, "create_chat_completion", model)
+    started = time.perf_counter()
+    chunks = [chunk async for chunk in run_agent([{"role": "user", "content": "q"}], registry())]
+    assert time.perf_counter() - started < 0.19
+
+    assert [c["type"] for c in chunks] == ["message", "action", "action", "observation", "observation", "message"]
+    assert json.loads(chunks[1]["content"]) == {"id": "c1", "name": "lookup", "arguments": '{"key": "a"}'}
+    observations = {json.loads(c["content"])["id"]: json.loads(c["content"]) for c in chunks[3:5]}
+    assert observations["c1"]["content"] == "value of a"
+
+    second = model.calls[1]
+    assert second[1]["tool_calls"][0]["function"]["name"] == "lookup"
+    assert [(m["tool_call_id"], m["content"]) for m in second[2:]] == [("c1", "value of a"), ("c2", "value of b")]
+
+async def test_tool_errors_are_observations():
+    """测试进程池工具、超时和无效调用都以结果返回"""
+    tools = registry()
+    try:
+        assert (await tools.execute(ToolCall("1", "calculate", '{"expression": "(1 + 2) * 3 ** 2"}'))).content == "27"
+        assert "ValueError" in (await tools.execute(ToolCall("2", "calculate", '{"expression": "open(1)"}'))).error
+        assert "超时" in (await tools.execute(ToolCall("3", "spin", '{"seconds": 5}'))).error
+        # 超时后进程池重建，后续调用正常
+        assert (await tools.execute(ToolCall("4", "calculate", '{"expression": "2 + 2"}'))).content == "4"
+        assert (await tools.execute(ToolCall("5", "missing"))).error == "工具不存在: missing"
+        assert (await tools.execute(ToolCall("6", "lookup", "{bad"))).error == "参数不是有效的 JSON"
+    finally:
+        tools.shutdown()
+
+@pytest.mark.parametrize("expression", ["9 ** 9 ** 9", "2 ** 5000", "(10 ** 1000) ** 10", "7 ** -2000"])
+def test_calculate_rejects_huge_numbers(expression):
+    """测试超出大小上限的乘方直接拒绝，而不是长时间计算"""
+    with pytest.raises(ValueError):
+        calculate(expression)
+    assert calculate("2 ** 100") == str(2 ** 100)
+
+async def test_agent_items_persisted_in_order(session, assistant_message, monkeypatch):
+    """测试工具调用和结果按输出顺序保存为消息项"""
+    monkeypatch.setattr(agent, "create_chat_completion", ScriptedModel())
+    factory = sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False)
+    job = GenerationRunner().start(GenerationJob(
+        assistant_message.id, assistant_message.conversation_id,
+        messages=[{"role": "user", "content": "q"}], tools=registry()
+    ), factory)
+    await job.wait()
+    assert job.status == JobStatus.COMPLETED
+
+    items = (await session.execute(
+        select(MessageItem).filter(MessageItem.message_id == assistant_message.id).order_by(MessageItem.order)
+    )).scalars().all()
+    assert [(item.order, item.type) for item in items] == [
+        (0, "message"), (1, "action"), (2, "action"), (3, "observation"), (4, "observation"), (5, "message")
+    ]
+    await session.refresh(assistant_message)
+    assert assistant_message.content == "查一下答案"
+
+async def test_unknown_tool_rejected(client: AsyncClient, assistant_message):
+    """测试指定不存在的工具时返回 400"""
+    response = await client.post(
+        f"/api/conversations/{assistant_message.conversation_id}/query",
+        params={"query": "hi", "tools": ["missing"]}
+    )
+    assert response.status_code == 400
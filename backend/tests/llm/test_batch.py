@@ -0,0 +1,198 @@
+import asyncio
+import json
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from app.llm.models import Conversation, LLMModel, Message
+from app.llm.models.message import MessageRole
+from app.llm.schemas.batch import BatchCreate
+from app.llm.services import generation
+from app.llm.services.batch import BatchRunner, BatchStatus, _model_limit
+from app.llm.services.generation import GenerationRunner
+from app.llm.services.model_registry import model_registry
+from core.config import settings
+from core.metrics import batch_items
+
+class CountingUpstream:
+    """回显提示的上游，记录每个模型同时进行的调用数"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.active = Counter()
+        self.peak = Counter()
+
+    async def __call__(self, messages, model_config=None, temperature=None, stream=True):
+        model = model_config.model_name
+        self.active[model] += 1
+        self.peak[model] = max(self.peak[model], self.active[model])
+        try:
+            await asyncio.sleep(self.delay)
+            yield {"type": "message", "content": f"re: {messages[0]['content']}"}
+        finally:
+            self.active[model] -= 1
+
+@pytest_asyncio.fixture(loop_scope="function")
+async def batch_db(file_session_factory):
+    factory = file_session_factory
+    async with factory() as session:
+        limited = LLMModel(
+            name="limited", type="open_ai_like", model_name="limited", api_key="",
+            meta_info={"custom_settings": {"max_concurrency": 2}}
+        )
+        other = LLMModel(name="other", type="open_ai_like", model_name="other", api_key="")
+        session.add_all([limited, other])
+        await session.flush()
+        conversation = Conversation(title="c", model_id=other.id, user_id="u1")
+        session.add(conversation)
+        await session.commit()
+    return factory, limited.id, conversation.id
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), (3, 3), ("4", 4), (0, None), (-1, None), ("many", None), ([2], None),
+])
+def test_model_limit_validation(value, expected):
+    """测试模型并发上限转换为整数，无效值使用默认上限"""
+    custom = {} if value is None else {"max_concurrency": value}
+    model_config = SimpleNamespace(id="m", meta_info={"custom_settings": custom})
+    assert _model_limit(model_config) == (expected or settings.BATCH_MODEL_CONCURRENCY)
+
+async def test_batch_runs_with_model_limits(batch_db, monkeypatch):
+    """测试批次按模型上限并发执行，结果保存为消息并按完成顺序返回"""
+    factory, limited_id, conversation_id = batch_db
+    upstream = CountingUpstream(delay=0.05)
+    monkeypatch.setattr(generation, "create_chat_completion", upstream)
+    runner = BatchRunner(runner=GenerationRunner())
+
+    items = [{"prompt": f"p{i}", "model_id": limited_id} for i in range(6)]
+    items.append({"prompt": "in conversation", "conversation_id": conversation_id})
+    pending = batch_items.get(status="pending")
+    async with factory() as db:
+        batch = await runner.create(db, BatchCreate(user_id="u1", items=items, concurrency=5))
+    runner.start(batch, factory)
+    assert batch_items.get(status="pending") == pending + 7
+
+    results = [result async for result in batch.results()]
+    assert batch_items.get(status="pending") == pending
+    assert batch_items.get(status="running") == 0
+    assert batch.status == BatchStatus.COMPLETED
+    assert sorted(r["index"] for r in results) == list(range(7))
+    assert {r["status"] for r in results} == {"completed"}
+    assert upstream.peak["limited"] == 2
+    by_index = {r["index"]: r for r in results}
+    assert by_index[3]["content"] == "re: p3"
+    assert runner.runner.get(by_index[3]["message_id"]).detached_timeout == 0
+    assert by_index[6]["conversation_id"] == conversation_id
+    assert batch.progress()["completed"] == 7
+
+    async with factory() as db:
+        standalone = (await db.execute(
+            select(Conversation).filter(Conversation.model_id == limited_id)
+        )).scalar_one()
+        assert standalone.meta_info["batch_id"] == batch.id
+        assert standalone.message_count == 12
+        answer = await db.get(Message, by_index[3]["message_id"])
+        assert answer.role == MessageRole.ASSISTANT and answer.content == "re: p3"
+
+async def test_model_limit_change_applies_to_running_batch(batch_db, monkeypatch):
+    """测试修改模型并发上限后，运行中的批次按新上限执行"""
+    factory, limited_id, _ = batch_db
+    upstream = CountingUpstream(delay=0.05)
+    monkeypatch.setattr(generation, "create_chat_completion", upstream)
+    runner = BatchRunner(runner=GenerationRunner())
+    items = [{"prompt": f"p{i}", "model_id": limited_id} for i in range(6)]
+    async with factory() as db:
+        batch = runner.start(await runner.create(db, BatchCreate(user_id="u1", items=items)), factory)
+    while upstream.active["limited"] < 2:
+        await asyncio.sleep(0.005)
+
+    async with factory() as db:
+        model = await db.get(LLMModel, limited_id)
+        model.meta_info = {"custom_settings": {"max_concurrency": 3}}
+        await db.commit()
+    model_registry.invalidate()
+    runner.invalidate_limits()
+    await batch.task
+    assert upstream.peak["limited"] == 3
+
+async def test_waiting_item_holds_no_model_slot(batch_db, monkeypatch):
+    """测试等待批次额度的提示不占用模型额度，其他批次可以用满该模型的上限"""
+    factory, limited_id, conversation_id = batch_db
+    upstream = CountingUpstream(delay=10)
+    monkeypatch.setattr(generation, "create_chat_completion", upstream)
+    runner = BatchRunner(runner=GenerationRunner())
+    async with factory() as db:
+        busy = await runner.create(db, BatchCreate(user_id="u1", concurrency=1, items=[
+            {"prompt": "other", "conversation_id": conversation_id},
+            {"prompt": "waiting", "model_id": limited_id},
+        ]))
+    runner.start(busy, factory)
+    while upstream.active["other"] < 1:
+        await asyncio.sleep(0.005)
+
+    async with factory() as db:
+        batch = runner.start(await runner.create(db, BatchCreate(user_id="u1", items=[
+            {"prompt": f"p{i}", "model_id": limited_id} for i in range(2)
+        ])), factory)
+
+    async def limited_full():
+        while upstream.active["limited"] < 2:
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(limited_full(), 1)
+    await runner.cancel(busy.id)
+    await runner.cancel(batch.id)
+
+async def test_cancel_batch(batch_db, monkeypatch):
+    """测试取消批次：执行中的提示保存已生成部分，未执行的记为取消"""
+    factory, limited_id, _ = batch_db
+    monkeypatch.setattr(generation, "create_chat_completion", CountingUpstream(delay=10))
+    runner = BatchRunner(runner=GenerationRunner())
+    items = [{"prompt": f"p{i}", "model_id": limited_id} for i in range(4)]
+    async with factory() as db:
+        batch = runner.start(await runner.create(db, BatchCreate(user_id="u1", items=items)), factory)
+    while batch.progress()["running"] < 2:
+        await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(runner.cancel(batch.id), 2)
+    assert batch.status == BatchStatus.CANCELLED
+    assert batch.progress()["cancelled"] == 4
+    assert len([r async for r in batch.results()]) == 4
+    running = [item for item in batch.items if item.message_id]
+    async with factory() as db:
+        for item in running:
+            message = await db.get(Message, item.message_id)
+            assert message.meta_info == {"status": "cancelled"}
+
+async def test_batch_api(client: AsyncClient, session, monkeypatch):
+    """测试批次接口的提交、进度、结果下载和参数校验"""
+    monkeypatch.setattr(generation, "create_chat_completion", CountingUpstream(delay=0))
+    model = LLMModel(name="api", type="open_ai_like", model_name="api", api_key="")
+    session.add(model)
+    await session.commit()
+
+    response = await client.post("/api/batches", json={
+        "user_id": "u1", "items": [{"prompt": "hi", "model_id": model.id}]
+    })
+    assert response.status_code == 202
+    batch_id = response.json()["id"]
+    assert response.json()["total"] == 1
+
+    response = await client.get(f"/api/batches/{batch_id}/results")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    (result,) = [json.loads(line) for line in response.text.splitlines()]
+    assert result["status"] == "completed" and result["content"] == "re: hi"
+    assert (await client.get(f"/api/batches/{batch_id}")).json()["status"] == "completed"
+
+    response = await client.post("/api/batches", json={
+        "user_id": "u1", "items": [{"prompt": "hi", "conversation_id": "missing"}]
+    })
+    assert response.status_code == 404
+    response = await client.post("/api/batches", json={
+        "user_id": "u1", "items": [{"prompt": "hi", "conversation_id": "c", "model_id": model.id}]
+    })
+    assert response.status_code == 422
+    assert (await client.get("/api/batches/missing")).status_code == 404
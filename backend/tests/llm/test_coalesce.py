@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.llm.services.coalesce import coalesce_chunks
+
+async def stream(chunks, delay=0.0):
+    for chunk in chunks:
+        if delay:
+            await asyncio.sleep(delay)
+        yield chunk
+
+async def collect(iterator):
+    return [chunk async for chunk in iterator]
+
+async def test_first_chunk_then_merge():
+    """测试首块立即输出，之后连续同类型块合并"""
+    chunks = [{"type": "message", "content": c} for c in "你好世界"]
+    result = await collect(coalesce_chunks(stream(chunks), window_ms=50))
+    assert result == [
+        {"type": "message", "content": "你"},
+        {"type": "message", "content": "好世界"},
+    ]
+
+async def test_flush_on_type_change():
+    """测试类型变化时先输出缓冲"""
+    chunks = [
+        {"type": "think", "content": "a"},
+        {"type": "think", "content": "b"},
+        {"type": "think", "content": "c"},
+        {"type": "message", "content": "d"},
+        {"type": "message", "content": "e"},
+    ]
+    result = await collect(coalesce_chunks(stream(chunks), window_ms=50))
+    assert result == [
+        {"type": "think", "content": "a"},
+        {"type": "think", "content": "bc"},
+        {"type": "message", "content": "de"},
+    ]
+
+async def test_structured_chunks_pass_through():
+    """测试 action 等结构化块不参与合并"""
+    chunks = [
+        {"type": "message", "content": "a"},
+        {"type": "action", "content": {"tool": "x"}},
+        {"type": "action", "content": {"tool": "y"}},
+    ]
+    result = await collect(coalesce_chunks(stream(chunks), window_ms=50))
+    assert result == chunks
+
+async def test_flush_on_max_bytes():
+    """测试缓冲达到字节上限时立即输出"""
+    chunks = [{"type": "message", "content": "ab"} for _ in range(5)]
+    result = await collect(coalesce_chunks(stream(chunks), window_ms=1000, max_bytes=4))
+    assert [c["content"] for c in result] == ["ab", "abab", "abab"]
+
+async def test_flush_on_window_timeout():
+    """测试上游较慢时按时间窗口输出，不等待下一个块"""
+    chunks = [{"type": "message", "content": c} for c in "abc"]
+    result = await collect(coalesce_chunks(stream(chunks, delay=0.05), window_ms=10))
+    assert [c["content"] for c in result] == ["a", "b", "c"]
+
+async def test_window_zero_passes_through():
+    chunks = [{"type": "message", "content": c} for c in "abc"]
+    result = await collect(coalesce_chunks(stream(chunks), window_ms=0))
+    assert result == chunks
+
+async def test_flush_before_upstream_error():
+    """测试上游出错时先输出缓冲再抛出异常"""
+    async def failing():
+        for c in "abc":
+            yield {"type": "message", "content": c}
+        raise RuntimeError("upstream")
+
+    result = []
+    with pytest.raises(RuntimeError):
+        async for chunk in coalesce_chunks(failing(), window_ms=1000):
+            result.append(chunk)
+    assert [c["content"] for c in result] == ["a", "bc"]
+
+async def test_cancel_hands_over_buffer():
+    """测试消费方被取消时缓冲交给 on_unflushed"""
+    async def stalled():
+        for c in "abc":
+            yield {"type": "message", "content": c}
+        await asyncio.Event().wait()
+
+    unflushed = []
+    task = asyncio.create_task(collect(coalesce_chunks(stalled(), window_ms=1000, on_unflushed=unflushed.append)))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert unflushed == [{"type": "message", "content": "bc"}]
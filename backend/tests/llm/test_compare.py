@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from app.llm.models import Conversation, LLMModel, Message
+from app.llm.models.message import MessageRole
+from app.llm.services import generation
+from app.llm.services.compare import start_compare, stream_compare
+from app.llm.services.generation import GenerationRunner
+
+# 每个模型每个输出块的间隔（秒）
+DELAYS = {"fast": 0.05, "slow": 0.1}
+
+async def per_model(messages, model_config=None, temperature=None, stream=True):
+    for token in ["a", "b", "c"]:
+        await asyncio.sleep(DELAYS[model_config.model_name])
+        yield {"type": "message", "content": f"{model_config.model_name}-{token}"}
+
+def frames(chunks):
+    return [json.loads(chunk.split(b"data: ", 1)[1]) for chunk in chunks]
+
+@pytest_asyncio.fixture(loop_scope="function")
+async def compare_db(file_session_factory, monkeypatch):
+    monkeypatch.setattr(generation, "create_chat_completion", per_model)
+    monkeypatch.setattr(generation.settings, "SSE_COALESCE_WINDOW_MS", 0)
+    factory = file_session_factory
+    async with factory() as session:
+        models = [LLMModel(name=n, type="open_ai_like", model_name=n, api_key="") for n in DELAYS]
+        session.add_all(models)
+        await session.flush()
+        conversation = Conversation(title="c", model_id=models[0].id, user_id="u1")
+        session.add(conversation)
+        await session.commit()
+    return factory, conversation.id, [m.id for m in models]
+
+async def test_compare_streams_models_concurrently(compare_db):
+    """测试多个模型并发生成，输出交错返回，耗时约等于最慢的模型"""
+    factory, conversation_id, (fast_id, slow_id) = compare_db
+    async with factory() as db:
+        jobs = await start_compare(db, factory, conversation_id, "hi", [fast_id, slow_id], GenerationRunner())
+        # 生成任务在 start_compare 返回前同步创建；之前保存消息的耗时在整套测试中波动较大，不计入
+        started = time.perf_counter()
+    received = frames([chunk async for chunk in stream_compare(conversation_id, jobs)])
+    elapsed = time.perf_counter() - started
+
+    # 串行执行至少需要各模型耗时之和
+    assert elapsed < 3 * (DELAYS["fast"] + DELAYS["slow"]) - 0.05
+    assert [f["type"] for f in received[:2]] == ["start", "start"]
+    assert received[-1] == {"type": "done", "conversation_id": conversation_id}
+    # 快模型结束时慢模型仍在输出
+    fast_end = next(i for i, f in enumerate(received) if f["type"] == "end" and f["model_id"] == fast_id)
+    assert any(f["type"] == "message" and f["model_id"] == slow_id for f in received[fast_end:])
+    for job, model_id in zip(jobs, (fast_id, slow_id)):
+        mine = [f for f in received if f.get("message_id") == job.id]
+        assert {f["model_id"] for f in mine} == {model_id}
+        assert mine[-1] == {
+            "type": "end", "content": "completed", "conversation_id": conversation_id,
+            "message_id": job.id, "model_id": model_id
+        }
+
+    async with factory() as db:
+        messages = (await db.execute(
+            select(Message).filter(Message.conversation_id == conversation_id)
+        )).unique().scalars().all()
+        user = next(m for m in messages if m.role == MessageRole.USER)
+        answers = {m.meta_info["model_id"]: m for m in messages if m.role == MessageRole.ASSISTANT}
+        assert answers[slow_id].content == "slow-aslow-bslow-c"
+        assert {m.meta_info["compare_group"] for m in answers.values()} == {user.id}
+        assert (await db.get(Conversation, conversation_id)).message_count == 3
+
+async def test_compare_api_errors(client: AsyncClient, session):
+    """测试会话或模型不存在时返回 404"""
+    model = LLMModel(name="m", type="open_ai_like", model_name="fast", api_key="")
+    session.add(model)
+    await session.flush()
+    conversation = Conversation(title="c", model_id=model.id, user_id="u1")
+    session.add(conversation)
+    await session.commit()
+
+    response = await client.post(f"/api/conversations/{conversation.id}/compare",
+                                 json={"query": "q", "model_ids": [model.id, "missing"]})
+    assert response.status_code == 404
+    response = await client.post("/api/conversations/missing/compare",
+                                 json={"query": "q", "model_ids": [model.id]})
+    assert response.status_code == 404
+    response = await client.post(f"/api/conversations/{conversation.id}/compare",
+                                 json={"query": "q", "model_ids": []})
+    assert response.status_code == 400
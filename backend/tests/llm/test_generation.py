@@ -0,0 +1,233 @@
+import asyncio
+import json
+import time
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.llm.models import Conversation, LLMModel, Message, MessageItem
+from app.llm.schemas.message import MessageCreate
+from app.llm.models.message import MessageRole
+from app.llm.services import MessageService, generation
+from app.llm.services.generation import (
+    GenerationJob, GenerationRunner, JobStatus, generation_runner, stream_conversation
+)
+from core.metrics import generation_jobs_running
+from tests.sse_helpers import data_frames
+
+async def slow_completion(messages, model_config=None, temperature=None, stream=True):
+    for token in ["一", "二", "三"]:
+        await asyncio.sleep(0.05)
+        yield {"type": "message", "content": token}
+
+@pytest.fixture
+async def assistant_message(session, monkeypatch):
+    monkeypatch.setattr(generation, "create_chat_completion", slow_completion)
+    model = LLMModel(name="job", type="open_ai_like", model_name="job", api_key="")
+    session.add(model)
+    await session.flush()
+    conversation = Conversation(title="t", model_id=model.id, user_id="u1")
+    session.add(conversation)
+    await session.commit()
+    return await MessageService(session).create_message(MessageCreate(
+        conversation_id=conversation.id, user_id="u1", role=MessageRole.ASSISTANT
+    ))
+
+async def test_job_completes_after_subscriber_leaves(session, assistant_message):
+    """测试订阅者中途离开后任务仍跑完并保存结果"""
+    runner = GenerationRunner()
+    factory = sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False)
+    job = runner.start(GenerationJob(
+        assistant_message.id, assistant_message.conversation_id, messages=[]
+    ), factory)
+
+    subscription = job.subscribe()
+    assert await subscription.__anext__() == (1, "message", "一")
+    await subscription.aclose()
+
+    await job.task
+    assert job.status == JobStatus.COMPLETED
+    items = (await session.execute(
+        select(MessageItem).filter(MessageItem.message_id == assistant_message.id)
+    )).scalars().all()
+    assert [item.content for item in items] == ["一二三"]
+
+async def test_reattach_replays_job(client: AsyncClient, assistant_message):
+    """测试按助手消息ID重新连接，先重放已有输出再继续接收"""
+    response = await client.post(
+        f"/api/conversations/{assistant_message.conversation_id}/query", params={"query": "hi"}
+    )
+    frames = data_frames(response.text)
+    message_id = frames[0]["message_id"]
+
+    response = await client.get(f"/api/messages/{message_id}/stream")
+    assert response.status_code == 200
+    assert data_frames(response.text) == frames
+
+    response = await client.get("/api/messages/missing/stream")
+    assert response.status_code == 404
+
+async def test_replay_buffer_is_bounded():
+    """测试回放缓冲超出上限时丢弃最早的输出块，保存用的完整内容不受影响"""
+    job = GenerationJob("j", "c", messages=[], buffer_bytes=4)
+    for token in ["ab", "cd", "ef"]:
+        job.append("message", token)
+    assert job.first_id == 2 and job.last_id == 3
+    assert job.can_resume(1) and not job.can_resume(0)
+    assert job.collected() == {"message": "abcdef"}
+
+    job.finish(JobStatus.COMPLETED)
+    assert [chunk async for chunk in job.subscribe(1)] == [(2, "message", "cd"), (3, "message", "ef")]
+    with pytest.raises(generation.ReplayExpired):
+        [chunk async for chunk in job.subscribe(0)]
+
+async def test_runner_evicts_by_total_size():
+    """测试所有任务的缓冲合计超限时先淘汰最早结束的任务"""
+    runner = GenerationRunner(total_bytes=5)
+    for job_id in ["a", "b"]:
+        job = GenerationJob(job_id, "c", messages=[])
+        job.append("message", "xxxx")
+        job.finish(JobStatus.COMPLETED)
+        runner._jobs[job_id] = job
+    assert runner.get("a") is None
+    assert runner.get("b") is not None
+
+class EndlessUpstream:
+    """不会自行结束的上游流，记录连接释放时间"""
+
+    def __init__(self):
+        self.released_at = None
+
+    async def __call__(self, messages, model_config=None, temperature=None, stream=True):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield {"type": "message", "content": "字"}
+        finally:
+            self.released_at = time.perf_counter()
+
+async def test_cancel_releases_upstream(client: AsyncClient, session, assistant_message, monkeypatch):
+    """测试取消接口立即关闭上游流，并保存取消状态的部分回答"""
+    upstream = EndlessUpstream()
+    monkeypatch.setattr(generation, "create_chat_completion", upstream)
+    factory = sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False)
+    job = generation_runner.start(GenerationJob(
+        assistant_message.id, assistant_message.conversation_id, messages=[]
+    ), factory)
+    while len(job.chunks) < 3:
+        await asyncio.sleep(0.01)
+
+    requested_at = time.perf_counter()
+    response = await client.post(f"/api/messages/{assistant_message.id}/cancel")
+    assert response.json() == {"id": assistant_message.id, "status": "cancelled"}
+    assert upstream.released_at is not None
+    assert upstream.released_at - requested_at < 0.05
+
+    await session.refresh(assistant_message)
+    assert assistant_message.meta_info == {"status": "cancelled"}
+    assert assistant_message.content.startswith("字字字")
+
+    response = await client.post("/api/messages/missing/cancel")
+    assert response.status_code == 404
+
+async def test_missing_job_in_multi_worker_mode(client: AsyncClient, monkeypatch):
+    """测试多 worker 时找不到任务的 404 提示任务可能在其他 worker 上"""
+    response = await client.get("/api/messages/missing/stream")
+    assert response.json()["detail"] == "生成任务不存在或已过期"
+    monkeypatch.setattr(generation.settings, "WORKERS", 2)
+    response = await client.post("/api/messages/missing/cancel")
+    assert response.status_code == 404
+    assert "其他 worker" in response.json()["detail"]
+
+async def test_detached_job_is_cancelled(session, assistant_message, monkeypatch):
+    """测试所有订阅者断开且超时未重连时取消任务"""
+    upstream = EndlessUpstream()
+    monkeypatch.setattr(generation, "create_chat_completion", upstream)
+    factory = sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False)
+    job = GenerationRunner().start(GenerationJob(
+        assistant_message.id, assistant_message.conversation_id, messages=[], detached_timeout=0.05
+    ), factory)
+
+    subscription = job.subscribe()
+    await subscription.__anext__()
+    await subscription.aclose()
+    await asyncio.wait_for(job.wait(), timeout=1)
+    assert job.status == JobStatus.CANCELLED
+    assert upstream.released_at is not None
+
+async def test_cancel_during_save_is_ignored(session, assistant_message, monkeypatch):
+    """测试保存结果期间的取消（接口或关闭进程）不会中断保存，各部分在同一事务中写入"""
+    service = generation.ConversationService
+    original = service.update_conversation_last_message
+
+    async def slow_update(self, conversation_id, commit=True):
+        await asyncio.sleep(0.1)
+        await original(self, conversation_id, commit=commit)
+
+    monkeypatch.setattr(service, "update_conversation_last_message", slow_update)
+    factory = sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False)
+    runner = GenerationRunner()
+    job = runner.start(GenerationJob(
+        assistant_message.id, assistant_message.conversation_id, messages=[]
+    ), factory)
+    while not job.saving:
+        await asyncio.sleep(0.01)
+
+    assert not job.cancel()
+    job.task.cancel()
+    assert (await runner.cancel(job.id)).status == JobStatus.COMPLETED
+
+    await session.refresh(assistant_message)
+    assert assistant_message.content == "一二三"
+    items = (await session.execute(
+        select(MessageItem).filter(MessageItem.message_id == assistant_message.id)
+    )).scalars().all()
+    assert [item.content for item in items] == ["一二三"]
+
+async def test_cancel_before_start():
+    """测试任务开始执行前被取消也会结束订阅"""
+    job = GenerationRunner().start(GenerationJob("early", "c", messages=[]), None)
+    assert job.cancel()
+    assert [chunk async for chunk in job.subscribe()] == []
+    assert job.status == JobStatus.CANCELLED
+
+async def test_running_jobs_gauge(session, assistant_message):
+    """测试进行中的生成数在任务启动时增加，完成或开始前取消后减少"""
+    before = generation_jobs_running.get()
+    factory = sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False)
+    runner = GenerationRunner()
+    job = runner.start(GenerationJob(assistant_message.id, assistant_message.conversation_id, messages=[]), factory)
+    early = runner.start(GenerationJob("early", "c", messages=[]), None)
+    assert generation_jobs_running.get() == before + 2
+
+    early.cancel()
+    await asyncio.wait({job.task, early.task})
+    assert generation_jobs_running.get() == before
+
+async def test_live_conversation_fan_out(session, assistant_message):
+    """测试会话的实时订阅者收到相同输出，中途加入的先补发已有输出且不重复"""
+    runner = GenerationRunner()
+    factory = sessionmaker(session.bind, class_=AsyncSession, expire_on_commit=False)
+    conversation_id = assistant_message.conversation_id
+
+    async def watch():
+        frames = []
+        async for frame in stream_conversation(conversation_id, runner):
+            frames.append(json.loads(frame.split(b"data: ", 1)[1]))
+            if frames[-1]["type"] == "done":
+                return frames
+
+    early = asyncio.create_task(watch())
+    await asyncio.sleep(0)
+    job = runner.start(GenerationJob(assistant_message.id, conversation_id, messages=[]), factory)
+    while not job.chunks:
+        await asyncio.sleep(0.01)
+    late = asyncio.create_task(watch())
+
+    for frames in await asyncio.wait_for(asyncio.gather(early, late), 2):
+        assert frames[0]["type"] == "start" and frames[-1]["type"] == "done"
+        assert "".join(f["content"] for f in frames if f["type"] == "message") == "一二三"
+        assert {f["message_id"] for f in frames} == {job.id}
@@ -0,0 +1,49 @@
+from app.llm.models import LLMModel
+from app.llm.schemas.model import LLMModelCreate, LLMModelUpdate
+from app.llm.services import LLMModelService
+from app.llm.services.model_registry import ModelRegistry, model_registry
+
+async def test_registry_get_and_list(session):
+    """测试加载后读取缓存，API 密钥已解密"""
+    model = LLMModel(name="reg", type="registry_test", model_name="m", api_key="sk-test", priority=5)
+    session.add(model)
+    await session.commit()
+
+    registry = ModelRegistry()
+    await registry.load(session)
+    config = await registry.get(session, model.id)
+    assert config.api_key == "sk-test"
+    assert config.model_name == "m"
+
+    items, total = await registry.list(session, type="registry_test")
+    assert total == 1 and items[0].id == model.id
+    assert await registry.get(session, "missing") is None
+
+async def test_registry_falls_back_to_database(session):
+    """测试缓存加载后新写入的行可以回查到"""
+    registry = ModelRegistry()
+    await registry.load(session)
+    model = LLMModel(name="late", type="open_ai_like", model_name="late", api_key="")
+    session.add(model)
+    await session.commit()
+    assert (await registry.get(session, model.id)).name == "late"
+
+async def test_registry_invalidated_by_service(session):
+    """测试模型服务的增改提交后清空缓存"""
+    service = LLMModelService(session)
+    created = await service.create(LLMModelCreate(name="a", model_name="a", api_key="k"))
+    await model_registry.load(session)
+    assert model_registry.loaded
+
+    await service.update(created.id, LLMModelUpdate(model_name="b"))
+    assert not model_registry.loaded
+    assert (await model_registry.get(session, created.id)).model_name == "b"
+
+async def test_token_usage_keeps_cache(session):
+    """测试只更新用量计数时不清空缓存"""
+    service = LLMModelService(session)
+    created = await service.create(LLMModelCreate(name="u", model_name="u", api_key="k"))
+    await model_registry.load(session)
+
+    await service.update_token_usage(created.id, 10)
+    assert model_registry.loaded
@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+import pytest_asyncio
+from fastapi import WebSocketDisconnect
+
+from app.llm.models import Conversation, LLMModel
+from app.llm.services import generation
+from app.llm.services.generation import GenerationRunner
+from app.llm.services.multiplex import StreamMultiplexer
+
+class FakeWebSocket:
+    """按脚本收发消息的 WebSocket 替身"""
+
+    def __init__(self):
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self._sent_changed = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def receive_text(self):
+        message = await self.inbox.get()
+        if message is None:
+            raise WebSocketDisconnect()
+        return json.dumps(message)
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+        self._sent_changed.set()
+
+    async def wait_for(self, predicate, timeout=2):
+        async def _wait():
+            while not predicate(self.sent):
+                self._sent_changed.clear()
+                await self._sent_changed.wait()
+        await asyncio.wait_for(_wait(), timeout)
+
+    def frames(self, stream):
+        return [f for f in self.sent if f["stream"] == stream]
+
+class BrokenWebSocket(FakeWebSocket):
+    """发送即失败的 WebSocket，模拟对端已断开"""
+
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    async def send_text(self, text):
+        raise RuntimeError("connection lost")
+
+    async def close(self):
+        self.closed = True
+
+async def tokens(messages, model_config=None, temperature=None, stream=True):
+    for token in messages[0]["content"].split():
+        await asyncio.sleep(0.01)
+        yield {"type": "message", "content": token}
+
+def is_done(stream):
+    return lambda sent: any(f["stream"] == stream and f["type"] == "done" for f in sent)
+
+# 连接处理任务需与测试运行在同一个事件循环
+async def create_conversations(factory, monkeypatch):
+    monkeypatch.setattr(generation, "create_chat_completion", tokens)
+    # 不合并输出块，便于逐帧断言
+    monkeypatch.setattr(generation.settings, "SSE_COALESCE_WINDOW_MS", 0)
+    async with factory() as session:
+        model = LLMModel(name="mux", type="open_ai_like", model_name="mux", api_key="")
+        session.add(model)
+        await session.flush()
+        conversations = [Conversation(title=f"c{i}", model_id=model.id, user_id="u1") for i in range(2)]
+        session.add_all(conversations)
+        await session.commit()
+    return [c.id for c in conversations]
+
+@pytest_asyncio.fixture(loop_scope="function")
+async def mux(file_session_factory, monkeypatch):
+    conversation_ids = await create_conversations(file_session_factory, monkeypatch)
+    socket = FakeWebSocket()
+    multiplexer = StreamMultiplexer(socket, file_session_factory, window=1, runner=GenerationRunner())
+    task = asyncio.create_task(multiplexer.run())
+    yield socket, conversation_ids
+    await socket.inbox.put(None)
+    await asyncio.wait_for(task, 2)
+
+async def test_concurrent_streams(mux):
+    """测试一个连接上同时进行两路生成，帧按流 ID 区分"""
+    socket, (c1, c2) = mux
+    await socket.inbox.put({"op": "start", "stream": "a", "conversation_id": c1, "query": "一 二"})
+    await socket.inbox.put({"op": "start", "stream": "b", "conversation_id": c2, "query": "三 四"})
+    for stream in ("a", "b"):
+        await socket.wait_for(lambda sent, s=stream: len([f for f in sent if f["stream"] == s]) >= 2)
+        await socket.inbox.put({"op": "credit", "stream": stream, "credit": 10})
+    await socket.wait_for(lambda sent: is_done("a")(sent) and is_done("b")(sent))
+
+    for stream, expected in (("a", ["一", "二"]), ("b", ["三", "四"])):
+        frames = socket.frames(stream)
+        assert frames[0]["type"] == "meta"
+        assert [f["content"] for f in frames if f["type"] == "message"] == expected
+        assert [f["id"] for f in frames if f["type"] == "message"] == [1, 2]
+        assert frames[-1] == {"stream": stream, "type": "done", "status": "completed"}
+
+async def test_flow_control_pauses_one_stream(mux):
+    """测试额度用完的流暂停，不影响其他流"""
+    socket, (c1, c2) = mux
+    await socket.inbox.put({"op": "start", "stream": "slow", "conversation_id": c1, "query": "1 2 3"})
+    await socket.inbox.put({"op": "start", "stream": "fast", "conversation_id": c2, "query": "4 5"})
+    await socket.inbox.put({"op": "credit", "stream": "fast", "credit": 10})
+    await socket.wait_for(is_done("fast"))
+
+    # 初始额度为 1：slow 只收到 meta 和第一帧
+    assert [f["type"] for f in socket.frames("slow")] == ["meta", "message"]
+    await socket.inbox.put({"op": "credit", "stream": "slow", "credit": 10})
+    await socket.wait_for(is_done("slow"))
+    assert [f["content"] for f in socket.frames("slow") if f["type"] == "message"] == ["1", "2", "3"]
+
+async def test_cancel_and_errors(mux):
+    """测试取消单路流和无效请求"""
+    socket, (c1, _) = mux
+    await socket.inbox.put({"op": "start", "stream": "a", "conversation_id": c1, "query": " ".join("x" * 50)})
+    await socket.wait_for(lambda sent: len(socket.frames("a")) >= 2)
+    await socket.inbox.put({"op": "cancel", "stream": "a"})
+    await socket.inbox.put({"op": "credit", "stream": "a", "credit": 100})
+    await socket.wait_for(is_done("a"))
+    assert socket.frames("a")[-1]["status"] == "cancelled"
+
+    await socket.inbox.put({"op": "start", "stream": "b", "conversation_id": "missing", "query": "q"})
+    await socket.inbox.put({"op": "credit", "stream": "nope", "credit": 1})
+    await socket.wait_for(lambda sent: len(socket.frames("nope")) == 1)
+    assert socket.frames("b") == [{"stream": "b", "type": "error", "content": "会话不存在"}]
+    assert socket.frames("nope")[0]["type"] == "error"
+
+async def test_send_failure_closes_connection(file_session_factory, monkeypatch):
+    """测试发送失败后连接结束：关闭 socket，转发任务和接收循环不会卡在已满的发送队列上"""
+    c1, c2 = await create_conversations(file_session_factory, monkeypatch)
+    socket = BrokenWebSocket()
+    multiplexer = StreamMultiplexer(socket, file_session_factory, window=100, runner=GenerationRunner())
+    multiplexer._outbox = asyncio.Queue(maxsize=1)
+    task = asyncio.create_task(multiplexer.run())
+    await socket.inbox.put({"op": "start", "stream": "a", "conversation_id": c1, "query": " ".join("x" * 50)})
+    await socket.inbox.put({"op": "start", "stream": "b", "conversation_id": c2, "query": " ".join("y" * 50)})
+    for i in range(10):
+        await socket.inbox.put({"op": "credit", "stream": "nope", "credit": 1})
+
+    # 不发送断开消息，run 也应结束
+    await asyncio.wait_for(task, 2)
+    assert socket.closed
+    assert multiplexer.streams == {}
+
+def test_route_registered():
+    from conftest import app
+    assert "/api/ws" in {route.path for route in app.routes}
@@ -0,0 +1,14 @@
+"""测试中解析 SSE 响应的辅助函数"""
+import json
+
+def parse_events(text: str):
+    """解析 SSE 响应为 [{"id": ..., "event": ..., "data": ...}]"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append({"id": fields.get("id"), "event": fields.get("event"), "data": json.loads(fields["data"])})
+    return events
+
+def data_frames(text: str):
+    """未命名事件（模型输出和完成帧）的数据"""
+    return [e["data"] for e in parse_events(text) if e["event"] is None]
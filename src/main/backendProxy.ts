@@ -0,0 +1,92 @@
+import { protocol } from 'electron'
+import { get, request, IncomingHttpHeaders } from 'http'
+import { tmpdir } from 'os'
+import { join } from 'path'
+import { Readable } from 'stream'
+
+// 渲染进程通过 maoflow://backend 访问后端，由主进程转发到 Unix 域套接字
+export const BACKEND_SCHEME = 'maoflow'
+export const BACKEND_UDS_BASE_URL = `${BACKEND_SCHEME}://backend`
+
+// Windows 上 uvicorn 不支持命名管道，继续使用 TCP
+export const supportsUnixSocket = (): boolean => process.platform !== 'win32'
+
+// macOS 限制套接字路径长度（104 字节），放在临时目录下
+export const getBackendSocketPath = (): string => join(tmpdir(), `maoflow-${process.pid}.sock`)
+
+// 必须在 app ready 之前调用
+export const registerBackendScheme = (): void => {
+  protocol.registerSchemesAsPrivileged([
+    {
+      scheme: BACKEND_SCHEME,
+      privileges: {
+        standard: true,
+        secure: true,
+        supportFetchAPI: true,
+        corsEnabled: true,
+        stream: true
+      }
+    }
+  ])
+}
+
+const toFetchHeaders = (headers: IncomingHttpHeaders): Headers => {
+  const result = new Headers()
+  for (const [key, value] of Object.entries(headers)) {
+    if (Array.isArray(value)) {
+      value.forEach((v) => result.append(key, v))
+    } else if (value !== undefined) {
+      result.set(key, value)
+    }
+  }
+  return result
+}
+
+// 把 maoflow:// 请求转发到后端套接字，响应以流的形式返回（支持 SSE）
+export const handleBackendProtocol = (socketPath: string): void => {
+  protocol.handle(BACKEND_SCHEME, (req) => {
+    const url = new URL(req.url)
+    return new Promise<Response>((resolve, reject) => {
+      const upstream = request(
+        {
+          socketPath,
+          path: `${url.pathname}${url.search}`,
+          method: req.method,
+          headers: Object.fromEntries(req.headers.entries())
+        },
+        (res) => {
+          const status = res.statusCode ?? 502
+          const body = status === 204 || status === 304 ? null : (Readable.toWeb(res) as ReadableStream)
+          resolve(new Response(body, { status, headers: toFetchHeaders(res.headers) }))
+        }
+      )
+      upstream.on('error', reject)
+      if (req.body) {
+        Readable.fromWeb(req.body as any).pipe(upstream)
+      } else {
+        upstream.end()
+      }
+    })
+  })
+}
+
+// 后端启动完成后在 stdout 输出的就绪行前缀（见 backend/core/readiness.py）
+export const BACKEND_READY_PREFIX = 'MAOFLOW_READY'
+
+// 查询 /health/ready，开发模式下没有就绪行时用于轮询
+export const probeBackendReady = (socketPath: string | null): Promise<boolean> => {
+  const options = socketPath
+    ? { socketPath, path: '/health/ready' }
+    : { host: 'localhost', port: 17349, path: '/health/ready' }
+  return new Promise((resolve) => {
+    const req = get(options, (res) => {
+      res.resume()
+      resolve(res.statusCode === 200)
+    })
+    req.on('error', () => resolve(false))
+    req.setTimeout(1000, () => {
+      req.destroy()
+      resolve(false)
+    })
+  })
+}
@@ -2,14 +2,56 @@ import { app, shell, BrowserWindow, ipcMain } from 'electron'
 import { join } from 'path'
 import { electronApp, optimizer, is } from '@electron-toolkit/utils'
 import { spawn } from 'child_process'
-import { existsSync } from 'fs'
+import { existsSync, rmSync } from 'fs'
 import { setupFileHandlers } from './ipc/fileHandler'
 import { initDatabase } from './database'
+import {
+  BACKEND_READY_PREFIX,
+  BACKEND_UDS_BASE_URL,
+  getBackendSocketPath,
+  handleBackendProtocol,
+  probeBackendReady,
+  registerBackendScheme,
+  supportsUnixSocket
+} from './backendProxy'
 
 let pythonProcess: any = null
 let mainWindow: BrowserWindow | null = null
 
+// 后端监听的 Unix 域套接字，Windows 上为 null（使用 TCP 端口）
+const backendSocketPath: string | null = supportsUnixSocket() ? getBackendSocketPath() : null
+registerBackendScheme()
+
+// 后端就绪（迁移、预热完成）后 resolve，渲染进程通过 backend:whenReady 等待
+let resolveBackendReady: () => void = () => {}
+let backendReady: Promise<void> = Promise.resolve()
+
+function resetBackendReady(): void {
+  let settled = false
+  backendReady = new Promise<void>((resolve) => {
+    resolveBackendReady = () => {
+      if (!settled) {
+        settled = true
+        resolve()
+      }
+    }
+  })
+  // 开发模式下 uvicorn 不输出就绪行，轮询 /health/ready
+  const poll = async (): Promise<void> => {
+    while (!settled) {
+      if (await probeBackendReady(backendSocketPath)) {
+        resolveBackendReady()
+        return
+      }
+      await new Promise((r) => setTimeout(r, 200))
+    }
+  }
+  poll()
+}
+
 function startPythonBackend(): void {
+  resetBackendReady()
+
   // 初始化数据库
   const dbPath = initDatabase();
 
@@ -32,12 +74,17 @@ function startPythonBackend(): void {
       return
     }
     // 在打包环境中直接运行可执行文件，并传递数据库路径
-    pythonProcess = spawn(backendPath, ['--db-path', dbPath], {
+    const args = ['--db-path', dbPath]
+    if (backendSocketPath) {
+      args.push('--uds', backendSocketPath)
+    }
+    pythonProcess = spawn(backendPath, args, {
       stdio: ['pipe', 'pipe', 'pipe']
     })
   } else {
     // 在开发环境中使用 uvicorn，并传递数据库路径环境变量
-    pythonProcess = spawn('python', ['-m', 'uvicorn', 'app.main:app', '--reload', '--port', '17349'], {
+    const bindArgs = backendSocketPath ? ['--uds', backendSocketPath] : ['--port', '17349']
+    pythonProcess = spawn('python', ['-m', 'uvicorn', 'main:app', '--reload', ...bindArgs], {
       cwd: backendPath,
       env: {
         ...process.env,
@@ -47,7 +94,16 @@ function startPythonBackend(): void {
   }
 
   pythonProcess.stdout.on('data', (data: any) => {
-    console.log(`Python Backend: ${data}`)
+    const output = data.toString()
+    const readyLine = output.split('\n').find((line: string) => line.startsWith(BACKEND_READY_PREFIX))
+    if (readyLine) {
+      // 迁移或连接池失败时后端仍会启动，但 /health/ready 返回 503，请求可能失败
+      if (readyLine.includes('"ok": false')) {
+        console.error(`Python Backend started with failed required steps: ${readyLine}`)
+      }
+      resolveBackendReady()
+    }
+    console.log(`Python Backend: ${output}`)
   })
 
   pythonProcess.stderr.on('data', (data: any) => {
@@ -89,6 +145,8 @@ function setupIpcHandlers() {
     running: pythonProcess !== null && !pythonProcess.killed
   }))
 
+  ipcMain.handle('backend:whenReady', () => backendReady)
+
   ipcMain.handle('backend:restart', () => {
     if (pythonProcess) {
       pythonProcess.kill()
@@ -110,7 +168,9 @@ function createWindow(): void {
       nodeIntegration: false,
       contextIsolation: true,
       sandbox: false,
-      preload: join(__dirname, '../preload/index.js')
+      preload: join(__dirname, '../preload/index.js'),
+      // 告诉渲染进程后端的访问地址
+      additionalArguments: backendSocketPath ? [`--maoflow-api-base=${BACKEND_UDS_BASE_URL}`] : []
     }
   })
 
@@ -150,6 +210,11 @@ app.whenReady().then(() => {
   // 设置 IPC 处理器
   setupIpcHandlers()
 
+  // 将 maoflow:// 请求代理到后端套接字
+  if (backendSocketPath) {
+    handleBackendProtocol(backendSocketPath)
+  }
+
   // 启动 Python 后端
   startPythonBackend()
 
@@ -178,6 +243,9 @@ app.on('will-quit', () => {
   if (pythonProcess) {
     pythonProcess.kill()
   }
+  if (backendSocketPath) {
+    rmSync(backendSocketPath, { force: true })
+  }
 })
 
 // In this file you can include the rest of your app's specific main process
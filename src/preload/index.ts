@@ -1,6 +1,10 @@
 import { contextBridge, ipcRenderer } from 'electron'
 import { electronAPI } from '@electron-toolkit/preload'
 
+// 主进程通过 additionalArguments 传入后端地址（Unix 域套接字代理），未传入时使用 TCP
+const apiBaseArg = process.argv.find((arg) => arg.startsWith('--maoflow-api-base='))
+const apiBaseUrl = apiBaseArg ? apiBaseArg.split('=')[1] : undefined
+
 // 定义渲染进程可用的 API
 const api = {
   // 窗口控制
@@ -18,7 +22,9 @@ const api = {
 
   // 后端服务状态
   backend: {
+    baseUrl: apiBaseUrl,
     getStatus: () => ipcRenderer.invoke('backend:status'),
+    whenReady: () => ipcRenderer.invoke('backend:whenReady'),
     restart: () => ipcRenderer.invoke('backend:restart')
   }
 }
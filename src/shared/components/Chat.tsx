@@ -321,6 +321,11 @@ const Chat: React.FC<ChatProps> = ({ sessionId }) => {
                 setIsLoading(false);
                 break;
               }
+
+              // 耗时统计，不影响消息内容
+              if (data.type === 'stats') {
+                continue;
+              }
               
               // 更新当前消息类型
               if (data.type) {
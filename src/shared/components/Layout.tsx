@@ -12,7 +12,7 @@ import { Settings } from './Settings';
 import Chat from './Chat';
 import { User, ChatSession, UserSettings } from './types';
 import { getPlatformBridge } from '../platform';
-import { API_BASE_URL, API_PREFIX } from '../config';
+import { API_BASE_URL, API_PREFIX, waitForBackend } from '../config';
 
 const { Content, Sider } = AntLayout;
 
@@ -42,6 +42,8 @@ export const Layout: React.FC = () => {
 
   const initializeUser = async () => {
     try {
+      // 后端就绪后再请求，避免启动阶段的失败重试
+      await waitForBackend();
       const response = await fetch(`${API_BASE_URL}${API_PREFIX}/user/test-user`);
       if (response.ok) {
         const userData = await response.json();
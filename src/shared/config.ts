@@ -9,11 +9,15 @@ interface Config {
 
 const isDev = process.env.NODE_ENV === 'development';
 
+// Electron 下后端监听 Unix 域套接字时，由 preload 提供代理地址
+const electronBaseUrl: string | undefined =
+  typeof window !== 'undefined' ? (window as any).api?.backend?.baseUrl : undefined;
+
 const config: Config = {
   api: {
     host: isDev ? 'localhost' : 'localhost', // 在生产环境中可能需要修改
     port: 17349,
-    baseUrl: `http://localhost:17349`,
+    baseUrl: electronBaseUrl || `http://localhost:17349`,
     apiPrefix: '/api/v1'
   }
 };
@@ -22,4 +26,12 @@ export const API_BASE_URL = config.api.baseUrl;
 export const API_PREFIX = config.api.apiPrefix;
 export const API_PORT = config.api.port;
 
+// 等待后端完成迁移和预热；非 Electron 环境直接返回
+export const waitForBackend = async (): Promise<void> => {
+  const whenReady = typeof window !== 'undefined' ? (window as any).api?.backend?.whenReady : undefined;
+  if (whenReady) {
+    await whenReady();
+  }
+};
+
 export default config; 
\ No newline at end of file